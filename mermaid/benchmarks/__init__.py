@@ -0,0 +1,9 @@
+"""Performance benchmarks for the Mermaid app.
+
+    bench --site <site> execute mermaid.benchmarks.run \
+        --kwargs "{'corpus_size': 10000, 'output': 'results.json'}"
+
+See `mermaid.benchmarks.runner.run` for the options, including comparing a
+run against a stored baseline.
+"""
+from mermaid.benchmarks.runner import compare, run
@@ -0,0 +1,177 @@
+"""Synthetic diagram corpora for the benchmarks.
+
+Corpora are deterministic for a given seed. Diagram types are mixed roughly
+the way real workspaces use them (mostly flowcharts and sequence diagrams),
+and sizes follow a long-tailed distribution: most diagrams have a few dozen
+nodes, and about one in a thousand has several thousand.
+
+Corpus rows are bulk-inserted straight into `tabMermaid Diagram` with names
+starting with `CORPUS_PREFIX`, so loading a million of them takes minutes and
+`drop_corpus` can remove them again.
+"""
+import math
+import random
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+CORPUS_PREFIX = "mermaid-bench-"
+
+TYPE_WEIGHTS = {
+    "Flowchart": 45,
+    "Sequence Diagram": 20,
+    "Class Diagram": 12,
+    "State Diagram": 10,
+    "Entity Relationship Diagram": 8,
+    "Gantt Chart": 3,
+    "Pie Chart": 2,
+}
+WORDS = (
+    "order invoice customer payment shipment stock warehouse account ledger user session cache "
+    "queue worker report approval review draft publish archive sync import export retry"
+).split()
+HUGE_DIAGRAM_RATE = 0.001
+
+
+def pick_size(rng):
+    """Node count: log-normal around ~20 with a rare tail of thousands"""
+    if rng.random() < HUGE_DIAGRAM_RATE:
+        return rng.randint(2000, 5000)
+    return max(2, min(500, int(math.exp(rng.gauss(3.0, 0.8)))))
+
+
+def label(rng, words=2):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def flowchart(rng, size):
+    lines = [f"graph {rng.choice(['TD', 'LR'])}"]
+    for i in range(size):
+        lines.append(f"    N{i}[{label(rng)}]")
+    for i in range(1, size):
+        source = rng.randrange(i)
+        edge_label = f"|{rng.choice(WORDS)}|" if rng.random() < 0.3 else ""
+        lines.append(f"    N{source} -->{edge_label} N{i}")
+    return "\n".join(lines)
+
+
+def sequence_diagram(rng, size):
+    actors = [f"P{i}" for i in range(max(2, min(12, size // 4)))]
+    lines = ["sequenceDiagram"]
+    lines += [f"    participant {actor} as {label(rng, 1)}" for actor in actors]
+    for _ in range(size):
+        source, target = rng.sample(actors, 2)
+        lines.append(f"    {source}->>{target}: {label(rng, 3)}")
+    return "\n".join(lines)
+
+
+def class_diagram(rng, size):
+    lines = ["classDiagram"]
+    for i in range(size):
+        lines.append(f"    class C{i} {{\n        +{rng.choice(WORDS)}()\n        -{rng.choice(WORDS)} int\n    }}")
+        if i:
+            lines.append(f"    C{rng.randrange(i)} <|-- C{i}")
+    return "\n".join(lines)
+
+
+def state_diagram(rng, size):
+    lines = ["stateDiagram-v2", "    [*] --> S0"]
+    for i in range(1, size):
+        lines.append(f"    S{rng.randrange(i)} --> S{i}: {rng.choice(WORDS)}")
+    lines.append(f"    S{size - 1} --> [*]")
+    return "\n".join(lines)
+
+
+def er_diagram(rng, size):
+    lines = ["erDiagram"]
+    for i in range(1, size):
+        lines.append(f"    E{rng.randrange(i)} ||--o{{ E{i} : {rng.choice(WORDS)}")
+    return "\n".join(lines)
+
+
+def gantt_chart(rng, size):
+    lines = ["gantt", "    title " + label(rng, 3), "    dateFormat YYYY-MM-DD", "    section Work"]
+    for i in range(size):
+        lines.append(f"    {label(rng)} :t{i}, 2024-01-{(i % 28) + 1:02d}, {rng.randint(1, 10)}d")
+    return "\n".join(lines)
+
+
+def pie_chart(rng, size):
+    lines = ["pie title " + label(rng, 2)]
+    lines += [f'    "{label(rng)} {i}" : {rng.randint(1, 100)}' for i in range(min(size, 30))]
+    return "\n".join(lines)
+
+
+GENERATORS = {
+    "Flowchart": flowchart,
+    "Sequence Diagram": sequence_diagram,
+    "Class Diagram": class_diagram,
+    "State Diagram": state_diagram,
+    "Entity Relationship Diagram": er_diagram,
+    "Gantt Chart": gantt_chart,
+    "Pie Chart": pie_chart,
+}
+
+
+def generate_diagram(rng, diagram_type=None, size=None):
+    diagram_type = diagram_type or rng.choices(list(TYPE_WEIGHTS), weights=list(TYPE_WEIGHTS.values()))[0]
+    size = size or pick_size(rng)
+    return {
+        "title": label(rng, 3),
+        "diagram_type": diagram_type,
+        "description": label(rng, 8),
+        "mermaid_content": GENERATORS[diagram_type](rng, size),
+    }
+
+
+def iter_corpus(count, seed=42):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield generate_diagram(rng)
+
+
+def load_corpus(count, seed=42, batch_size=5000):
+    """Bulk insert `count` synthetic diagrams unless a corpus that size is already loaded"""
+    if frappe.db.count("Mermaid Diagram", {"name": ["like", f"{CORPUS_PREFIX}%"]}) == count:
+        return
+
+    drop_corpus()
+
+    fields = [
+        "name", "title", "diagram_type", "description", "mermaid_content", "content_version",
+        "is_public", "owner", "created_by", "modified_by", "creation", "modified",
+    ]
+    start = now_datetime()
+    rng = random.Random(seed + 1)
+    batch = []
+
+    for i, diagram in enumerate(iter_corpus(count, seed)):
+        # spread edits over the last year so date filters and ordering have work to do
+        timestamp = add_to_date(start, minutes=-rng.randint(0, 365 * 24 * 60))
+        batch.append((
+            f"{CORPUS_PREFIX}{i:07d}", diagram["title"], diagram["diagram_type"], diagram["description"],
+            diagram["mermaid_content"], 0, int(rng.random() < 0.1), "Administrator", "Administrator",
+            "Administrator", timestamp, timestamp,
+        ))
+        if len(batch) >= batch_size:
+            frappe.db.bulk_insert("Mermaid Diagram", fields, batch)
+            frappe.db.commit()
+            batch = []
+
+    if batch:
+        frappe.db.bulk_insert("Mermaid Diagram", fields, batch)
+    frappe.db.commit()
+
+    from mermaid.search import rebuild_index
+    from mermaid.stats import reconcile
+
+    reconcile()
+    rebuild_index()
+    frappe.db.commit()
+
+
+def drop_corpus():
+    for doctype in ("Mermaid Diagram Node", "Mermaid Diagram Edge", "Mermaid Diagram Revision"):
+        frappe.db.delete(doctype, {"diagram": ["like", f"{CORPUS_PREFIX}%"]})
+    frappe.db.delete("Mermaid Diagram", {"name": ["like", f"{CORPUS_PREFIX}%"]})
+    frappe.db.commit()
@@ -0,0 +1,198 @@
+"""Benchmark runner: times the Mermaid API against a synthetic corpus.
+
+Each benchmark is timed over `iterations` calls after a warm-up call, and
+reported as min/median/p95/mean milliseconds plus the number of database
+queries per call. Results are JSON so runs can be stored and diffed;
+`compare` flags every benchmark whose median got slower than the baseline
+by more than `threshold` (a fraction).
+"""
+import json
+import platform
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt, now
+
+from mermaid.benchmarks.corpus import CORPUS_PREFIX, generate_diagram, load_corpus
+
+DEFAULT_THRESHOLD = 0.2
+
+
+def get_corpus_names(limit=200):
+    return frappe.get_all(
+        "Mermaid Diagram",
+        filters={"name": ["like", f"{CORPUS_PREFIX}%"]},
+        pluck="name",
+        order_by="name asc",
+        limit=limit,
+    )
+
+
+def create_scratch_diagram(seed):
+    """A throwaway diagram for the benchmarks that write, so the corpus stays as loaded"""
+    diagram = generate_diagram(random.Random(seed), "Flowchart", 40)
+    doc = frappe.get_doc({"doctype": "Mermaid Diagram", **diagram, "title": "Benchmark scratch"})
+    doc.insert(ignore_permissions=True)
+    frappe.db.commit()
+    return doc
+
+
+def get_benchmarks(seed, scratch):
+    """(name, callable) pairs; each callable runs one operation
+
+    Write benchmarks only touch the `scratch` diagram.
+    """
+    from mermaid.doctype.mermaid_diagram import mermaid_diagram as api
+
+    rng = random.Random(seed)
+    samples = [generate_diagram(rng) for _ in range(50)]
+    samples.append(generate_diagram(rng, "Flowchart", 3000))
+    docs = [frappe.get_doc({"doctype": "Mermaid Diagram", **sample}) for sample in samples]
+    huge = docs[-1]
+
+    names = get_corpus_names()
+    search_terms = ["order", "payment retry", "warehouse stock", "nonexistentterm"]
+    first_page = api.get_diagram_list(limit=20, cursor="")
+
+    def cycle(items):
+        state = {"i": 0}
+
+        def next_item():
+            state["i"] += 1
+            return items[state["i"] % len(items)]
+
+        return next_item
+
+    next_doc, next_name, next_term = cycle(docs[:-1]), cycle(names), cycle(search_terms)
+    # alternate between two versions so every call is a change of the same size
+    next_content = cycle([scratch.mermaid_content, scratch.mermaid_content + "\n    %% edit"])
+
+    def update_content():
+        api.update_mermaid_content(scratch.name, next_content())
+
+    return [
+        ("validate_mermaid_syntax", lambda: next_doc().validate_mermaid_syntax()),
+        ("validate_mermaid_syntax_huge", huge.validate_mermaid_syntax),
+        ("detect_diagram_type", lambda: next_doc().detect_diagram_type()),
+        ("search_diagrams", lambda: api.search_diagrams(next_term(), limit=20)),
+        ("get_diagram_list_offset", lambda: api.get_diagram_list(limit=20, start=1000)),
+        ("get_diagram_list_cursor", lambda: api.get_diagram_list(limit=20, cursor=first_page["next_cursor"])),
+        ("get_diagram_stats", api.get_diagram_stats),
+        ("update_mermaid_content", update_content),
+        ("export_diagram_mermaid", lambda: api.export_diagram(next_name(), format="mermaid")),
+        ("export_diagram_svg", lambda: api.export_diagram(next_name(), format="svg")),
+    ]
+
+
+def time_benchmark(fn, iterations):
+    fn()  # warm-up: caches, imports, lazily started render workers
+
+    durations = []
+    with count_queries() as queries:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "min_ms": round(durations[0], 3),
+        "median_ms": round(statistics.median(durations), 3),
+        "p95_ms": round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(durations), 3),
+        "queries_per_call": round(queries["count"] / iterations, 2),
+    }
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run through `frappe.db.sql` inside the block"""
+    counter = {"count": 0}
+    sql = frappe.db.sql
+
+    def counting_sql(*args, **kwargs):
+        counter["count"] += 1
+        return sql(*args, **kwargs)
+
+    frappe.db.sql = counting_sql
+    try:
+        yield counter
+    finally:
+        frappe.db.sql = sql
+
+
+def run(corpus_size=10000, seed=42, iterations=50, only=None, output=None, baseline=None, threshold=DEFAULT_THRESHOLD):
+    """Load (or reuse) a corpus, run the benchmarks and return the results
+
+    `only` is a comma separated list of benchmark names. With `output` the
+    results are written there as JSON; with `baseline` (a results file) they
+    are compared and the regressions are included under `regressions`.
+    """
+    corpus_size, iterations = cint(corpus_size), cint(iterations)
+    load_corpus(corpus_size, seed=cint(seed))
+
+    selected = set(only.split(",")) if only else None
+    results = {}
+    scratch = create_scratch_diagram(cint(seed))
+    try:
+        for name, fn in get_benchmarks(cint(seed), scratch):
+            if selected and name not in selected:
+                continue
+            try:
+                results[name] = time_benchmark(fn, iterations)
+            except Exception as e:
+                results[name] = {"error": repr(e)}
+            frappe.db.rollback()
+            print(f"{name}: {results[name]}")
+    finally:
+        # also drops what the update benchmark left in the collaborative editing engine
+        frappe.delete_doc("Mermaid Diagram", scratch.name, ignore_permissions=True, force=True)
+        frappe.db.commit()
+
+    report = {
+        "meta": {
+            "timestamp": now(),
+            "corpus_size": corpus_size,
+            "seed": cint(seed),
+            "iterations": iterations,
+            "python": platform.python_version(),
+            "frappe": frappe.__version__,
+            "db": frappe.db.db_type,
+        },
+        "results": results,
+    }
+
+    if baseline:
+        with open(baseline) as f:
+            report["regressions"] = compare(results, json.load(f)["results"], threshold)
+        for regression in report["regressions"]:
+            print(f"REGRESSION {regression['name']}: {regression['baseline_ms']}ms -> {regression['median_ms']}ms")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return report
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Benchmarks whose median is more than `threshold` slower than in `baseline`"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name) or {}
+        if "median_ms" not in result or not before.get("median_ms"):
+            continue
+
+        change = result["median_ms"] / before["median_ms"] - 1
+        if change > flt(threshold):
+            regressions.append({
+                "name": name,
+                "baseline_ms": before["median_ms"],
+                "median_ms": result["median_ms"],
+                "change": round(change, 3),
+            })
+    return regressions
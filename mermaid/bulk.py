@@ -0,0 +1,208 @@
+"""Bulk export and import of diagrams as zip archives.
+
+An archive holds `diagrams/<name>.mmd`, `diagrams/<name>.svg` (when an SVG has
+been rendered) and a `manifest.json` describing every diagram. Export writes
+the archive to a temporary file (spilling to disk once it is large) within the
+request and sends that; import reads it entry by entry and inserts in chunks,
+committing after each one.
+
+Imported SVGs are ignored: they are untrusted markup, and every imported
+diagram is rendered again from its source after insert. Entries larger than
+`MAX_ENTRY_SIZE` uncompressed are rejected, so a small archive can't expand
+into gigabytes.
+"""
+import json
+import os
+import re
+import tempfile
+import zipfile
+
+import frappe
+from frappe.utils import cint
+from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_SPOOL_SIZE = 16 * 1024 * 1024
+IMPORT_CHUNK_SIZE = 200
+MAX_ENTRY_SIZE = 5 * 1024 * 1024
+MAX_MANIFEST_SIZE = 20 * 1024 * 1024
+
+EXPORT_FIELDS = ["name", "title", "diagram_type", "description", "is_public", "mermaid_content", "svg_hash"]
+
+
+@frappe.whitelist()
+def export_diagrams(filters=None):
+    """Every readable diagram matching `filters` as a zip archive"""
+    filters = frappe.parse_json(filters) if filters else {}
+
+    archive_file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)
+    write_archive(archive_file, filters)
+    archive_file.seek(0)
+
+    return Response(
+        wrap_file(frappe.request.environ, archive_file),
+        mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="mermaid-diagrams.zip"'},
+        direct_passthrough=True,
+    )
+
+
+def write_archive(fileobj, filters):
+    from mermaid.svg_store import load_svg
+
+    manifest = []
+
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for diagram in iter_diagrams(filters):
+            entry = {
+                "name": diagram.name,
+                "title": diagram.title,
+                "diagram_type": diagram.diagram_type,
+                "description": diagram.description,
+                "is_public": cint(diagram.is_public),
+                "source": f"diagrams/{diagram.name}.mmd",
+            }
+            archive.writestr(entry["source"], diagram.mermaid_content or "")
+
+            svg = load_svg(diagram.svg_hash)
+            if svg:
+                entry["svg"] = f"diagrams/{diagram.name}.svg"
+                archive.writestr(entry["svg"], svg)
+
+            manifest.append(entry)
+
+        archive.writestr("manifest.json", json.dumps({"version": 1, "diagrams": manifest}, indent=1))
+
+
+def iter_diagrams(filters):
+    """Yield diagrams in name order, one batch in memory at a time"""
+    from mermaid.doctype.mermaid_diagram.mermaid_diagram import normalize_filters
+
+    filters = normalize_filters(filters)
+    last_name = None
+    while True:
+        # the cursor is a condition of its own, next to any the caller has on name
+        batch_filters = [*filters, ["Mermaid Diagram", "name", ">", last_name]] if last_name else filters
+
+        batch = frappe.get_list(
+            "Mermaid Diagram",
+            fields=EXPORT_FIELDS,
+            filters=batch_filters,
+            order_by="name asc",
+            limit=EXPORT_BATCH_SIZE,
+        )
+        yield from batch
+
+        if len(batch) < EXPORT_BATCH_SIZE:
+            break
+        last_name = batch[-1].name
+
+
+@frappe.whitelist(methods=["POST"])
+def import_diagrams():
+    """Import diagrams from an uploaded archive (form field `file`)"""
+    upload = frappe.request.files.get("file")
+    if not upload:
+        frappe.throw("Attach an archive exported from Mermaid")
+
+    frappe.has_permission("Mermaid Diagram", "create", throw=True)
+
+    try:
+        archive = zipfile.ZipFile(upload.stream)
+    except zipfile.BadZipFile:
+        frappe.throw("The uploaded file is not a zip archive")
+
+    imported, errors = [], []
+    frappe.flags.in_import = True
+    try:
+        with archive:
+            chunk = []
+            for entry in iter_manifest(archive):
+                chunk.append(entry)
+                if len(chunk) >= IMPORT_CHUNK_SIZE:
+                    import_chunk(archive, chunk, imported, errors)
+                    chunk = []
+            if chunk:
+                import_chunk(archive, chunk, imported, errors)
+    finally:
+        frappe.flags.in_import = False
+
+    return {"imported": len(imported), "names": imported, "errors": errors}
+
+
+def iter_manifest(archive):
+    """Entries from manifest.json, or one per .mmd file for archives without one"""
+    if "manifest.json" in archive.namelist():
+        yield from load_manifest(read_entry(archive, "manifest.json", MAX_MANIFEST_SIZE))
+        return
+
+    for filename in archive.namelist():
+        if filename.endswith(".mmd"):
+            title = os.path.splitext(os.path.basename(filename))[0]
+            yield {"title": title, "source": filename}
+
+
+def load_manifest(data):
+    """The diagram entries of a manifest, checked before anything is imported"""
+    try:
+        manifest = json.loads(data)
+    except ValueError:
+        frappe.throw("manifest.json is not valid JSON")
+
+    diagrams = manifest.get("diagrams", []) if isinstance(manifest, dict) else None
+    if not isinstance(diagrams, list) or not all(isinstance(entry, dict) for entry in diagrams):
+        frappe.throw("manifest.json must have a list of diagram entries under \"diagrams\"")
+
+    return diagrams
+
+
+def import_chunk(archive, chunk, imported, errors):
+    """Validate and insert one chunk of entries, then commit it"""
+    for entry in chunk:
+        frappe.db.savepoint("mermaid_import")
+        try:
+            doc = build_diagram(archive, entry)
+            doc.insert()
+        except Exception as e:
+            frappe.db.rollback(save_point="mermaid_import")
+            frappe.clear_messages()
+            errors.append({"source": entry.get("source"), "error": str(e)})
+        else:
+            imported.append(doc.name)
+
+    frappe.db.commit()
+
+
+def read_entry(archive, filename, limit=MAX_ENTRY_SIZE):
+    """Bytes of `filename`, refusing entries that expand beyond `limit`"""
+    try:
+        info = archive.getinfo(filename)
+    except KeyError:
+        raise frappe.ValidationError(f"{filename} is missing from the archive")
+
+    if info.file_size > limit:
+        raise frappe.ValidationError(f"{filename} is larger than {limit // (1024 * 1024)} MB")
+
+    # the reader stops at the declared size, so a lying header can't get past the limit
+    return archive.read(info)
+
+
+def build_diagram(archive, entry):
+    source = entry.get("source")
+    if not source or not re.match(r"^[\w./-]+\.mmd$", source):
+        raise frappe.ValidationError("Entry has no valid source file")
+
+    content = read_entry(archive, source).decode("utf-8")
+    if not content.strip():
+        raise frappe.ValidationError("Mermaid content cannot be empty")
+
+    doc = frappe.new_doc("Mermaid Diagram")
+    doc.title = entry.get("title") or os.path.splitext(os.path.basename(source))[0]
+    doc.diagram_type = entry.get("diagram_type")
+    doc.description = entry.get("description")
+    doc.is_public = cint(entry.get("is_public"))
+    doc.mermaid_content = content
+    # the archive's SVG is not trusted; on_update queues a fresh render
+
+    return doc
@@ -0,0 +1,353 @@
+"""Collaborative editing of diagram content.
+
+Editors send operations (see `mermaid.ot`) made against a sequence number.
+The engine keeps, per diagram, the merged content and a log of the last
+`MAX_LOG` operations in redis. An incoming operation is transformed against
+everything applied since its sequence number, applied, appended to the log and
+broadcast as `mermaid_collab_op` to the diagram's room; the ack carries the
+operations the sender missed. Nothing touches the database on that path.
+
+Merged content is written to the diagram with a normal save (so validation,
+history, search, stats and rendering all run) when `flush_dirty` finds it due
+(see `mermaid.drafts` for the policy and the on-disk journal), on an explicit
+save, and right away once `FLUSH_AFTER_OPS` operations have piled up. Saves that
+don't come from the engine are fed back into it as operations, so the log
+stays the single source of truth while a diagram is being edited.
+
+`epoch` changes whenever the engine state is rebuilt from the database (for
+example after it expired); clients holding another epoch resync.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, random_string
+
+from mermaid import ot
+from mermaid.delta import make_delta
+from mermaid.drafts import clear_journal, get_journaled_names, is_due, read_journal, write_journal
+from mermaid.metrics import instrument
+from mermaid.realtime import has_subscribers, publish
+
+MAX_LOG = 500
+FLUSH_AFTER_OPS = 200
+# how long the state of a fully persisted diagram is kept around
+STATE_TTL = 24 * 60 * 60
+DIRTY_KEY = "mermaid_collab:dirty"
+
+
+def _key(name, part):
+    return f"mermaid_collab:{name}:{part}"
+
+
+@contextmanager
+def diagram_lock(name):
+    cache = frappe.cache()
+    lock = cache.lock(cache.make_key(_key(name, "lock")), timeout=10, blocking_timeout=5)
+    if not lock.acquire():
+        frappe.throw("The diagram is busy, please try again", frappe.DocumentLockedError)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def read_state(name):
+    cache = frappe.cache()
+    raw = cache.get(cache.make_key(_key(name, "state")))
+    return json.loads(raw) if raw else None
+
+
+def write_state(name, state, ttl=None):
+    cache = frappe.cache()
+    cache.set(cache.make_key(_key(name, "state")), json.dumps(state), ex=ttl)
+
+
+def load_state(name):
+    """Engine state of `name`, created from the stored content if there is none; call under the lock"""
+    state = read_state(name)
+    if state:
+        return state
+
+    content = frappe.db.get_value("Mermaid Diagram", name, "mermaid_content")
+    if content is None and not frappe.db.exists("Mermaid Diagram", name):
+        frappe.throw(f"Mermaid Diagram {name} not found", frappe.DoesNotExistError)
+
+    state = {"content": content or "", "seq": 0, "epoch": random_string(8), "log_start": 0, "persisted_seq": 0}
+    frappe.cache().delete_value(_key(name, "ops"))
+
+    journal = read_journal(name)
+    if journal and journal["content"] != state["content"]:
+        # redis lost a draft that was never saved; pick it up from the journal
+        state.update(content=journal["content"], user=journal.get("user"), persisted_seq=-1)
+        write_state(name, state)
+        cache = frappe.cache()
+        cache.zadd(cache.make_key(DIRTY_KEY), {name: time.time()}, nx=True)
+    else:
+        write_state(name, state, ttl=STATE_TTL)
+    return state
+
+
+def get_log(name, state, since):
+    """Log entries after sequence number `since`"""
+    entries = frappe.cache().lrange(_key(name, "ops"), since - state["log_start"], -1)
+    return [json.loads(entry) for entry in entries]
+
+
+def append(name, state, op, client_id=None):
+    """Apply an operation made against the current content; call under the lock"""
+    state["content"] = ot.apply(state["content"], op)
+    state["seq"] += 1
+    state["user"] = frappe.session.user
+    state["last_op"] = time.time()
+
+    entry = {"seq": state["seq"], "op": op, "client_id": client_id}
+    cache = frappe.cache()
+    log_key = _key(name, "ops")
+    cache.rpush(log_key, json.dumps(entry))
+    overflow = cache.llen(log_key) - MAX_LOG
+    if overflow > 0:
+        cache.ltrim(log_key, overflow, -1)
+        state["log_start"] += overflow
+
+    # dirty state must not expire before it is persisted
+    write_state(name, state)
+    write_journal(name, state)
+    cache.zadd(cache.make_key(DIRTY_KEY), {name: time.time()}, nx=True)
+    return entry
+
+
+def after_append(name, state, entry):
+    if has_subscribers(name):
+        publish(name, "mermaid_collab_op", {"name": name, "epoch": state["epoch"], **entry})
+
+    if state["seq"] - state["persisted_seq"] >= FLUSH_AFTER_OPS:
+        frappe.enqueue(
+            flush_diagram,
+            queue="short",
+            job_id=f"mermaid_collab_flush::{frappe.local.site}::{name}",
+            deduplicate=True,
+            name=name,
+        )
+
+
+def resync(state):
+    return {"status": "resync", "content": state["content"], "seq": state["seq"], "epoch": state["epoch"]}
+
+
+def submit(name, seq, op=None, delta=None, client_id=None, epoch=None):
+    """Merge an operation (or a splice `delta`) made against sequence number `seq`
+
+    Returns an ack with the new sequence number and every log entry after
+    `seq` (the sender's own last), or a resync when `seq` can't be served.
+    """
+    seq = cint(seq)
+    with diagram_lock(name):
+        state = load_state(name)
+        if (epoch and epoch != state["epoch"]) or not state["log_start"] <= seq <= state["seq"]:
+            return resync(state)
+
+        missed = get_log(name, state, seq)
+        try:
+            if delta is not None:
+                # the splice was made against the content as of `seq`
+                length = ot.text_length(state["content"]) - sum(
+                    ot.target_length(entry["op"]) - ot.base_length(entry["op"]) for entry in missed
+                )
+                op = ot.from_delta(length, delta)
+            else:
+                ot.check(op)
+
+            for entry in missed:
+                # earlier operations win ties, the same way clients transform
+                op = ot.transform(entry["op"], op)[1]
+            entry = append(name, state, op, client_id)
+        except ValueError:
+            frappe.throw("Operation does not apply to the diagram content")
+
+    after_append(name, state, entry)
+    return {"status": "ack", "seq": state["seq"], "epoch": state["epoch"], "ops": missed + [entry]}
+
+
+def replace_content(name, content, client_id=None):
+    """Make `content` the current content, as an operation on whatever is there now"""
+    if not (content or "").strip():
+        # the diagram can't be saved without content, so the draft would never flush
+        frappe.throw("Mermaid content cannot be empty")
+
+    with diagram_lock(name):
+        state = load_state(name)
+        delta = make_delta(state["content"], content)
+        if not delta:
+            return {"status": "ack", "seq": state["seq"], "epoch": state["epoch"], "ops": []}
+        entry = append(name, state, ot.from_delta(ot.text_length(state["content"]), delta), client_id)
+
+    after_append(name, state, entry)
+    return {"status": "ack", "seq": state["seq"], "epoch": state["epoch"], "ops": [entry]}
+
+
+@frappe.whitelist()
+def get_state(name):
+    """Current merged content to start editing from"""
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    state = read_state(name)
+    if not state:
+        with diagram_lock(name):
+            state = load_state(name)
+
+    return {"content": state["content"], "seq": state["seq"], "epoch": state["epoch"]}
+
+
+@frappe.whitelist()
+def get_ops(name, since, epoch=None):
+    """Log entries after `since`, for clients that noticed a gap"""
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    since = cint(since)
+    state = read_state(name)
+    if not state or (epoch and epoch != state["epoch"]) or not state["log_start"] <= since <= state["seq"]:
+        with diagram_lock(name):
+            return resync(load_state(name))
+
+    return {"status": "ok", "seq": state["seq"], "epoch": state["epoch"], "ops": get_log(name, state, since)}
+
+
+@frappe.whitelist(methods=["POST"])
+@instrument
+def submit_op(name, seq, op, client_id=None, epoch=None):
+    frappe.has_permission("Mermaid Diagram", "write", name, throw=True)
+
+    return submit(name, seq, op=frappe.parse_json(op), client_id=client_id, epoch=epoch)
+
+
+def on_diagram_update(doc, method=None):
+    """Feed saves that didn't come from the engine into it
+
+    The save is a change against the stored content, which is the engine's
+    content as of `persisted_seq`, so it is merged like an operation made at
+    that sequence number: edits made in the session since are kept.
+    """
+    if doc.flags.from_collab or not doc.has_value_changed("mermaid_content"):
+        return
+
+    name, content = doc.name, doc.mermaid_content or ""
+    before = doc.get_doc_before_save()
+    delta = make_delta((before.mermaid_content or "") if before else "", content)
+
+    state = read_state(name)
+    if state and not state["log_start"] <= state["persisted_seq"]:
+        # the operations since the stored content are gone, so the save can't be merged
+        frappe.throw("The diagram has collaborative edits that aren't saved yet; reload it and try again")
+
+    def push():
+        # only diagrams being edited have state; the rest start from the database
+        state = read_state(name)
+        if not state:
+            # a journal left behind by a lost state is older than this save
+            clear_journal(name)
+            return
+
+        result = submit(name, state["persisted_seq"], delta=delta, epoch=state["epoch"])
+        if result["status"] == "resync":
+            # the session moved on in the meantime; the save is committed, so it wins
+            replace_content(name, content)
+
+    frappe.db.after_commit.add(push)
+
+
+def on_diagram_trash(doc, method=None):
+    cache = frappe.cache()
+    cache.delete(cache.make_key(_key(doc.name, "state")))
+    cache.delete_value(_key(doc.name, "ops"))
+    cache.zrem(cache.make_key(DIRTY_KEY), doc.name)
+    clear_journal(doc.name)
+
+
+def flush_dirty():
+    """Save drafts that are idle or have been unsaved too long (scheduled every minute)"""
+    cache = frappe.cache()
+    dirty = {frappe.safe_decode(name): since for name, since in cache.zrange(cache.make_key(DIRTY_KEY), 0, -1, withscores=True)}
+
+    # journals whose redis state is gone (lost in a redis restart) are saved as well
+    for name in get_journaled_names():
+        if name not in dirty and not read_state(name) and frappe.db.exists("Mermaid Diagram", name):
+            with diagram_lock(name):
+                load_state(name)
+            dirty[name] = 0
+
+    for name, since in dirty.items():
+        state = read_state(name)
+        if state and not is_due(state, since):
+            continue
+        try:
+            flush_diagram(name)
+        except frappe.DocumentLockedError:
+            frappe.db.rollback()
+        except frappe.ValidationError:
+            # the draft can't be saved as it is (e.g. it is empty); retrying
+            # every minute won't change that, the next edit marks it dirty again
+            frappe.db.rollback()
+            frappe.log_error(title=f"Mermaid collaborative flush failed for {name}")
+            drop_dirty(name, state["seq"] if state else None)
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(title=f"Mermaid collaborative flush failed for {name}")
+
+
+def drop_dirty(name, seq):
+    """Stop retrying a draft that failed to save, unless it was edited since (state at `seq`)"""
+    cache = frappe.cache()
+    try:
+        with diagram_lock(name):
+            state = read_state(name)
+            if state and seq is not None and state["seq"] != seq:
+                return
+            cache.zrem(cache.make_key(DIRTY_KEY), name)
+            clear_journal(name)
+    except frappe.DocumentLockedError:
+        pass
+
+
+def flush_diagram(name, values=None, as_last_editor=True):
+    """Save the merged content (and any other `values`) to the diagram"""
+    cache = frappe.cache()
+    state = read_state(name)
+    if not state or not frappe.db.exists("Mermaid Diagram", name):
+        cache.zrem(cache.make_key(DIRTY_KEY), name)
+        clear_journal(name)
+        return
+
+    seq = state["seq"]
+    if seq > state["persisted_seq"] or values:
+        doc = frappe.get_doc("Mermaid Diagram", name)
+        doc.update(values or {})
+        doc.flags.from_collab = True
+
+        if values or doc.mermaid_content != state["content"]:
+            doc.mermaid_content = state["content"]
+            if as_last_editor:
+                # attribute the save to whoever made the last edit
+                user = frappe.session.user
+                frappe.set_user(state.get("user") or user)
+                try:
+                    doc.save(ignore_permissions=True)
+                finally:
+                    frappe.set_user(user)
+            else:
+                doc.save()
+
+        frappe.db.commit()
+
+    with diagram_lock(name):
+        state = read_state(name)
+        if not state:
+            return
+        state["persisted_seq"] = max(state["persisted_seq"], seq)
+        if state["seq"] == state["persisted_seq"]:
+            cache.zrem(cache.make_key(DIRTY_KEY), name)
+            write_state(name, state, ttl=STATE_TTL)
+            clear_journal(name)
+        else:
+            write_state(name, state)
@@ -0,0 +1,100 @@
+"""Compact text deltas exchanged between editors and the server.
+
+A delta is a single splice ``[position, delete_count, insert_text]``. Positions
+and counts are measured in UTF-16 code units so that they mean the same thing
+to the browser (JavaScript strings) and to the server.
+
+Stored revision history uses line deltas instead (`make_line_delta`).
+"""
+import difflib
+
+
+def _units(text):
+    return (text or "").encode("utf-16-le")
+
+
+def _text(units):
+    return units.decode("utf-16-le")
+
+
+def _is_low_surrogate(units, index):
+    """Whether code unit `index` is the second half of a surrogate pair"""
+    if index * 2 + 1 >= len(units):
+        return False
+    return 0xDC <= units[index * 2 + 1] <= 0xDF
+
+
+def make_delta(old, new):
+    """Smallest single splice turning `old` into `new`, or None if they are equal"""
+    if old == new:
+        return None
+
+    old_units, new_units = _units(old), _units(new)
+    old_len, new_len = len(old_units) // 2, len(new_units) // 2
+
+    prefix = 0
+    limit = min(old_len, new_len)
+    while prefix < limit and old_units[prefix * 2:prefix * 2 + 2] == new_units[prefix * 2:prefix * 2 + 2]:
+        prefix += 1
+    # never cut a surrogate pair in half
+    if prefix and _is_low_surrogate(old_units, prefix):
+        prefix -= 1
+
+    suffix = 0
+    limit = min(old_len, new_len) - prefix
+    while suffix < limit and (
+        old_units[(old_len - suffix - 1) * 2:(old_len - suffix) * 2]
+        == new_units[(new_len - suffix - 1) * 2:(new_len - suffix) * 2]
+    ):
+        suffix += 1
+    if suffix and _is_low_surrogate(old_units, old_len - suffix):
+        suffix -= 1
+
+    inserted = _text(new_units[prefix * 2:(new_len - suffix) * 2])
+    return [prefix, old_len - prefix - suffix, inserted]
+
+
+def apply_delta(text, delta):
+    """Apply a delta produced by `make_delta` (or by the browser) to `text`"""
+    if not delta:
+        return text
+
+    position, delete_count, inserted = delta
+    units = _units(text)
+    length = len(units) // 2
+
+    if not (0 <= position <= length and 0 <= delete_count <= length - position):
+        raise ValueError("Delta does not apply to this text")
+
+    return _text(units[:position * 2]) + (inserted or "") + _text(units[(position + delete_count) * 2:])
+
+
+def make_line_delta(old, new):
+    """Line-level diff of `old` to `new` as `[[start, end, [lines]], ...]`
+
+    Each hunk replaces old lines `start:end` with `lines` (line endings kept).
+    Used for stored revision history, where edits are compared across whole
+    saves rather than keystrokes and a single splice would be too coarse.
+    """
+    old_lines = (old or "").splitlines(keepends=True)
+    new_lines = (new or "").splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+
+    return [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_line_delta(text, delta):
+    """Apply a delta produced by `make_line_delta` to `text`"""
+    lines = (text or "").splitlines(keepends=True)
+
+    # hunks refer to the original line numbers, so apply them back to front
+    for start, end, inserted in reversed(delta or []):
+        if not (0 <= start <= end <= len(lines)):
+            raise ValueError("Line delta does not apply to this text")
+        lines[start:end] = inserted
+
+    return "".join(lines)
@@ -22,49 +22,363 @@ frappe.ui.form.on('Mermaid Diagram', {
         // Auto-save and re-render on content change
         if (frm.doc.mermaid_content) {
             debounced_render(frm);
-            debounced_save(frm);
+            debounced_sync(frm);
         }
-    },
+    }
+});
+
+function setup_realtime_sync(frm) {
+    if (!frm.doc.name || frm.is_new()) return;
+    
+    // Collaborative editing state (see mermaid/collab.py):
+    // `synced` is the server content at `seq`, `inflight` the one operation
+    // sent and not yet acknowledged. Edits made since are not tracked
+    // separately: they are the difference between the editor and
+    // synced + inflight, and are sent once the inflight operation is acked.
+    frm.mermaid_collab = {
+        client_id: frappe.utils.get_random(12),
+        synced: null,
+        seq: 0,
+        epoch: null,
+        inflight: null
+    };
+    
+    // Re-subscribing straight away, so only drop the subscription of another diagram
+    const previous = frm.mermaid_realtime;
+    teardown_realtime_sync(frm, previous && previous.name === frm.doc.name);
+    
+    // The server skips broadcasting to diagrams nobody has subscribed to
+    const name = frm.doc.name;
+    const subscribe = () => frappe.call({
+        method: 'mermaid.realtime.subscribe_diagram',
+        args: { name },
+        type: 'POST'
+    });
+    const realtime = frm.mermaid_realtime = { name, interval: null, handlers: {} };
+    subscribe().then(r => {
+        // Leaving the form before the first subscription returned
+        if (frm.mermaid_realtime !== realtime) return;
+        realtime.interval = setInterval(subscribe, r.message.ttl * 500);
+    });
+    
+    frappe.call({
+        method: 'mermaid.collab.get_state',
+        args: { name: frm.doc.name }
+    }).then(r => reset_collab(frm, r.message));
+    
+    realtime.handlers.mermaid_collab_op = function(data) {
+        if (data.name !== frm.doc.name || data.epoch !== frm.mermaid_collab.epoch) return;
+        receive_ops(frm, [data]);
+    };
+    
+    // Saves and renders: content arrives as operations, only the SVG and the
+    // timestamp are new here. The engine saves in the background, so without
+    // the new `modified` a desk Save would fail with a timestamp mismatch.
+    realtime.handlers.mermaid_diagram_updated = function(data) {
+        if (data.name !== frm.doc.name) return;
+        if (data.modified) frm.doc.modified = data.modified;
+        update_rendered_svg(frm, data.svg_hash);
+    };
     
-    onload: function(frm) {
-        // Setup mermaid configuration
-        if (typeof mermaid !== 'undefined') {
-            mermaid.initialize({
-                startOnLoad: false,
-                theme: 'default',
-                securityLevel: 'loose',
-                flowchart: {
-                    useMaxWidth: true,
-                    htmlLabels: true
-                }
+    for (const [event, handler] of Object.entries(realtime.handlers)) {
+        frappe.realtime.on(event, handler);
+    }
+    
+    // The form is hidden when navigating away; refresh sets it up again
+    if (!frm.mermaid_hide_bound) {
+        frm.mermaid_hide_bound = true;
+        $(frm.wrapper).on('hide', () => teardown_realtime_sync(frm));
+    }
+}
+
+function teardown_realtime_sync(frm, keep_subscription) {
+    const realtime = frm.mermaid_realtime;
+    if (!realtime) return;
+    frm.mermaid_realtime = null;
+    
+    // Only our own listeners: other forms and pages may listen to the same events
+    for (const [event, handler] of Object.entries(realtime.handlers)) {
+        frappe.realtime.off(event, handler);
+    }
+    clearInterval(realtime.interval);
+    if (keep_subscription) return;
+    frappe.call({
+        method: 'mermaid.realtime.unsubscribe_diagram',
+        args: { name: realtime.name },
+        type: 'POST'
+    });
+}
+
+function reset_collab(frm, state) {
+    const collab = frm.mermaid_collab;
+    const editor = frm.doc.mermaid_content || '';
+    const joined = collab.synced !== null;
+    const previous = collab.synced;
+    const local_base = joined ? apply_op(collab.synced, collab.inflight) : editor;
+    
+    collab.synced = state.content;
+    collab.seq = state.seq;
+    collab.epoch = state.epoch;
+    collab.inflight = null;
+    
+    // Unsent edits survive a resync only if they were made against this content
+    if (editor !== state.content && local_base !== state.content) {
+        // Anything typed since the last acknowledged content (sent or not) is lost
+        if (joined && editor !== previous) {
+            frappe.show_alert({
+                message: __('Diagram was changed elsewhere; your unsent edits were replaced'),
+                indicator: 'orange'
             });
         }
+        set_editor_content(frm, state.content);
     }
-});
+    
+    sync_mermaid_content(frm);
+}
 
-function setup_realtime_sync(frm) {
-    if (!frm.doc.name) return;
-    
-    // Join the document room for real-time updates
-    frappe.realtime.on(`mermaid_diagram_updated`, function(data) {
-        if (data.name === frm.doc.name && data.modified !== frm.doc.modified) {
-            // Update content without triggering events
-            frm.set_value('mermaid_content', data.content, false, true);
-            frm.set_value('rendered_svg', data.rendered_svg, false, true);
+function receive_ops(frm, entries) {
+    const collab = frm.mermaid_collab;
+    
+    for (const entry of entries) {
+        if (entry.seq <= collab.seq) continue;
+        
+        if (entry.seq > collab.seq + 1) {
+            // Missed a broadcast: fetch everything after what we have
+            fetch_missed_ops(frm);
+            return;
+        }
+        
+        if (entry.client_id === collab.client_id && collab.inflight) {
+            collab.synced = apply_op(collab.synced, collab.inflight);
+            collab.inflight = null;
+        } else {
+            const editor = frm.doc.mermaid_content || '';
+            const local_base = apply_op(collab.synced, collab.inflight);
+            let remote = entry.op;
             
-            // Re-render preview
-            render_mermaid_preview(frm);
+            // Server operations win ties, the same way the server transforms ours
+            if (collab.inflight) {
+                [remote, collab.inflight] = transform_ops(remote, collab.inflight);
+            }
+            collab.synced = apply_op(collab.synced, entry.op);
             
-            frappe.show_alert({
-                message: __('Diagram updated by another user'),
-                indicator: 'blue'
-            });
+            const buffer = op_from_delta(local_base.length, make_delta(local_base, editor));
+            remote = transform_ops(remote, buffer)[0];
+            set_editor_content(frm, apply_op(editor, remote));
+        }
+        collab.seq = entry.seq;
+    }
+    
+    sync_mermaid_content(frm);
+}
+
+function fetch_missed_ops(frm) {
+    const collab = frm.mermaid_collab;
+    frappe.call({
+        method: 'mermaid.collab.get_ops',
+        args: { name: frm.doc.name, since: collab.seq, epoch: collab.epoch }
+    }).then(r => {
+        if (r.message.status === 'resync') {
+            reset_collab(frm, r.message);
+        } else {
+            receive_ops(frm, r.message.ops);
+        }
+    });
+}
+
+function set_editor_content(frm, content) {
+    if (content === frm.doc.mermaid_content) return;
+    
+    // Update content without triggering events
+    frm.set_value('mermaid_content', content, false, true);
+    render_mermaid_preview(frm);
+}
+
+function op_from_delta(length, delta) {
+    const op = [];
+    if (!delta) {
+        push_component(op, length);
+        return op;
+    }
+    const [position, delete_count, inserted] = delta;
+    push_component(op, position);
+    push_component(op, -delete_count);
+    push_component(op, inserted || '');
+    push_component(op, length - position - delete_count);
+    return op;
+}
+
+function push_component(op, component) {
+    if (!component) return;
+    const last = op[op.length - 1];
+    if (typeof component === 'string' && typeof last === 'string') {
+        op[op.length - 1] = last + component;
+    } else if (typeof component === 'number' && typeof last === 'number' && (component > 0) === (last > 0)) {
+        op[op.length - 1] = last + component;
+    } else {
+        op.push(component);
+    }
+}
+
+function apply_op(text, op) {
+    if (!op) return text;
+    
+    let result = '';
+    let position = 0;
+    for (const component of op) {
+        if (typeof component === 'string') {
+            result += component;
+        } else if (component > 0) {
+            result += text.slice(position, position + component);
+            position += component;
+        } else {
+            position -= component;
+        }
+    }
+    return result;
+}
+
+function transform_ops(a, b) {
+    // Same algorithm as mermaid/ot.py: a + b' == b + a', a's inserts first on ties
+    const a_prime = [], b_prime = [];
+    let i = 0, j = 0;
+    let op1 = a[i++], op2 = b[j++];
+    
+    while (op1 !== undefined || op2 !== undefined) {
+        if (typeof op1 === 'string') {
+            push_component(a_prime, op1);
+            push_component(b_prime, op1.length);
+            op1 = a[i++];
+            continue;
+        }
+        if (typeof op2 === 'string') {
+            push_component(a_prime, op2.length);
+            push_component(b_prime, op2);
+            op2 = b[j++];
+            continue;
         }
+        if (op1 === undefined || op2 === undefined) {
+            throw new Error('Operations do not apply to the same text');
+        }
+        
+        let size;
+        if (op1 > 0 && op2 > 0) {
+            size = Math.min(op1, op2);
+            push_component(a_prime, size);
+            push_component(b_prime, size);
+        } else if (op1 < 0 && op2 < 0) {
+            size = Math.min(-op1, -op2);
+        } else if (op1 < 0) {
+            size = Math.min(-op1, op2);
+            push_component(a_prime, -size);
+        } else {
+            size = Math.min(op1, -op2);
+            push_component(b_prime, -size);
+        }
+        
+        op1 = op1 > 0 ? op1 - size : op1 + size;
+        op2 = op2 > 0 ? op2 - size : op2 + size;
+        if (op1 === 0) op1 = a[i++];
+        if (op2 === 0) op2 = b[j++];
+    }
+    return [a_prime, b_prime];
+}
+
+function make_delta(old_text, new_text) {
+    if (old_text === new_text) return null;
+    
+    let prefix = 0;
+    const max_prefix = Math.min(old_text.length, new_text.length);
+    while (prefix < max_prefix && old_text[prefix] === new_text[prefix]) prefix++;
+    // never cut a surrogate pair in half
+    if (prefix && is_high_surrogate(old_text, prefix - 1)) prefix--;
+    
+    let suffix = 0;
+    const max_suffix = max_prefix - prefix;
+    while (suffix < max_suffix
+        && old_text[old_text.length - 1 - suffix] === new_text[new_text.length - 1 - suffix]) {
+        suffix++;
+    }
+    if (suffix && is_high_surrogate(old_text, old_text.length - suffix - 1)) suffix--;
+    
+    return [prefix, old_text.length - prefix - suffix, new_text.slice(prefix, new_text.length - suffix)];
+}
+
+function is_high_surrogate(text, index) {
+    const code = text.charCodeAt(index);
+    return code >= 0xD800 && code <= 0xDBFF;
+}
+
+function update_rendered_svg(frm, svg_hash) {
+    if (!svg_hash || svg_hash === frm.doc.svg_hash) return;
+    frm.doc.svg_hash = svg_hash;
+    
+    // The preview renders locally; only fetch the SVG when mermaid isn't loaded
+    if (window.mermaid) return;
+    
+    frappe.call({
+        method: 'mermaid.doctype.mermaid_diagram.mermaid_diagram.get_rendered_svg',
+        args: { name: frm.doc.name }
+    }).then(r => {
+        frm.fields_dict.mermaid_content.$wrapper.find('.mermaid-diagram').html(r.message.svg || '');
     });
 }
 
+function sync_mermaid_content(frm) {
+    const collab = frm.mermaid_collab;
+    if (frm.is_new() || !collab) {
+        if (frm.doc.__unsaved) frm.save();
+        return;
+    }
+    
+    // One operation in flight at a time; later edits go out with the ack
+    if (collab.synced === null || collab.inflight) return;
+    
+    const delta = make_delta(collab.synced, frm.doc.mermaid_content || '');
+    if (!delta) return;
+    
+    collab.inflight = op_from_delta(collab.synced.length, delta);
+    frappe.call({
+        method: 'mermaid.collab.submit_op',
+        args: {
+            name: frm.doc.name,
+            seq: collab.seq,
+            op: collab.inflight,
+            client_id: collab.client_id,
+            epoch: collab.epoch
+        },
+        type: 'POST'
+    }).then(r => {
+        if (r.message.status === 'resync') {
+            reset_collab(frm, r.message);
+        } else {
+            // Everything we missed, then our own operation as the ack
+            receive_ops(frm, r.message.ops);
+        }
+    }, () => {
+        // The operation may or may not have been applied; start over from the server
+        frappe.call({
+            method: 'mermaid.collab.get_state',
+            args: { name: frm.doc.name }
+        }).then(r => {
+            const state = r.message;
+            if (state.epoch === collab.epoch && state.seq === collab.seq) {
+                // Nothing was applied: send the edits again
+                collab.inflight = null;
+                sync_mermaid_content(frm);
+            } else {
+                reset_collab(frm, state);
+            }
+        });
+    });
+}
+
+function load_mermaid() {
+    return frappe.require('/assets/mermaid/js/mermaid-loader.js').then(() => mermaid_loader.load());
+}
+
 function render_mermaid_preview(frm) {
-    if (!frm.doc.mermaid_content || typeof mermaid === 'undefined') return;
+    if (!frm.doc.mermaid_content) return;
     
     const preview_id = 'mermaid-preview-' + Math.random().toString(36).substr(2, 9);
     
@@ -93,21 +407,17 @@ function render_mermaid_preview(frm) {
     }
     
     // Render the diagram
-    try {
-        mermaid.render(preview_id + '-svg', frm.doc.mermaid_content, function(svg) {
-            preview_container.find('.mermaid-diagram').html(svg);
-            
-            // Save rendered SVG
-            frm.set_value('rendered_svg', svg);
-        });
-    } catch (error) {
+    load_mermaid().then(mermaid => mermaid.render(preview_id + '-svg', frm.doc.mermaid_content)).then(({ svg }) => {
+        // Preview only: the stored SVG is rendered on the server after save
+        preview_container.find('.mermaid-diagram').html(svg);
+    }).catch(error => {
         preview_container.find('.mermaid-diagram').html(`
             <div style="color: red; padding: 10px;">
                 <strong>Rendering Error:</strong><br>
                 ${error.message}
             </div>
         `);
-    }
+    });
 }
 
 function show_mermaid_preview(frm) {
@@ -137,21 +447,15 @@ function show_mermaid_preview(frm) {
     dialog.show();
     
     // Render in dialog
-    try {
-        mermaid.render(preview_id + '-svg', frm.doc.mermaid_content, function(svg) {
-            dialog.fields_dict.preview_html.$wrapper.find(`#${preview_id}`).html(svg);
-        });
-    } catch (error) {
+    load_mermaid().then(mermaid => mermaid.render(preview_id + '-svg', frm.doc.mermaid_content)).then(({ svg }) => {
+        dialog.fields_dict.preview_html.$wrapper.find(`#${preview_id}`).html(svg);
+    }).catch(error => {
         dialog.fields_dict.preview_html.$wrapper.find(`#${preview_id}`).html(`
             <div style="color: red;">Error rendering diagram: ${error.message}</div>
         `);
-    }
+    });
 }
 
 // Debounced functions to prevent excessive API calls
 const debounced_render = frappe.utils.debounce(render_mermaid_preview, 1000);
-const debounced_save = frappe.utils.debounce(function(frm) {
-    if (frm.doc.__unsaved) {
-        frm.save();
-    }
-}, 2000);
\ No newline at end of file
+const debounced_sync = frappe.utils.debounce(sync_mermaid_content, 300);
\ No newline at end of file
@@ -1,8 +1,16 @@
-import frappe
-from frappe.model.document import Document
+import base64
 import json
 import re
 
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint
+
+from mermaid.delta import apply_delta, make_delta
+from mermaid.metrics import instrument
+from mermaid.parser import parse as parse_mermaid
+from mermaid.thumbnails import add_thumbnail_urls
+
 class MermaidDiagram(Document):
     def validate(self):
         """Validate mermaid syntax and set metadata"""
@@ -14,134 +22,172 @@ class MermaidDiagram(Document):
             if not self.diagram_type:
                 self.diagram_type = self.detect_diagram_type()
         
+        # Version the content for delta sync
+        if not self.is_new() and self.has_value_changed("mermaid_content"):
+            self.content_version = cint(self.content_version) + 1
+
         # Set created_by and modified_by
         if not self.created_by:
             self.created_by = frappe.session.user
         self.modified_by = frappe.session.user
     
     def validate_mermaid_syntax(self):
-        """Basic validation of mermaid syntax"""
-        content = self.mermaid_content.strip()
+        """Validate mermaid syntax with the single-pass parser"""
+        result = parse_mermaid(self.mermaid_content)
         
-        if not content:
+        if result["empty"]:
             frappe.throw("Mermaid content cannot be empty")
         
-        # List of valid mermaid diagram keywords
-        valid_keywords = [
-            'graph', 'flowchart', 'sequenceDiagram', 'classDiagram', 
-            'stateDiagram', 'erDiagram', 'journey', 'gantt', 'pie',
-            'gitgraph', 'C4Context', 'mindmap', 'timeline', 'zenuml',
-            'sankey'
-        ]
-        
-        first_line = content.split('\n')[0].strip()
-        
-        # Check if starts with valid keyword
-        has_valid_keyword = any(first_line.startswith(keyword) for keyword in valid_keywords)
-        
-        if not has_valid_keyword:
+        if not result["diagram_type"]:
             frappe.msgprint(
                 "Warning: Diagram doesn't start with a recognized Mermaid keyword. "
                 "This might cause rendering issues.",
                 alert=True
             )
+        elif result["errors"]:
+            error = result["errors"][0]
+            frappe.msgprint(
+                f"Warning: Line {error['line']}, column {error['column']}: {error['message']}. "
+                "This might cause rendering issues.",
+                alert=True
+            )
     
     def detect_diagram_type(self):
         """Auto-detect diagram type from content"""
-        content = self.mermaid_content.strip().lower()
-        first_line = content.split('\n')[0].strip()
-        
-        type_mapping = {
-            'graph': 'Flowchart',
-            'flowchart': 'Flowchart',
-            'sequencediagram': 'Sequence Diagram',
-            'classdiagram': 'Class Diagram',
-            'statediagram': 'State Diagram',
-            'erdiagram': 'Entity Relationship Diagram',
-            'journey': 'User Journey',
-            'gantt': 'Gantt Chart',
-            'pie': 'Pie Chart',
-            'gitgraph': 'Gitgraph',
-            'c4context': 'C4 Context',
-            'mindmap': 'Mindmap',
-            'timeline': 'Timeline',
-            'zenuml': 'ZenUML',
-            'sankey': 'Sankey'
-        }
-        
-        for keyword, diagram_type in type_mapping.items():
-            if first_line.startswith(keyword):
-                return diagram_type
-        
-        return "Flowchart"  # Default
+        return parse_mermaid(self.mermaid_content)["diagram_type"] or "Flowchart"  # Default
     
+    def get_rendered_svg(self):
+        """SVG from the blob store; only `svg_hash` is kept on the document"""
+        from mermaid.svg_store import load_svg
+
+        return load_svg(self.svg_hash)
+
+    def set_rendered_svg(self, svg):
+        from mermaid.svg_store import save_svg
+
+        self.svg_hash = save_svg(svg) if svg else None
+
     def on_update(self):
-        """Broadcast real-time updates"""
-        broadcast_update(self, "update")
-    
-    def after_insert(self):
-        """Broadcast creation"""
-        broadcast_update(self, "insert")
+        """Broadcast real-time updates and queue a render of changed content"""
+        from mermaid.render_queue import enqueue_render
+
+        broadcast_update(self, "updated")
+        enqueue_render(self)
 
 @frappe.whitelist()
+@instrument
 def get_mermaid_diagram(name):
     """Get diagram data for real-time editing"""
+    from mermaid.collab import read_state
+    from mermaid.embed import get_embed_url
+    from mermaid.render_cache import get_cached_svg
+
     doc = frappe.get_doc("Mermaid Diagram", name)
+    # while a diagram is being edited, the engine has content not saved yet
+    collab = read_state(name) or {}
     return {
         "name": doc.name,
         "title": doc.title,
-        "mermaid_content": doc.mermaid_content,
+        "mermaid_content": collab.get("content", doc.mermaid_content),
+        "seq": collab.get("seq"),
+        "epoch": collab.get("epoch"),
+        "rendered_svg": doc.get_rendered_svg() or get_cached_svg(doc.mermaid_content),
         "diagram_type": doc.diagram_type,
+        "version": doc.content_version,
+        "svg_hash": doc.svg_hash,
+        "embed_url": get_embed_url(doc.name, doc.svg_hash) if doc.is_public else None,
         "modified": doc.modified
     }
 
 @frappe.whitelist()
+@instrument
 def update_mermaid_content(name, content, rendered_svg=None):
-    """Update diagram content with real-time sync"""
-    doc = frappe.get_doc("Mermaid Diagram", name)
-    doc.mermaid_content = content
-    
-    if rendered_svg:
-        doc.rendered_svg = rendered_svg
-    
-    doc.save()
-    
-    # Broadcast to other sessions
-    frappe.publish_realtime(
-        event="mermaid_diagram_updated",
-        message={
-            "name": name,
-            "content": content,
-            "rendered_svg": rendered_svg,
-            "modified": doc.modified
-        },
-        room=f"mermaid_diagram_{name}"
-    )
-    
-    return {"status": "success", "modified": doc.modified}
+    """Replace the diagram content through the collaborative editing engine
+
+    The change is merged, acknowledged and broadcast straight away; the
+    diagram itself is saved by the engine's periodic flush. `rendered_svg` is
+    accepted for older clients and ignored.
+    """
+    from mermaid.collab import replace_content
+
+    frappe.has_permission("Mermaid Diagram", "write", name, throw=True)
+    result = replace_content(name, content)
+
+    return {"status": "success", "version": result["seq"], "epoch": result["epoch"]}
+
+@frappe.whitelist()
+@instrument
+def apply_mermaid_delta(name, version, delta, client_id=None, epoch=None):
+    """Merge a text delta made against engine sequence number `version`
+
+    Concurrent edits are transformed rather than rejected; the response lists
+    the operations applied since `version`, the caller's own last. A
+    `{"status": "resync", ...}` response carries the full current content.
+    """
+    from mermaid.collab import submit
+
+    frappe.has_permission("Mermaid Diagram", "write", name, throw=True)
+    result = submit(name, version, delta=frappe.parse_json(delta), client_id=client_id, epoch=epoch)
+    if result["status"] == "resync":
+        return result
+
+    return {"status": "success", "version": result["seq"], "epoch": result["epoch"], "ops": result["ops"]}
+
+@frappe.whitelist()
+@instrument
+def get_rendered_svg(name):
+    """Fetch the stored SVG; clients call this only when `svg_hash` has changed"""
+    from mermaid.svg_store import load_svg
+
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+    svg_hash = frappe.db.get_value("Mermaid Diagram", name, "svg_hash")
+    return {"svg_hash": svg_hash, "svg": load_svg(svg_hash)}
+
+def get_sync_message(doc):
+    """Realtime payload carrying a delta against the previous version instead of the content"""
+    before = doc.get_doc_before_save()
+    delta = base_version = None
+
+    if before and before.mermaid_content != doc.mermaid_content:
+        delta = make_delta(before.mermaid_content, doc.mermaid_content)
+        base_version = cint(before.content_version)
+
+    return {
+        "name": doc.name,
+        "title": doc.title,
+        "diagram_type": doc.diagram_type,
+        "version": doc.content_version,
+        "base_version": base_version,
+        "delta": delta,
+        "svg_hash": doc.svg_hash,
+        "modified": doc.modified
+    }
 
 def broadcast_update(doc, event_type):
     """Broadcast document updates to subscribed clients"""
-    frappe.publish_realtime(
-        event=f"mermaid_diagram_{event_type}",
-        message={
-            "name": doc.name,
-            "title": doc.title,
-            "content": doc.mermaid_content,
-            "diagram_type": doc.diagram_type,
-            "modified": doc.modified
-        },
-        room=f"mermaid_diagram_{doc.name}"
-    )
+    from mermaid.realtime import publish_diagram_event
+
+    publish_diagram_event(doc.name, f"mermaid_diagram_{event_type}", get_sync_message(doc))
 
 @frappe.whitelist()
-def render_mermaid_svg(content):
-    """Server-side SVG rendering (placeholder - actual rendering happens client-side)"""
-    # This is a placeholder for server-side rendering if needed
-    # In practice, we'll do client-side rendering with mermaid.js
-    return {"svg": f"<!-- Mermaid content: {len(content)} characters -->"}
+@instrument
+def render_mermaid_svg(content, theme="default"):
+    """Server-side SVG rendering using the warm render worker pool"""
+    from mermaid.render_cache import render_cached
+    from mermaid.renderer import RenderError
+
+    if not content or not content.strip():
+        frappe.throw("Mermaid content cannot be empty")
+
+    try:
+        svg = render_cached(content, theme=theme)
+    except RenderError as e:
+        frappe.throw(f"Could not render diagram: {e}")
+
+    return {"svg": svg}
 
 @frappe.whitelist()
+@instrument
 def create_new_diagram(title, diagram_type="Flowchart", content="", description=""):
     """Create a new Mermaid diagram"""
     doc = frappe.new_doc("Mermaid Diagram")
@@ -158,6 +204,7 @@ def create_new_diagram(title, diagram_type="Flowchart", content="", description=
     }
 
 @frappe.whitelist()
+@instrument
 def duplicate_diagram(name, new_title=None):
     """Duplicate an existing diagram"""
     original = frappe.get_doc("Mermaid Diagram", name)
@@ -166,6 +213,9 @@ def duplicate_diagram(name, new_title=None):
     doc.title = new_title or f"{original.title} (Copy)"
     doc.diagram_type = original.diagram_type
     doc.mermaid_content = original.mermaid_content
+    # same source, no need to render or store again
+    doc.svg_hash = original.svg_hash
+    doc.rendered_source_hash = original.rendered_source_hash
     doc.description = original.description
     doc.is_public = False  # Reset public flag for copies
     doc.insert()
@@ -177,58 +227,146 @@ def duplicate_diagram(name, new_title=None):
     }
 
 @frappe.whitelist()
-def get_diagram_list(filters=None, limit=20, start=0):
-    """Get list of diagrams with pagination"""
-    filters = filters or {}
-    
-    # Add user filter if not system manager
-    if not frappe.has_permission("Mermaid Diagram", "read"):
-        filters["created_by"] = frappe.session.user
-    
+@instrument
+def get_diagram_list(filters=None, limit=20, start=0, cursor=None):
+    """Get list of diagrams with pagination.
+
+    Pass `cursor` (an empty string for the first page) to page by keyset on
+    (modified, name) instead of by offset; the response then is
+    `{"diagrams": [...], "next_cursor": ...}`. Each row has a `thumbnail_url`
+    (None until the diagram is rendered).
+    """
+    filters = frappe.parse_json(filters) if filters else {}
+    limit = cint(limit) or 20
+
+    # visibility (owner, public, shared) comes from the permission query conditions
+    fields = ["name", "title", "diagram_type", "modified", "created_by", "is_public", "svg_hash"]
+
+    if cursor is None:
+        return add_thumbnail_urls(frappe.get_list(
+            "Mermaid Diagram",
+            fields=fields,
+            filters=filters,
+            order_by="modified desc",
+            limit=limit,
+            start=start
+        ))
+
+    or_filters = None
+    if cursor:
+        modified, name = decode_list_cursor(cursor)
+        # (modified, name) < cursor, written so the (modified, name) index can seek to it
+        filters = normalize_filters(filters)
+        filters.append(["Mermaid Diagram", "modified", "<=", modified])
+        or_filters = [
+            ["Mermaid Diagram", "modified", "<", modified],
+            ["Mermaid Diagram", "name", "<", name],
+        ]
+
     diagrams = frappe.get_list(
         "Mermaid Diagram",
-        fields=["name", "title", "diagram_type", "modified", "created_by", "is_public"],
+        fields=fields,
         filters=filters,
-        order_by="modified desc",
-        limit=limit,
-        start=start
+        or_filters=or_filters,
+        order_by="modified desc, name desc",
+        limit=limit
     )
-    
-    return diagrams
+
+    next_cursor = None
+    if len(diagrams) == limit:
+        last = diagrams[-1]
+        next_cursor = encode_list_cursor(last.modified, last.name)
+
+    return {"diagrams": add_thumbnail_urls(diagrams), "next_cursor": next_cursor}
+
+def normalize_filters(filters):
+    """`filters` in dict or list form as a new list of [doctype, field, operator, value]
+
+    so conditions can be appended without replacing one on the same field.
+    """
+    if not filters:
+        return []
+    if isinstance(filters, dict):
+        return [
+            ["Mermaid Diagram", key, *(value if isinstance(value, (list, tuple)) else ("=", value))]
+            for key, value in filters.items()
+        ]
+    if not isinstance(filters, (list, tuple)):
+        frappe.throw("Filters must be a dict or a list of conditions")
+
+    normalized = []
+    for condition in filters:
+        if not isinstance(condition, (list, tuple)) or len(condition) not in (3, 4):
+            frappe.throw("Each filter must be [field, operator, value]")
+        normalized.append(["Mermaid Diagram", *condition] if len(condition) == 3 else list(condition))
+    return normalized
+
+def encode_list_cursor(modified, name):
+    """Opaque cursor pointing just after the row (modified, name)"""
+    payload = json.dumps([str(modified), name], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_list_cursor(cursor):
+    try:
+        modified, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        frappe.throw("Invalid cursor")
+    return modified, name
 
 @frappe.whitelist()
+@instrument
 def search_diagrams(query, limit=10):
-    """Search diagrams by title or content"""
-    conditions = []
-    
-    if query:
-        conditions.append(f"(title LIKE '%{query}%' OR mermaid_content LIKE '%{query}%')")
-    
-    # Add user filter if not system manager
-    if not frappe.has_permission("Mermaid Diagram", "read"):
-        conditions.append(f"created_by = '{frappe.session.user}'")
-    
-    where_clause = " AND ".join(conditions) if conditions else "1=1"
-    
-    diagrams = frappe.db.sql(f"""
-        SELECT name, title, diagram_type, modified, created_by
-        FROM `tabMermaid Diagram`
-        WHERE {where_clause}
-        ORDER BY modified DESC
-        LIMIT {limit}
-    """, as_dict=True)
-    
-    return diagrams
+    """Search diagrams by title, description or node/edge labels"""
+    from mermaid.search import search
+
+    limit = cint(limit) or 10
+    fields = ["name", "title", "diagram_type", "modified", "created_by"]
+    filters = {}
+
+    if not query or not query.strip():
+        return frappe.get_list(
+            "Mermaid Diagram", fields=fields, filters=filters, order_by="modified desc", limit=limit
+        )
+
+    # over-fetch so that hits the user cannot read don't leave the page short
+    ranked = search(query, limit=limit * 3)
+    if not ranked:
+        return []
+
+    filters["name"] = ["in", ranked]
+    diagrams = frappe.get_list("Mermaid Diagram", fields=fields, filters=filters)
+    rank = {name: i for i, name in enumerate(ranked)}
+    diagrams.sort(key=lambda d: rank[d.name])
+
+    return diagrams[:limit]
 
 @frappe.whitelist()
+@instrument
 def export_diagram(name, format="svg"):
     """Export diagram in various formats"""
     doc = frappe.get_doc("Mermaid Diagram", name)
     doc.check_permission("read")
     
     if format == "svg":
+        from mermaid.render_cache import render_cached
+        from mermaid.renderer import RenderError
+        from mermaid.svg_store import optimize_svg
+
+        # stored SVGs are optimized on write, but older ones and fresh renders aren't.
+        # Render through the cache directly: render_mermaid_svg is an endpoint
+        # with its own metrics, which would count this call as one of its own.
+        svg = doc.get_rendered_svg()
+        if not svg:
+            if not (doc.mermaid_content or "").strip():
+                frappe.throw("Mermaid content cannot be empty")
+            try:
+                svg = render_cached(doc.mermaid_content)
+            except RenderError as e:
+                frappe.throw(f"Could not render diagram: {e}")
+        svg = optimize_svg(svg)
+
         return {
-            "content": doc.rendered_svg,
+            "content": svg,
             "filename": f"{doc.title}.svg",
             "mimetype": "image/svg+xml"
         }
@@ -242,52 +380,37 @@ def export_diagram(name, format="svg"):
         frappe.throw("Unsupported export format")
 
 @frappe.whitelist()
+@instrument
 def get_diagram_stats():
-    """Get statistics about diagrams"""
-    stats = {}
-    
-    # Total diagrams
-    stats["total"] = frappe.db.count("Mermaid Diagram")
-    
-    # Diagrams by type
-    stats["by_type"] = frappe.db.sql("""
-        SELECT diagram_type, COUNT(*) as count
-        FROM `tabMermaid Diagram`
-        GROUP BY diagram_type
-        ORDER BY count DESC
-    """, as_dict=True)
-    
-    # Recent activity
-    stats["recent"] = frappe.db.sql("""
-        SELECT DATE(modified) as date, COUNT(*) as count
-        FROM `tabMermaid Diagram`
-        WHERE modified >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-        GROUP BY DATE(modified)
-        ORDER BY date DESC
-        LIMIT 30
-    """, as_dict=True)
-    
-    return stats
+    """Get statistics about diagrams from the incrementally maintained rollup"""
+    from mermaid.stats import get_stats
+
+    return get_stats()
 
 @frappe.whitelist()
-def share_diagram(name, users=None, roles=None, public=False):
-    """Share diagram with specific users or roles"""
+@instrument
+def share_diagram(name, users=None, roles=None, public=False, write=True, replace=False):
+    """Share diagram with specific users and the members of roles
+
+    Shares are written in bulk (see `mermaid.sharing`); with `replace` the
+    given users and roles become the complete list and other shares are removed.
+    """
+    from mermaid.sharing import share_diagram as share
+
     doc = frappe.get_doc("Mermaid Diagram", name)
     doc.check_permission("share")
-    
-    if public:
+
+    write = cint(write)
+    if write:
+        # nobody can grant more than they have
+        doc.check_permission("write")
+
+    if cint(public):
         doc.is_public = True
         doc.save()
-    
-    # Add specific user permissions
-    if users:
-        for user in users:
-            frappe.share.add("Mermaid Diagram", name, user, read=1, write=1)
-    
-    # Add role permissions
-    if roles:
-        for role in roles:
-            # This would require custom implementation for role-based sharing
-            pass
-    
-    return {"status": "success"}
+
+    users = frappe.parse_json(users) if users else []
+    roles = frappe.parse_json(roles) if roles else []
+    result = share(name, users=users, roles=roles, rights={"read": 1, "write": write}, replace=cint(replace))
+
+    return {"status": "success", **result}
@@ -1,3 +1,4 @@
+import re
 import unittest
 import frappe
 from frappe.utils import random_string
@@ -145,7 +146,7 @@ class TestMermaidDiagram(unittest.TestCase):
         
     def test_diagram_stats(self):
         """Test diagram statistics"""
-        from mermaid.mermaid.doctype.mermaid_diagram.mermaid_diagram import get_diagram_stats
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import get_diagram_stats
         
         stats = get_diagram_stats()
         
@@ -158,3 +159,592 @@ class TestMermaidDiagram(unittest.TestCase):
         self.assertIsInstance(stats["total"], int)
         self.assertGreater(stats["total"], 0)  # At least our test diagram
         self.assertTrue(any(d["diagram_type"] == "Flowchart" for d in stats["by_type"]))
+
+    def test_diagram_stats_match_table(self):
+        """Test the maintained counters give the numbers the old aggregate queries did"""
+        from frappe.utils import nowdate
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import get_diagram_stats
+        from mermaid.stats import reconcile
+
+        def aggregate():
+            by_type = frappe.db.sql("""
+                SELECT diagram_type, COUNT(*) as count
+                FROM `tabMermaid Diagram`
+                GROUP BY diagram_type
+            """, as_dict=True)
+            return frappe.db.count("Mermaid Diagram"), {d.diagram_type: d.count for d in by_type}
+
+        def maintained():
+            stats = get_diagram_stats()
+            return stats["total"], {d["diagram_type"]: d["count"] for d in stats["by_type"]}
+
+        def activity_today():
+            return next((d["count"] for d in get_diagram_stats()["recent"] if str(d["date"]) == nowdate()), 0)
+
+        reconcile()
+        self.assertEqual(maintained(), aggregate())
+        active = activity_today()
+
+        other = frappe.get_doc({
+            "doctype": "Mermaid Diagram",
+            "title": f"Stats Test {random_string(8)}",
+            "diagram_type": "Sequence Diagram",
+            "mermaid_content": "sequenceDiagram\n    A->>B: Hi"
+        }).insert()
+        self.assertEqual(maintained(), aggregate())
+        self.assertEqual(activity_today(), active + 1)
+
+        # Type changes move the count; saving again the same day isn't new activity
+        other.diagram_type = "Flowchart"
+        other.mermaid_content = self.test_content
+        other.save()
+        self.assertEqual(maintained(), aggregate())
+        self.assertEqual(activity_today(), active + 1)
+
+        frappe.delete_doc("Mermaid Diagram", other.name)
+        self.assertEqual(maintained(), aggregate())
+
+    def test_diagram_list_cursor(self):
+        """Test keyset pagination walks every diagram exactly once"""
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import get_diagram_list
+
+        extra = [
+            frappe.get_doc({
+                "doctype": "Mermaid Diagram",
+                "title": f"Cursor Test {random_string(8)}",
+                "mermaid_content": self.test_content
+            }).insert()
+            for _ in range(3)
+        ]
+
+        seen = []
+        page = get_diagram_list(limit=2, cursor="")
+        while True:
+            seen.extend(d.name for d in page["diagrams"])
+            if not page["next_cursor"]:
+                break
+            page = get_diagram_list(limit=2, cursor=page["next_cursor"])
+
+        self.assertEqual(len(seen), len(set(seen)))
+        for doc in [self.diagram, *extra]:
+            self.assertIn(doc.name, seen)
+
+        # List-form filters keep working past the first page
+        filters = [["title", "like", "Cursor Test %"], ["name", "in", [d.name for d in extra]]]
+        page = get_diagram_list(filters=filters, limit=2, cursor="")
+        filtered = [d.name for d in page["diagrams"]]
+        page = get_diagram_list(filters=filters, limit=2, cursor=page["next_cursor"])
+        filtered.extend(d.name for d in page["diagrams"])
+        self.assertEqual(sorted(filtered), sorted(d.name for d in extra))
+
+        # Cleanup
+        for doc in extra:
+            frappe.delete_doc("Mermaid Diagram", doc.name)
+
+    def test_diagram_delta_sync(self):
+        """Test concurrent deltas against the same version are merged, then flushed"""
+        from mermaid.collab import flush_diagram, get_state
+        from mermaid.delta import make_delta
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import apply_mermaid_delta
+
+        state = get_state(self.diagram.name)
+        content = state["content"]
+        first = make_delta(content, content.replace("Result 1", "Outcome 1"))
+        second = make_delta(content, content.replace("Result 2", "Outcome 2"))
+
+        result = apply_mermaid_delta(self.diagram.name, state["seq"], first, epoch=state["epoch"])
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["version"], state["seq"] + 1)
+
+        # Made against the same version: transformed, not rejected
+        result = apply_mermaid_delta(self.diagram.name, state["seq"], second, epoch=state["epoch"])
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(len(result["ops"]), 2)
+
+        merged = content.replace("Result 1", "Outcome 1").replace("Result 2", "Outcome 2")
+        self.assertEqual(get_state(self.diagram.name)["content"], merged)
+
+        flush_diagram(self.diagram.name)
+        self.assertEqual(frappe.db.get_value("Mermaid Diagram", self.diagram.name, "mermaid_content"), merged)
+
+        # Malformed input is a validation error, not a crash
+        from mermaid.collab import submit_op
+
+        state = get_state(self.diagram.name)
+        for delta in ([10**9, 0, "x"], ["a", 0, "x"], [0, 1]):
+            with self.assertRaises(frappe.ValidationError):
+                apply_mermaid_delta(self.diagram.name, state["seq"], delta, epoch=state["epoch"])
+        for op in ([5, 1.5], [None], [{}]):
+            with self.assertRaises(frappe.ValidationError):
+                submit_op(self.diagram.name, state["seq"], op, epoch=state["epoch"])
+
+    def test_diagram_type_detection(self):
+        """Test type detection skips front-matter, directives and comments"""
+        from mermaid.parser import parse
+
+        content = "---\ntitle: Orders\n---\n%%{init: {'theme': 'dark'}}%%\n%% comment\nsequenceDiagram\n    A->>B: Hi"
+        self.diagram.mermaid_content = content
+        self.assertEqual(self.diagram.detect_diagram_type(), "Sequence Diagram")
+
+        result = parse("graph TD\n    A[Start] --> B[End\n")
+        self.assertEqual(result["diagram_type"], "Flowchart")
+        self.assertEqual(result["errors"][0]["line"], 2)
+        self.assertEqual(result["errors"][0]["column"], 19)
+
+        # memoized results are handed out as copies
+        result["errors"].clear()
+        self.assertTrue(parse("graph TD\n    A[Start] --> B[End\n")["errors"])
+
+        for content in (
+            "graph TD\n    A --> B %% trailing comment",
+            'flowchart LR\n    A["spans\n    two lines"] --> B',
+            "flowchart LR\n    A e1@--> B\n    e1@{ animate: true }",
+            "graph LR\n    A -- -1 --> B",
+        ):
+            self.assertEqual(parse(content)["errors"], [], content)
+
+        # quotes that never close are reported, however many there are
+        content = "graph TD\n" + "\n".join((['A["x'] + ["B --> C"] * 19) * 3000)
+        self.assertEqual(len(parse(content)["errors"]), 3000)
+
+    def test_svg_optimizer(self):
+        """Test ids are shortened with their references and coordinates rounded"""
+        from mermaid.svg_optimizer import optimize_svg
+
+        svg = (
+            '<svg id="mermaid-1697040129517" viewBox="0 0 100.123456 50">\n'
+            '  <style>#mermaid-1697040129517 .edge { stroke: #333; }</style>\n'
+            '  <marker id="mermaid-1697040129517_flowchart-pointEnd"></marker>\n'
+            '  <path marker-end="url(#mermaid-1697040129517_flowchart-pointEnd)" d="M0,0L1.23456,2"/>\n'
+            '</svg>'
+        )
+        optimized, report = optimize_svg(svg)
+
+        self.assertNotIn("mermaid-1697040129517", optimized)
+        self.assertIn('viewBox="0 0 100.12 50"', optimized)
+        self.assertIn('d="M0,0L1.23,2"', optimized)
+        self.assertEqual(report["ids_shortened"], 2)
+        self.assertLess(report["optimized_size"], report["original_size"])
+
+        marker_id = re.search(r'<marker id="([^"]+)"', optimized).group(1)
+        self.assertIn(f"url(#{marker_id})", optimized)
+        svg_id = re.search(r'<svg id="([^"]+)"', optimized).group(1)
+        self.assertIn(f"#{svg_id} .edge{{stroke:#333}}", optimized)
+        self.assertEqual(optimize_svg(optimized)[0], optimized)
+
+    def test_public_embed(self):
+        """Test the embed serves public diagrams only and answers conditional GETs"""
+        from werkzeug.exceptions import NotFound
+        from werkzeug.test import EnvironBuilder
+        from werkzeug.wrappers import Request
+
+        from mermaid import embed
+        from mermaid.svg_store import save_svg
+
+        def request(**headers):
+            frappe.local.request = Request(EnvironBuilder(method="GET", headers=headers).get_environ())
+
+        svg_hash = save_svg('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+        self.diagram.db_set({"svg_hash": svg_hash, "is_public": 0})
+
+        try:
+            request()
+            with self.assertRaises(NotFound):
+                embed.svg(self.diagram.name)
+
+            self.diagram.db_set("is_public", 1)
+            response = embed.svg(self.diagram.name)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("public", response.headers["Cache-Control"])
+
+            request(**{"If-None-Match": response.headers["ETag"]})
+            self.assertEqual(embed.svg(self.diagram.name).status_code, 304)
+        finally:
+            del frappe.local.request
+
+    def test_diagram_revisions(self):
+        """Test every saved version can be reconstructed from snapshots and deltas"""
+        from mermaid.revisions import SNAPSHOT_INTERVAL, get_revision_content
+
+        contents = {self.diagram.content_version: self.diagram.mermaid_content}
+        for i in range(SNAPSHOT_INTERVAL + 5):
+            self.diagram.mermaid_content += f"    F --> N{i}[Step {i}]\n"
+            self.diagram.save()
+            contents[self.diagram.content_version] = self.diagram.mermaid_content
+
+        for version, content in contents.items():
+            self.assertEqual(get_revision_content(self.diagram.name, version)["content"], content)
+
+        snapshots = frappe.get_all(
+            "Mermaid Diagram Revision", filters={"diagram": self.diagram.name, "is_snapshot": 1}, pluck="revision"
+        )
+        self.assertLessEqual(len(snapshots), 1 + len(contents) // SNAPSHOT_INTERVAL + 1)
+
+    def test_draft_buffer(self):
+        """Test autosaves stay in the draft until flushed and survive losing redis"""
+        from mermaid.collab import DIRTY_KEY, _key
+        from mermaid.drafts import flush_draft, get_draft, read_journal, save_draft
+
+        content = self.test_content.replace("Decision", "Choice")
+        save_draft(self.diagram.name, content)
+
+        self.assertEqual(get_draft(self.diagram.name), {"content": content, "unsaved": True})
+        self.assertNotEqual(frappe.db.get_value("Mermaid Diagram", self.diagram.name, "mermaid_content"), content)
+        self.assertEqual(read_journal(self.diagram.name)["content"], content)
+
+        # Redis loses the draft: it comes back from the journal
+        cache = frappe.cache()
+        cache.delete(cache.make_key(_key(self.diagram.name, "state")))
+        cache.zrem(cache.make_key(DIRTY_KEY), self.diagram.name)
+        self.assertEqual(get_draft(self.diagram.name)["content"], content)
+
+        flush_draft(self.diagram.name)
+        self.assertEqual(frappe.db.get_value("Mermaid Diagram", self.diagram.name, "mermaid_content"), content)
+        self.assertIsNone(read_journal(self.diagram.name))
+
+        # A desk save made meanwhile is merged with the draft, not put over it
+        save_draft(self.diagram.name, content.replace("Start", "Begin"))
+        doc = frappe.get_doc("Mermaid Diagram", self.diagram.name)
+        doc.mermaid_content = content.replace("End", "Finish")
+        doc.save()
+        frappe.db.commit()
+        self.assertEqual(
+            get_draft(self.diagram.name)["content"], content.replace("Start", "Begin").replace("End", "Finish")
+        )
+
+        # An empty draft could never be saved
+        with self.assertRaises(frappe.ValidationError):
+            save_draft(self.diagram.name, "  ")
+
+    def test_api_metrics(self):
+        """Test instrumented calls show up in the Prometheus export"""
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import get_mermaid_diagram
+        from mermaid.metrics import read_metrics, render_prometheus, reset_metrics
+
+        reset_metrics()
+        get_mermaid_diagram(self.diagram.name)
+        get_mermaid_diagram(self.diagram.name)
+
+        metrics = read_metrics()
+        self.assertEqual(metrics['mermaid_api_calls_total{method="get_mermaid_diagram"}'], 2)
+        self.assertEqual(metrics['mermaid_api_duration_seconds_count{method="get_mermaid_diagram"}'], 2)
+        self.assertGreater(metrics['mermaid_api_db_queries_total{method="get_mermaid_diagram"}'], 0)
+        self.assertGreater(metrics['mermaid_api_response_bytes_sum{method="get_mermaid_diagram"}'], 0)
+
+        exposition = render_prometheus(metrics)
+        self.assertIn("# TYPE mermaid_api_duration_seconds histogram", exposition)
+        self.assertIn('mermaid_api_duration_seconds_bucket{method="get_mermaid_diagram",le="+Inf"} 2', exposition)
+
+    def test_bulk_share(self):
+        """Test sharing diffs against existing shares instead of adding duplicates"""
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import share_diagram
+
+        test_user = "test@example.com"
+        if not frappe.db.exists("User", test_user):
+            frappe.get_doc({
+                "doctype": "User",
+                "email": test_user,
+                "first_name": "Test",
+                "send_welcome_email": 0
+            }).insert()
+
+        def shares():
+            return frappe.get_all(
+                "DocShare",
+                filters={"share_doctype": "Mermaid Diagram", "share_name": self.diagram.name},
+                fields=["user", "read", "write"],
+            )
+
+        self.assertEqual(share_diagram(self.diagram.name, users=[test_user])["added"], 1)
+        self.assertEqual(share_diagram(self.diagram.name, users=[test_user])["added"], 0)
+        self.assertEqual(shares(), [{"user": test_user, "read": 1, "write": 1}])
+
+        self.assertEqual(share_diagram(self.diagram.name, users=[test_user], write=0)["updated"], 1)
+        self.assertEqual(shares()[0]["write"], 0)
+
+        # Rights that weren't passed are left alone
+        frappe.db.set_value("DocShare", {"share_name": self.diagram.name, "user": test_user}, "share", 1)
+        self.assertEqual(share_diagram(self.diagram.name, users=[test_user], write=0)["updated"], 0)
+        self.assertEqual(frappe.db.get_value("DocShare", {"share_name": self.diagram.name, "user": test_user}, "share"), 1)
+
+        frappe.set_user(test_user)
+        self.assertTrue(frappe.has_permission("Mermaid Diagram", "read", self.diagram.name))
+        frappe.set_user("Administrator")
+
+        self.assertEqual(share_diagram(self.diagram.name, replace=True)["removed"], 1)
+        self.assertEqual(shares(), [])
+
+    def test_diagram_visibility(self):
+        """Test lists only show diagrams the user owns, that are public or shared with them"""
+        from mermaid.doctype.mermaid_diagram.mermaid_diagram import get_diagram_list
+
+        test_user = "test@example.com"
+        if not frappe.db.exists("User", test_user):
+            frappe.get_doc({
+                "doctype": "User",
+                "email": test_user,
+                "first_name": "Test",
+                "send_welcome_email": 0
+            }).insert()
+
+        def visible():
+            frappe.set_user(test_user)
+            try:
+                names = {d.name for d in get_diagram_list(limit=500)}
+                return self.diagram.name in names
+            finally:
+                frappe.set_user("Administrator")
+
+        self.diagram.is_public = 0
+        self.diagram.save()
+        self.assertFalse(visible())
+
+        frappe.share.add("Mermaid Diagram", self.diagram.name, test_user, read=1)
+        self.assertTrue(visible())
+
+        frappe.share.remove("Mermaid Diagram", self.diagram.name, test_user)
+        self.assertFalse(visible())
+
+        self.diagram.is_public = 1
+        self.diagram.save()
+        self.assertTrue(visible())
+
+        frappe.set_user(test_user)
+        try:
+            self.assertTrue(frappe.has_permission("Mermaid Diagram", "read", self.diagram.name))
+            self.assertFalse(frappe.has_permission("Mermaid Diagram", "write", self.diagram.name))
+        finally:
+            frappe.set_user("Administrator")
+
+    def test_graph_index(self):
+        """Test nodes and edges are indexed on save and queried with permissions applied"""
+        from mermaid.graph import (
+            EDGE_DOCTYPE,
+            NODE_DOCTYPE,
+            find_diagrams_referencing,
+            get_incoming_edges,
+            get_node_neighborhood,
+            get_outgoing_edges,
+        )
+
+        self.assertEqual(frappe.db.count(NODE_DOCTYPE, {"diagram": self.diagram.name}), 6)
+        self.assertEqual(frappe.db.count(EDGE_DOCTYPE, {"diagram": self.diagram.name}), 6)
+        self.assertEqual(
+            frappe.db.get_value(NODE_DOCTYPE, {"diagram": self.diagram.name, "node_id": "C"}, "label"),
+            "Decision",
+        )
+
+        self.assertIn(self.diagram.name, {d.name for d in find_diagrams_referencing("Decision")})
+        incoming = get_incoming_edges("F", diagram=self.diagram.name)
+        self.assertEqual({e.source for e in incoming}, {"D", "E"})
+        outgoing = get_outgoing_edges("C", diagram=self.diagram.name)
+        self.assertEqual({(e.target, e.label) for e in outgoing}, {("D", "Yes"), ("E", "No")})
+
+        neighborhood = get_node_neighborhood("A", depth=2, diagram=self.diagram.name)
+        self.assertEqual({n["node_id"] for n in neighborhood["nodes"]}, {"A", "B", "C"})
+
+        # Edits replace the rows
+        self.diagram.mermaid_content = "graph TD\n    A --> Z"
+        self.diagram.save()
+        self.assertEqual(
+            set(frappe.get_all(NODE_DOCTYPE, filters={"diagram": self.diagram.name}, pluck="node_id")),
+            {"A", "Z"},
+        )
+
+        # Start/end pseudo-states aren't nodes shared between state diagrams
+        state = frappe.get_doc({
+            "doctype": "Mermaid Diagram",
+            "title": f"Test State {random_string(8)}",
+            "diagram_type": "State Diagram",
+            "mermaid_content": "stateDiagram-v2\n    [*] --> Idle\n    Idle --> [*]",
+        }).insert()
+        try:
+            self.assertFalse(frappe.db.exists(NODE_DOCTYPE, {"diagram": state.name, "node_id": "[*]"}))
+            self.assertEqual(frappe.db.count(EDGE_DOCTYPE, {"diagram": state.name}), 2)
+            self.assertNotIn(state.name, {d.name for d in find_diagrams_referencing("[*]")})
+        finally:
+            frappe.delete_doc("Mermaid Diagram", state.name)
+
+        # Private diagrams don't show up for other users, and don't use up the limit
+        test_user = "test@example.com"
+        if not frappe.db.exists("User", test_user):
+            frappe.get_doc({
+                "doctype": "User",
+                "email": test_user,
+                "first_name": "Test",
+                "send_welcome_email": 0
+            }).insert()
+
+        self.diagram.is_public = 0
+        self.diagram.save()
+        frappe.set_user(test_user)
+        try:
+            self.assertNotIn(self.diagram.name, {d.name for d in find_diagrams_referencing("Z", limit=1)})
+            self.assertEqual(get_outgoing_edges("A", diagram=self.diagram.name), [])
+        finally:
+            frappe.set_user("Administrator")
+
+        self.diagram.is_public = 1
+        self.diagram.save()
+        frappe.set_user(test_user)
+        try:
+            self.assertIn(self.diagram.name, {d.name for d in find_diagrams_referencing("Z", limit=500)})
+            self.assertEqual(len(get_outgoing_edges("A", diagram=self.diagram.name)), 1)
+        finally:
+            frappe.set_user("Administrator")
+
+    def test_bulk_export_filters(self):
+        """Test export batches keep the caller's filters, and bad manifests are rejected"""
+        from mermaid import bulk
+
+        extra = frappe.get_doc({
+            "doctype": "Mermaid Diagram",
+            "title": f"Export Test {random_string(8)}",
+            "mermaid_content": self.test_content
+        }).insert()
+        names = sorted([self.diagram.name, extra.name])
+
+        batch_size = bulk.EXPORT_BATCH_SIZE
+        bulk.EXPORT_BATCH_SIZE = 1
+        try:
+            for filters in ({"name": ["in", names]}, [["name", "in", names]], [["Mermaid Diagram", "name", "in", names]]):
+                self.assertEqual([d.name for d in bulk.iter_diagrams(filters)], names)
+        finally:
+            bulk.EXPORT_BATCH_SIZE = batch_size
+            frappe.delete_doc("Mermaid Diagram", extra.name)
+
+        self.assertEqual(bulk.load_manifest('{"diagrams": [{"title": "A"}]}'), [{"title": "A"}])
+        for manifest in ("{not json", "[]", '{"diagrams": {}}', '{"diagrams": ["A"]}'):
+            with self.assertRaises(frappe.ValidationError):
+                bulk.load_manifest(manifest)
+
+    def test_render_cache(self):
+        """Test the render cache serves from memory, then disk, and evicts least recently used"""
+        import os
+        import tempfile
+
+        from mermaid.render_cache import RenderCache, get_cache_key, get_render_cache, render_cached
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            class TempRenderCache(RenderCache):
+                def get_cache_dir(self):
+                    return cache_dir
+
+            cache = TempRenderCache(memory_limit=20, disk_limit=20)
+            cache.set("aa01", "<svg>1</svg>")
+            self.assertEqual(cache.get("aa01"), "<svg>1</svg>")
+            self.assertTrue(os.path.exists(cache._get_path("aa01")))
+
+            # A second entry pushes the first out of memory; it is read back from disk
+            cache.set("aa02", "<svg>2</svg>")
+            self.assertEqual(list(cache._entries), [(frappe.local.site, "aa02")])
+            self.assertEqual(cache.get("aa01"), "<svg>1</svg>")
+            self.assertEqual(list(cache._entries), [(frappe.local.site, "aa01")])
+
+            # The disk tier drops the least recently used file first
+            os.utime(cache._get_path("aa02"), (0, 0))
+            cache.prune_disk()
+            self.assertTrue(os.path.exists(cache._get_path("aa01")))
+            self.assertFalse(os.path.exists(cache._get_path("aa02")))
+            self.assertIsNone(cache.get("aa02"))
+
+        # Keys depend on content, theme and version
+        key = get_cache_key(self.test_content)
+        self.assertEqual(key, get_cache_key(self.test_content, "default"))
+        self.assertNotEqual(key, get_cache_key(self.test_content, "dark"))
+        self.assertNotEqual(key, get_cache_key(self.test_content, version="0.0.0"))
+
+        # A cached SVG is returned without rendering
+        content = f"graph TD\n    A --> {random_string(8)}"
+        get_render_cache().set(get_cache_key(content), "<svg>cached</svg>")
+        self.assertEqual(render_cached(content), "<svg>cached</svg>")
+
+    def test_render_queue(self):
+        """Test the render job stores the SVG for the current content and skips up-to-date diagrams"""
+        from mermaid.render_cache import get_cache_key, get_render_cache
+        from mermaid.render_queue import render_diagram
+        from mermaid.svg_store import load_svg
+
+        def seed(content, label):
+            # the job renders through the cache, so a cached SVG stands in for the renderer
+            get_render_cache().set(get_cache_key(content), f'<svg xmlns="http://www.w3.org/2000/svg"><text>{label}</text></svg>')
+
+        content = f"graph TD\n    A --> {random_string(8)}"
+        seed(content, "first")
+        self.diagram.mermaid_content = content
+        self.diagram.save()
+
+        render_diagram(self.diagram.name)
+        svg_hash, source_hash = frappe.db.get_value(
+            "Mermaid Diagram", self.diagram.name, ["svg_hash", "rendered_source_hash"]
+        )
+        self.assertEqual(source_hash, get_cache_key(content))
+        self.assertIn("first", load_svg(svg_hash))
+
+        # Up to date: running again changes nothing
+        render_diagram(self.diagram.name)
+        self.assertEqual(frappe.db.get_value("Mermaid Diagram", self.diagram.name, "svg_hash"), svg_hash)
+
+        # Changed content gets a new SVG
+        self.diagram.reload()
+        self.diagram.mermaid_content = f"graph TD\n    B --> {random_string(8)}"
+        self.diagram.save()
+        seed(self.diagram.mermaid_content, "second")
+
+        render_diagram(self.diagram.name)
+        new_hash, source_hash = frappe.db.get_value(
+            "Mermaid Diagram", self.diagram.name, ["svg_hash", "rendered_source_hash"]
+        )
+        self.assertNotEqual(new_hash, svg_hash)
+        self.assertEqual(source_hash, get_cache_key(self.diagram.mermaid_content))
+        self.assertIn("second", load_svg(new_hash))
+
+    def test_thumbnails(self):
+        """Test thumbnails are named by SVG hash, served with the right caching and pruned when unused"""
+        import hashlib
+        import os
+
+        from mermaid.thumbnails import (
+            add_thumbnail_urls,
+            generate_thumbnail,
+            get_thumbnail,
+            get_thumbnail_path,
+            prune_unreferenced,
+        )
+
+        def make_thumbnail(svg_hash):
+            path = get_thumbnail_path(svg_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"image")
+            return path
+
+        svg_hash = hashlib.sha256(random_string(16).encode()).hexdigest()
+        unused_hash = hashlib.sha256(random_string(16).encode()).hexdigest()
+        frappe.db.set_value("Mermaid Diagram", self.diagram.name, "svg_hash", svg_hash, update_modified=False)
+
+        rows = add_thumbnail_urls([{"name": self.diagram.name, "svg_hash": svg_hash}, {"name": "x", "svg_hash": None}])
+        self.assertIn(f"v={svg_hash}", rows[0]["thumbnail_url"])
+        self.assertIsNone(rows[1]["thumbnail_url"])
+
+        path = make_thumbnail(svg_hash)
+        unused_path = make_thumbnail(unused_hash)
+        try:
+            # An existing thumbnail is returned as is, without rasterizing
+            self.assertEqual(generate_thumbnail(svg_hash), path)
+
+            response = get_thumbnail(self.diagram.name, v=svg_hash)
+            self.assertEqual(response.get_data(), b"image")
+            self.assertIn("immutable", response.headers["Cache-Control"])
+            self.assertEqual(get_thumbnail(self.diagram.name).headers["Cache-Control"], "private, no-cache")
+
+            # Only old thumbnails of SVGs no diagram uses are removed
+            os.utime(path, (0, 0))
+            os.utime(unused_path, (0, 0))
+            prune_unreferenced()
+            self.assertTrue(os.path.exists(path))
+            self.assertFalse(os.path.exists(unused_path))
+        finally:
+            for p in (path, unused_path):
+                if os.path.exists(p):
+                    os.remove(p)
@@ -0,0 +1,138 @@
+"""Write-behind drafts for the editors.
+
+Autosaves don't save the diagram. They go into the collaborative editing
+engine's redis state (`mermaid.collab`), which readers are served from at
+once and which is written to the diagram in one save:
+
+* when the diagram has been idle for `IDLE_FLUSH_SECONDS`,
+* at the latest `MAX_DIRTY_SECONDS` after the first unsaved edit,
+* or when the user saves explicitly (`flush_draft`).
+
+So an editing session costs a handful of saves instead of one per pause in
+typing.
+
+Every change to a draft is also journaled to
+`private/mermaid_drafts/<name hash>.json` (written to a temp file and renamed
+into place, so a journal is always complete). If redis loses the state before
+it is flushed, the engine rebuilds it from the journal, and `flush_dirty`
+saves journals whose state is gone. A journal is removed once its content
+has been saved.
+"""
+import hashlib
+import json
+import os
+import time
+
+import frappe
+
+from mermaid.metrics import instrument
+
+IDLE_FLUSH_SECONDS = 30
+MAX_DIRTY_SECONDS = 5 * 60
+
+
+def get_journal_dir():
+    return frappe.get_site_path("private", "mermaid_drafts")
+
+
+def get_journal_path(name):
+    return os.path.join(get_journal_dir(), hashlib.sha1(name.encode("utf-8")).hexdigest() + ".json")
+
+
+def write_journal(name, state):
+    path = get_journal_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {"name": name, "content": state["content"], "user": state.get("user"), "written_at": time.time()}, f
+        )
+    os.replace(tmp_path, path)
+
+
+def read_journal(name):
+    try:
+        with open(get_journal_path(name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def clear_journal(name):
+    try:
+        os.remove(get_journal_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def get_journaled_names():
+    try:
+        filenames = os.listdir(get_journal_dir())
+    except FileNotFoundError:
+        return []
+
+    names = []
+    for filename in filenames:
+        if filename.endswith(".json"):
+            try:
+                with open(os.path.join(get_journal_dir(), filename)) as f:
+                    names.append(json.load(f)["name"])
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+    return names
+
+
+def is_due(state, dirty_since, now=None):
+    """Whether a dirty diagram should be saved now"""
+    now = now or time.time()
+    return now - state.get("last_op", 0) >= IDLE_FLUSH_SECONDS or now - dirty_since >= MAX_DIRTY_SECONDS
+
+
+@frappe.whitelist(methods=["POST"])
+@instrument
+def save_draft(name, content):
+    """Autosave: merge `content` into the draft without saving the diagram"""
+    from mermaid.collab import replace_content
+
+    frappe.has_permission("Mermaid Diagram", "write", name, throw=True)
+    result = replace_content(name, content)
+
+    return {"status": "success", "version": result["seq"], "epoch": result["epoch"]}
+
+
+@frappe.whitelist()
+def get_draft(name):
+    """Current content, including edits not saved to the diagram yet"""
+    from mermaid.collab import read_state
+
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    state = read_state(name)
+    if state:
+        return {"content": state["content"], "unsaved": state["seq"] > state["persisted_seq"]}
+
+    journal = read_journal(name)
+    if journal:
+        return {"content": journal["content"], "unsaved": True}
+
+    return {"content": frappe.db.get_value("Mermaid Diagram", name, "mermaid_content"), "unsaved": False}
+
+
+@frappe.whitelist(methods=["POST"])
+@instrument
+def flush_draft(name, content=None, title=None):
+    """Explicit save: merge `content` if given and save the draft to the diagram now"""
+    from mermaid.collab import diagram_lock, flush_diagram, load_state, replace_content
+
+    frappe.has_permission("Mermaid Diagram", "write", name, throw=True)
+
+    if content is not None:
+        replace_content(name, content)
+    else:
+        with diagram_lock(name):
+            load_state(name)
+
+    flush_diagram(name, values={"title": title} if title else None, as_last_editor=False)
+
+    return {"status": "success", "modified": frappe.db.get_value("Mermaid Diagram", name, "modified")}
@@ -0,0 +1,68 @@
+"""Cacheable, read-only SVG endpoint for public diagrams.
+
+    /api/method/mermaid.embed.svg?name=<diagram>[&v=<svg_hash>]
+
+Only diagrams with `is_public` set are served; anything else is a 404, so the
+endpoint doesn't reveal which private diagrams exist. Responses carry a strong
+ETag derived from the SVG's content hash, and conditional requests are
+answered with 304. There is no Last-Modified: renders don't touch `modified`,
+so it would lag behind the SVG. Caches may keep a response for
+`mermaid_embed_max_age` seconds (shared caches for `mermaid_embed_s_maxage`);
+URLs that pin the hash with `v` never change and are cached as immutable.
+
+The stored gzip blob is sent as is to clients that accept gzip.
+"""
+import gzip
+from urllib.parse import quote
+
+import frappe
+from frappe.utils import cint
+from werkzeug.exceptions import NotFound
+from werkzeug.wrappers import Response
+
+DEFAULT_MAX_AGE = 60
+DEFAULT_S_MAXAGE = 300
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET", "HEAD"])
+def svg(name, v=None):
+    from mermaid.svg_store import load_svg_bytes
+
+    diagram = frappe.db.get_value(
+        "Mermaid Diagram", name, ["is_public", "svg_hash"], as_dict=True
+    )
+    if not diagram or not diagram.is_public or not diagram.svg_hash:
+        raise NotFound
+
+    blob = load_svg_bytes(diagram.svg_hash)
+    if not blob:
+        raise NotFound
+
+    gzipped = "gzip" in (frappe.request.headers.get("Accept-Encoding") or "")
+    response = Response(blob if gzipped else gzip.decompress(blob), mimetype="image/svg+xml")
+    if gzipped:
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+
+    # each encoding is its own representation, so each gets its own strong tag
+    response.set_etag(f"{diagram.svg_hash}-gzip" if gzipped else diagram.svg_hash)
+    response.headers["Cache-Control"] = get_cache_control(pinned=v == diagram.svg_hash)
+    # sandbox the SVG when it is opened directly rather than through <img>
+    response.headers["Content-Security-Policy"] = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+
+    return response.make_conditional(frappe.request)
+
+
+def get_cache_control(pinned=False):
+    if pinned:
+        return "public, max-age=31536000, immutable"
+
+    max_age = cint(frappe.conf.get("mermaid_embed_max_age") or DEFAULT_MAX_AGE)
+    s_maxage = cint(frappe.conf.get("mermaid_embed_s_maxage") or DEFAULT_S_MAXAGE)
+    return f"public, max-age={max_age}, s-maxage={s_maxage}"
+
+
+def get_embed_url(name, svg_hash=None):
+    """Embed URL for a public diagram, pinned to `svg_hash` when given"""
+    url = f"/api/method/mermaid.embed.svg?name={quote(name)}"
+    return f"{url}&v={svg_hash}" if svg_hash else url
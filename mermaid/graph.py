@@ -0,0 +1,233 @@
+"""Queryable node/edge index extracted from diagram source.
+
+On save, the nodes and edges of flowchart, class, state and ER diagrams are
+written to the `Mermaid Diagram Node` / `Mermaid Diagram Edge` doctypes,
+keyed by diagram and with indexed id and label columns. They are separate
+doctypes rather than child tables so that loading a diagram doesn't load its
+index. The whitelisted functions below answer "which diagrams reference X"
+and "what points to / is near X" from those tables instead of scanning
+`mermaid_content`.
+"""
+import frappe
+from frappe.utils import cint, now
+from pypika.terms import Tuple
+
+from mermaid.parser import parse as parse_mermaid
+
+NODE_DOCTYPE = "Mermaid Diagram Node"
+EDGE_DOCTYPE = "Mermaid Diagram Edge"
+INDEXED_TYPES = {"Flowchart", "Class Diagram", "State Diagram", "Entity Relationship Diagram"}
+MAX_DEPTH = 3
+MAX_EDGES = 1000
+MAX_MATCHES = 1000
+LABEL_LENGTH = 140
+# start/end pseudo-states are not nodes one diagram shares with another
+PSEUDO_NODES = {"[*]"}
+
+
+def get_graph_rows(content):
+    """Node and edge rows for the index"""
+    result = parse_mermaid(content or "")
+    if result["diagram_type"] not in INDEXED_TYPES:
+        return [], []
+
+    nodes = [
+        {"node_id": node_id[:LABEL_LENGTH], "label": (label or "")[:LABEL_LENGTH]}
+        for node_id, label in result["nodes"]
+        if node_id not in PSEUDO_NODES
+    ]
+    edges = [
+        {"source": source[:LABEL_LENGTH], "target": target[:LABEL_LENGTH], "label": (label or "")[:LABEL_LENGTH]}
+        for source, target, label in result["edges"]
+    ]
+    return nodes, edges
+
+
+def update_graph_index(diagram, content):
+    """Replace the index rows of `diagram` with the nodes and edges of `content`"""
+    frappe.db.delete(NODE_DOCTYPE, {"diagram": diagram})
+    frappe.db.delete(EDGE_DOCTYPE, {"diagram": diagram})
+
+    nodes, edges = get_graph_rows(content)
+    timestamp = now()
+    user = frappe.session.user
+    common = ["name", "creation", "modified", "owner", "modified_by", "diagram"]
+
+    def values(row):
+        return [frappe.generate_hash(), timestamp, timestamp, user, user, diagram, *row.values()]
+
+    if nodes:
+        frappe.db.bulk_insert(NODE_DOCTYPE, [*common, "node_id", "label"], [values(row) for row in nodes])
+    if edges:
+        frappe.db.bulk_insert(EDGE_DOCTYPE, [*common, "source", "target", "label"], [values(row) for row in edges])
+
+
+def rebuild_graph_index(batch_size=500):
+    """Re-extract the index of every diagram"""
+    frappe.db.delete(NODE_DOCTYPE)
+    frappe.db.delete(EDGE_DOCTYPE)
+
+    start = 0
+    while True:
+        diagrams = frappe.get_all(
+            "Mermaid Diagram",
+            fields=["name", "mermaid_content"],
+            order_by="name",
+            limit_start=start,
+            limit_page_length=batch_size,
+        )
+        if not diagrams:
+            break
+        for diagram in diagrams:
+            update_graph_index(diagram.name, diagram.mermaid_content)
+        frappe.db.commit()
+        start += batch_size
+
+
+def on_diagram_update(doc, method=None):
+    if doc.has_value_changed("mermaid_content"):
+        update_graph_index(doc.name, doc.mermaid_content)
+
+
+def on_diagram_trash(doc, method=None):
+    frappe.db.delete(NODE_DOCTYPE, {"diagram": doc.name})
+    frappe.db.delete(EDGE_DOCTYPE, {"diagram": doc.name})
+
+
+def readable_condition():
+    """SQL restricting `tabMermaid Diagram` to what the session user may read, or None if nothing is"""
+    from mermaid.permissions import get_permission_query_conditions
+
+    if not frappe.has_permission("Mermaid Diagram", "read"):
+        return None
+    conditions = get_permission_query_conditions()
+    return f"and {conditions}" if conditions else ""
+
+
+def match_nodes(node, diagram=None, limit=MAX_MATCHES):
+    """Readable (diagram, node_id) pairs whose id or label is exactly `node`
+
+    Permissions are part of the query, so the limit counts readable rows only.
+    """
+    condition = readable_condition()
+    if condition is None:
+        return []
+
+    return frappe.db.sql(
+        f"""
+        select node.diagram, node.node_id, node.label
+        from `tab{NODE_DOCTYPE}` node
+        inner join `tabMermaid Diagram` on `tabMermaid Diagram`.name = node.diagram
+        where (node.node_id = %(node)s or node.label = %(node)s)
+            {"and node.diagram = %(diagram)s" if diagram else ""}
+            {condition}
+        limit %(limit)s
+        """,
+        {"node": node, "diagram": diagram, "limit": cint(limit)},
+        as_dict=True,
+    )
+
+
+@frappe.whitelist()
+def find_diagrams_referencing(node, limit=50):
+    """Diagrams containing a node whose id or label is `node`"""
+    condition = readable_condition()
+    if condition is None:
+        return []
+
+    return frappe.db.sql(
+        f"""
+        select `tabMermaid Diagram`.name, `tabMermaid Diagram`.title,
+            `tabMermaid Diagram`.diagram_type, `tabMermaid Diagram`.modified
+        from `tabMermaid Diagram`
+        where exists (
+            select 1 from `tab{NODE_DOCTYPE}` node
+            where node.diagram = `tabMermaid Diagram`.name
+                and (node.node_id = %(node)s or node.label = %(node)s)
+        )
+            {condition}
+        order by `tabMermaid Diagram`.modified desc
+        limit %(limit)s
+        """,
+        {"node": node, "limit": min(cint(limit) or 50, MAX_MATCHES)},
+        as_dict=True,
+    )
+
+
+@frappe.whitelist()
+def get_incoming_edges(node, diagram=None):
+    """Edges pointing at `node` (matched by id or label), across all readable diagrams"""
+    return get_edges(node, "target", diagram)
+
+
+@frappe.whitelist()
+def get_outgoing_edges(node, diagram=None):
+    """Edges leaving `node` (matched by id or label), across all readable diagrams"""
+    return get_edges(node, "source", diagram)
+
+
+def get_edges(node, column, diagram=None):
+    """Edges whose `column` end is a node matching `node`, in one join"""
+    condition = readable_condition()
+    if condition is None:
+        return []
+
+    return frappe.db.sql(
+        f"""
+        select distinct edge.name, edge.diagram, edge.source, edge.target, edge.label
+        from `tab{EDGE_DOCTYPE}` edge
+        inner join `tab{NODE_DOCTYPE}` node on node.diagram = edge.diagram and node.node_id = edge.`{column}`
+        inner join `tabMermaid Diagram` on `tabMermaid Diagram`.name = edge.diagram
+        where (node.node_id = %(node)s or node.label = %(node)s)
+            {"and edge.diagram = %(diagram)s" if diagram else ""}
+            {condition}
+        limit %(limit)s
+        """,
+        {"node": node, "diagram": diagram, "limit": MAX_EDGES},
+        as_dict=True,
+    )
+
+
+@frappe.whitelist()
+def get_node_neighborhood(node, depth=1, diagram=None):
+    """Nodes and edges within `depth` hops of `node`, following edges both ways
+
+    Nodes are identified by id within each diagram; the walk starts from every
+    readable node whose id or label matches `node` and never leaves its
+    diagram, so everything it reaches is readable. Each hop is a single query.
+    """
+    depth = min(max(cint(depth), 1), MAX_DEPTH)
+    frontier = {(m.diagram, m.node_id) for m in match_nodes(node, diagram)}
+    seen_nodes = set(frontier)
+    edges = {}
+    Edge = frappe.qb.DocType(EDGE_DOCTYPE)
+
+    for _ in range(depth):
+        if not frontier or len(edges) >= MAX_EDGES:
+            break
+
+        pairs = [Tuple(*pair) for pair in frontier]
+        rows = (
+            frappe.qb.from_(Edge)
+            .where(Tuple(Edge.diagram, Edge.source).isin(pairs) | Tuple(Edge.diagram, Edge.target).isin(pairs))
+            .select(Edge.name, Edge.diagram, Edge.source, Edge.target, Edge.label)
+            .limit(MAX_EDGES - len(edges))
+            .run(as_dict=True)
+        )
+
+        next_frontier = set()
+        for row in rows:
+            edges[row.name] = row
+            for node_id in (row.source, row.target):
+                if (row.diagram, node_id) not in seen_nodes:
+                    seen_nodes.add((row.diagram, node_id))
+                    next_frontier.add((row.diagram, node_id))
+        frontier = next_frontier
+
+    return {
+        "nodes": [{"diagram": diagram, "node_id": node_id} for diagram, node_id in seen_nodes],
+        "edges": [
+            {"diagram": e.diagram, "source": e.source, "target": e.target, "label": e.label}
+            for e in edges.values()
+        ],
+    }
@@ -10,17 +10,14 @@ app_license = "mit"
 
 
 # Includes in <head>
-# Only include mermaid-init.js if needed
+# Mermaid is not included globally: pages with diagrams load
+# /assets/mermaid/js/mermaid-loader.js, which fetches it on demand
 app_include_css = ["mermaid.bundle.css"]
-app_include_js = [
-    "/assets/mermaid/js/mermaid-init.js"
-]
+app_include_js = []
 
 # Include js, css files in header of web template
 web_include_css = []
-web_include_js = [
-    "/assets/mermaid/js/mermaid-init.js"
-]
+web_include_js = []
 
 # Website route rules
 website_route_rules = [
@@ -38,23 +35,25 @@ fixtures = [
 
 # Scheduled Tasks
 scheduler_events = {
-    # "all": [
-    #     "mermaid.tasks.all"
-    # ],
-    # "daily": [
-    #     "mermaid.tasks.daily"
-    # ],
-    # "hourly": [
-    #     "mermaid.tasks.hourly"
-    # ],
-    # "weekly": [
-    #     "mermaid.tasks.weekly"
-    # ]
-    # "monthly": [
-    #     "mermaid.tasks.monthly"
-    # ]
+    "cron": {
+        "* * * * *": [
+            "mermaid.collab.flush_dirty"
+        ]
+    },
+    "daily": [
+        "mermaid.stats.reconcile",
+        "mermaid.revisions.compact_revisions"
+    ],
+    "weekly": [
+        "mermaid.svg_store.prune_unreferenced",
+        "mermaid.thumbnails.prune_unreferenced"
+    ]
 }
 
+# Installation
+after_install = "mermaid.install.after_install"
+after_migrate = "mermaid.install.after_migrate"
+
 # Testing
 before_tests = "mermaid.install.before_tests"
 
@@ -65,10 +64,32 @@ override_doctype_methods = {
     }
 }
 
-# Real-time events
+# Permissions: owner, public or shared (see mermaid.permissions)
+permission_query_conditions = {
+    "Mermaid Diagram": "mermaid.permissions.get_permission_query_conditions"
+}
+
+has_permission = {
+    "Mermaid Diagram": "mermaid.permissions.has_permission"
+}
+
+# Document Events
 doc_events = {
     "Mermaid Diagram": {
-        "on_update": "mermaid.mermaid.doctype.mermaid_diagram.mermaid_diagram.broadcast_update"
+        "on_update": [
+            "mermaid.search.on_diagram_update",
+            "mermaid.stats.on_diagram_update",
+            "mermaid.revisions.on_diagram_update",
+            "mermaid.graph.on_diagram_update",
+            "mermaid.collab.on_diagram_update"
+        ],
+        "on_trash": [
+            "mermaid.search.on_diagram_trash",
+            "mermaid.stats.on_diagram_trash",
+            "mermaid.revisions.on_diagram_trash",
+            "mermaid.graph.on_diagram_trash",
+            "mermaid.collab.on_diagram_trash"
+        ]
     }
 }
 # Apps
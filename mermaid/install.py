@@ -0,0 +1,33 @@
+import frappe
+
+
+def after_install():
+    ensure_studio_page()
+
+
+def after_migrate():
+    from mermaid.studio import clear_studio_assets
+
+    ensure_studio_page()
+    # migrate runs on every deploy, right after the frontend is rebuilt
+    clear_studio_assets()
+
+
+def before_tests():
+    ensure_studio_page()
+
+
+def ensure_studio_page():
+    """Create the Mermaid Studio page if the standard page sync hasn't"""
+    if frappe.db.exists("Page", "mermaid"):
+        return
+
+    frappe.get_doc({
+        "doctype": "Page",
+        "name": "mermaid",
+        "page_name": "mermaid",
+        "title": "Mermaid Studio",
+        "icon": "box",
+        "module": "Mermaid",
+        "standard": "Yes",
+    }).insert(ignore_permissions=True)
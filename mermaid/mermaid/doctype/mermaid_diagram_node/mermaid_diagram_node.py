@@ -0,0 +1,6 @@
+import frappe
+from frappe.model.document import Document
+
+class MermaidDiagramNode(Document):
+    """Graph index row maintained by mermaid.graph"""
+    pass
@@ -0,0 +1,6 @@
+import frappe
+from frappe.model.document import Document
+
+class MermaidDiagramRevision(Document):
+    """Stored content revision maintained by mermaid.revisions; rows are named `<diagram>-<revision>`"""
+    pass
@@ -0,0 +1,6 @@
+import frappe
+from frappe.model.document import Document
+
+class MermaidDiagramStat(Document):
+    """Rollup counter maintained by mermaid.stats; rows are named `<stat_type>:<stat_key>`"""
+    pass
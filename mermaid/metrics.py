@@ -0,0 +1,264 @@
+"""Instrumentation and metrics export for the Mermaid API.
+
+`instrument` wraps a whitelisted method and records per method: calls and
+errors, a latency histogram, the database queries it ran and the time spent
+in them, and the size of the strings it received and returned (content,
+SVGs, deltas). Realtime publishes (`mermaid.realtime`) and render worker
+jobs (`mermaid.renderer`) are recorded as well.
+
+Everything is a counter in one redis hash per site, so all worker processes
+add to the same numbers; a call's samples are written in a single round
+trip when it returns. `prometheus` serves them in the Prometheus text format
+to System Managers, or to scrapers passing `token=<mermaid_metrics_token>`.
+Set `mermaid_metrics` to 0 in site config to stop recording.
+
+Slow calls can be profiled: with `mermaid_profile_slow_ms` set, a
+`mermaid_profile_sample_rate` share of calls (default 0.01) runs under
+cProfile, and the stats of those slower than the threshold are dumped to
+`private/mermaid_profiles/` for `python -m pstats`.
+"""
+import cProfile
+import functools
+import hmac
+import os
+import random
+import re
+import time
+
+import frappe
+from frappe.utils import cint, flt
+from werkzeug.wrappers import Response
+
+METRICS_KEY = "mermaid_metrics"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+DEFAULT_PROFILE_SAMPLE_RATE = 0.01
+
+METRICS = {
+    "mermaid_api_calls_total": ("counter", "Calls of instrumented Mermaid API methods"),
+    "mermaid_api_errors_total": ("counter", "Calls that raised an exception"),
+    "mermaid_api_duration_seconds": ("histogram", "Time spent in the method"),
+    "mermaid_api_db_queries_total": ("counter", "Database queries run by the method"),
+    "mermaid_api_db_seconds_total": ("counter", "Time spent in database queries"),
+    "mermaid_api_request_bytes": ("histogram", "Size of the string arguments"),
+    "mermaid_api_response_bytes": ("histogram", "Size of the strings in the response"),
+    "mermaid_realtime_publishes_total": ("counter", "Realtime messages published"),
+    "mermaid_render_duration_seconds": ("histogram", "Time the render workers took per job"),
+}
+
+LE_PATTERN = re.compile(r',?le="([^"]*)"')
+
+
+def is_enabled():
+    return cint(frappe.conf.get("mermaid_metrics", 1))
+
+
+def sample_name(name, labels=None):
+    if not labels:
+        return name
+    # histogram buckets keep `le` last, as Prometheus clients write it
+    keys = sorted(labels, key=lambda key: (key == "le", key))
+    return name + "{" + ",".join(f'{key}="{labels[key]}"' for key in keys) + "}"
+
+
+def counter_samples(name, labels=None, amount=1):
+    return [(sample_name(name, labels), amount)]
+
+
+def histogram_samples(name, value, labels=None, buckets=LATENCY_BUCKETS):
+    labels = labels or {}
+    samples = [
+        (sample_name(f"{name}_bucket", {**labels, "le": str(le)}), 1) for le in buckets if value <= le
+    ]
+    samples.append((sample_name(f"{name}_bucket", {**labels, "le": "+Inf"}), 1))
+    samples.append((sample_name(f"{name}_sum", labels), value))
+    samples.append((sample_name(f"{name}_count", labels), 1))
+    return samples
+
+
+def record(samples):
+    """Add `samples` to the counters, together with the running call's if there is one"""
+    if not is_enabled():
+        return
+
+    call = getattr(frappe.local, "mermaid_metrics_call", None)
+    if call is not None:
+        call["samples"].extend(samples)
+    else:
+        write_samples(samples)
+
+
+def write_samples(samples):
+    cache = frappe.cache()
+    key = cache.make_key(METRICS_KEY)
+    pipeline = cache.pipeline()
+    for field, amount in samples:
+        pipeline.hincrbyfloat(key, field, amount)
+    try:
+        pipeline.execute()
+    except Exception:
+        # losing a few samples is better than failing the request
+        frappe.logger("mermaid").warning("Could not record Mermaid metrics", exc_info=True)
+
+
+def count_publish(event):
+    record(counter_samples("mermaid_realtime_publishes_total", {"event": event}))
+
+
+def observe_render(op, seconds):
+    record(histogram_samples("mermaid_render_duration_seconds", seconds, {"op": op}))
+
+
+def payload_size(value):
+    """Bytes of the strings in `value`, looking into dicts and lists"""
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(payload_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    return 0
+
+
+def instrument(fn):
+    """Record metrics for each call of `fn`; goes under `@frappe.whitelist()`
+
+    Calls made from inside another instrumented call are counted as part of
+    the outer one.
+    """
+    method = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not is_enabled() or getattr(frappe.local, "mermaid_metrics_call", None) is not None:
+            return fn(*args, **kwargs)
+
+        call = frappe.local.mermaid_metrics_call = {"samples": [], "queries": 0, "query_time": 0.0}
+        # time queries the way frappe.recorder does, by wrapping frappe.db.sql
+        sql = frappe.db.sql
+
+        def timed_sql(*sql_args, **sql_kwargs):
+            start = time.perf_counter()
+            try:
+                return sql(*sql_args, **sql_kwargs)
+            finally:
+                call["queries"] += 1
+                call["query_time"] += time.perf_counter() - start
+
+        frappe.db.sql = timed_sql
+        profiler = start_profiler()
+        labels = {"method": method}
+        samples = histogram_samples(
+            "mermaid_api_request_bytes", payload_size([args, kwargs]), labels, SIZE_BUCKETS
+        )
+
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            samples += histogram_samples(
+                "mermaid_api_response_bytes", payload_size(result), labels, SIZE_BUCKETS
+            )
+            return result
+        except Exception:
+            samples += counter_samples("mermaid_api_errors_total", labels)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            frappe.db.sql = sql
+            frappe.local.mermaid_metrics_call = None
+            if profiler:
+                stop_profiler(profiler, method, duration)
+
+            samples += counter_samples("mermaid_api_calls_total", labels)
+            samples += histogram_samples("mermaid_api_duration_seconds", duration, labels)
+            samples += counter_samples("mermaid_api_db_queries_total", labels, call["queries"])
+            samples += counter_samples("mermaid_api_db_seconds_total", labels, call["query_time"])
+            write_samples(call["samples"] + samples)
+
+    return wrapper
+
+
+def start_profiler():
+    if not flt(frappe.conf.get("mermaid_profile_slow_ms")):
+        return None
+    if random.random() >= flt(frappe.conf.get("mermaid_profile_sample_rate", DEFAULT_PROFILE_SAMPLE_RATE)):
+        return None
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler (frappe.recorder, a debugger) is already active
+        return None
+    return profiler
+
+
+def stop_profiler(profiler, method, duration):
+    profiler.disable()
+    if duration * 1000 < flt(frappe.conf.get("mermaid_profile_slow_ms")):
+        return
+
+    directory = frappe.get_site_path("private", "mermaid_profiles")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{method}-{int(time.time() * 1000)}.prof")
+    profiler.dump_stats(path)
+    frappe.logger("mermaid").info(f"{method} took {duration * 1000:.0f}ms, profile written to {path}")
+
+
+def read_metrics():
+    cache = frappe.cache()
+    return {
+        frappe.safe_decode(field): float(value)
+        for field, value in cache.hscan_iter(cache.make_key(METRICS_KEY))
+    }
+
+
+def reset_metrics():
+    cache = frappe.cache()
+    cache.delete(cache.make_key(METRICS_KEY))
+
+
+def metric_of(field):
+    name = field.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in METRICS:
+            return name[: -len(suffix)]
+    return name
+
+
+def render_prometheus(samples):
+    """Prometheus text exposition of `samples` ({sample name: value})"""
+
+    def sort_key(field):
+        # buckets in numeric `le` order, after the other labels
+        match = LE_PATTERN.search(field)
+        return LE_PATTERN.sub("", field), float(match.group(1)) if match else 0.0
+
+    grouped = {}
+    for field in samples:
+        grouped.setdefault(metric_of(field), []).append(field)
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        if name not in grouped:
+            continue
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for field in sorted(grouped[name], key=sort_key):
+            value = samples[field]
+            lines.append(f"{field} {int(value) if value.is_integer() else repr(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+def prometheus(token=None):
+    """Metrics in the Prometheus text format"""
+    expected = frappe.conf.get("mermaid_metrics_token")
+    if not (expected and token and hmac.compare_digest(str(token), str(expected))):
+        frappe.only_for("System Manager")
+
+    response = Response(render_prometheus(read_metrics()))
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
@@ -0,0 +1,151 @@
+"""Operational transformation for plain text.
+
+An operation is a list of components walked over the whole text:
+
+* a positive int retains that many code units,
+* a negative int deletes that many,
+* a string is inserted.
+
+Lengths are UTF-16 code units, like the splice deltas in `mermaid.delta`, so
+that the browser (JavaScript strings) and the server agree on positions. The
+same functions are implemented in the form script.
+"""
+
+
+def _units(text):
+    return (text or "").encode("utf-16-le")
+
+
+def text_length(text):
+    return len(_units(text)) // 2
+
+
+def _push(op, component):
+    """Append `component` to `op`, merging it into the last one when they are alike"""
+    if not component:
+        return
+    if op:
+        last = op[-1]
+        if isinstance(component, str) and isinstance(last, str):
+            op[-1] = last + component
+            return
+        if isinstance(component, int) and isinstance(last, int) and (component > 0) == (last > 0):
+            op[-1] = last + component
+            return
+    op.append(component)
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def check(op):
+    """Raise ValueError unless `op` is a list of non-zero ints and strings"""
+    if not isinstance(op, list):
+        raise ValueError("Operation must be a list")
+    for component in op:
+        if not (isinstance(component, str) or (_is_int(component) and component)):
+            raise ValueError("Operation components must be non-zero integers or strings")
+    return op
+
+
+def from_delta(length, delta):
+    """Operation for a `[position, delete_count, insert]` splice on a text of `length` units"""
+    op = []
+    if not delta:
+        _push(op, length)
+        return op
+
+    if not (isinstance(delta, (list, tuple)) and len(delta) == 3):
+        raise ValueError("Delta must be [position, delete_count, insert]")
+    position, delete_count, inserted = delta
+    if not (_is_int(position) and _is_int(delete_count) and isinstance(inserted, (str, type(None)))):
+        raise ValueError("Delta must be [position, delete_count, insert]")
+    if not (0 <= position <= length and 0 <= delete_count <= length - position):
+        raise ValueError("Delta does not apply to this text")
+
+    _push(op, position)
+    _push(op, -delete_count)
+    _push(op, inserted or "")
+    _push(op, length - position - delete_count)
+    return op
+
+
+def base_length(op):
+    """Length of the text `op` applies to"""
+    return sum(abs(c) for c in op if isinstance(c, int))
+
+
+def target_length(op):
+    """Length of the text `op` produces"""
+    return sum(text_length(c) if isinstance(c, str) else c for c in op if isinstance(c, str) or c > 0)
+
+
+def apply(text, op):
+    units = _units(text)
+    if base_length(op) != len(units) // 2:
+        raise ValueError("Operation does not apply to this text")
+
+    pieces = []
+    position = 0
+    for component in op:
+        if isinstance(component, str):
+            pieces.append(_units(component))
+        elif component > 0:
+            pieces.append(units[position * 2:(position + component) * 2])
+            position += component
+        else:
+            position -= component
+
+    return b"".join(pieces).decode("utf-16-le")
+
+
+def _shrink(component, by):
+    return component - by if component > 0 else component + by
+
+
+def transform(a, b):
+    """`(a', b')` for concurrent `a` and `b` such that a + b' == b + a'
+
+    When both insert at the same position, `a`'s text ends up first.
+    """
+    if base_length(a) != base_length(b):
+        raise ValueError("Operations do not apply to the same text")
+
+    a_prime, b_prime = [], []
+    a_iter, b_iter = iter(a), iter(b)
+    op1, op2 = next(a_iter, None), next(b_iter, None)
+
+    while op1 is not None or op2 is not None:
+        if isinstance(op1, str):
+            _push(a_prime, op1)
+            _push(b_prime, text_length(op1))
+            op1 = next(a_iter, None)
+            continue
+        if isinstance(op2, str):
+            _push(a_prime, text_length(op2))
+            _push(b_prime, op2)
+            op2 = next(b_iter, None)
+            continue
+
+        if op1 > 0 and op2 > 0:
+            size = min(op1, op2)
+            _push(a_prime, size)
+            _push(b_prime, size)
+        elif op1 < 0 and op2 < 0:
+            # both deleted the same text
+            size = min(-op1, -op2)
+        elif op1 < 0:
+            size = min(-op1, op2)
+            _push(a_prime, -size)
+        else:
+            size = min(op1, -op2)
+            _push(b_prime, -size)
+
+        op1, op2 = _shrink(op1, size), _shrink(op2, size)
+        if op1 == 0:
+            op1 = next(a_iter, None)
+        if op2 == 0:
+            op2 = next(b_iter, None)
+
+    return a_prime, b_prime
@@ -0,0 +1,572 @@
+"""Single-pass tokenizer and parser for Mermaid source.
+
+`parse` walks the source once, line by line. It skips YAML front-matter,
+`%%{init}%%` directives and `%%` comments (whole-line or trailing), joins
+quoted labels that span lines, detects the diagram type from the
+header and, for flowchart, sequence, class, state and ER diagrams, builds a
+compact AST of nodes and edges. Syntax problems are collected with 1-based
+line and column positions instead of being raised; Mermaid itself remains the
+final authority on what renders.
+
+Results are memoized by content hash, so re-validating unchanged content on
+every save costs a dictionary lookup and a shallow copy; each caller gets its
+own copy.
+
+This module deliberately does not import frappe, so it can be benchmarked and
+used outside a site.
+"""
+import hashlib
+import re
+from collections import OrderedDict
+
+# header keyword (lowercase) -> Diagram Type option on Mermaid Diagram
+DIAGRAM_TYPES = {
+    "graph": "Flowchart",
+    "flowchart": "Flowchart",
+    "flowchart-elk": "Flowchart",
+    "sequencediagram": "Sequence Diagram",
+    "classdiagram": "Class Diagram",
+    "classdiagram-v2": "Class Diagram",
+    "statediagram": "State Diagram",
+    "statediagram-v2": "State Diagram",
+    "erdiagram": "Entity Relationship Diagram",
+    "journey": "User Journey",
+    "gantt": "Gantt Chart",
+    "pie": "Pie Chart",
+    "gitgraph": "Gitgraph",
+    "c4context": "C4 Context",
+    "c4container": "C4 Context",
+    "c4component": "C4 Context",
+    "c4dynamic": "C4 Context",
+    "c4deployment": "C4 Context",
+    "mindmap": "Mindmap",
+    "timeline": "Timeline",
+    "zenuml": "ZenUML",
+    "sankey": "Sankey",
+    "sankey-beta": "Sankey",
+}
+
+CACHE_SIZE = 256
+# a quoted label left open on a line continues on the next ones, up to this many
+MAX_LABEL_LINES = 20
+
+HEADER_RE = re.compile(r"[A-Za-z][\w-]*")
+# `-` and `.` only continue an id when a word character follows, so `A-->B` is A, -->, B
+NODE_ID_RE = re.compile(r"\w+(?:[.-]\w+)*", re.UNICODE)
+WHITESPACE_RE = re.compile(r"\s*")
+# `"` toggles quoting; `%%` outside quotes (but not `%%{`) starts a comment
+COMMENT_OR_QUOTE_RE = re.compile(r'"|%%(?!\{)')
+# characters a quoted node or edge label opens after: `A["`, `A("`, `-->|"`, ...
+LABEL_OPENERS = "[({|>/\\"
+
+# node shapes, longest opening first; a shape may have several valid closings
+NODE_SHAPES = (
+    ("(((", (")))",)),
+    ("((", ("))",)),
+    ("([", ("])",)),
+    ("[[", ("]]",)),
+    ("[(", (")]",)),
+    ("[/", ("/]", "\\]")),
+    ("[\\", ("\\]", "/]")),
+    ("{{", ("}}",)),
+    ("[", ("]",)),
+    ("(", (")",)),
+    ("{", ("}",)),
+    (">", ("]",)),
+)
+
+# `A -- text --> B` / `A == text ==> B` / `A -. text .-> B`; the text may start
+# with `-` (`A -- -1 --> B`) as long as it isn't a link itself
+TEXT_LINK_RE = re.compile(
+    r"\s*<?(?:--|==|-\.)\s+((?!-{2,}|-\.|={2,}|-+>)\S.*?)\s+(?:-{2,}[>ox]?|={2,}[>ox]?|\.-[>ox]?|\.+->)",
+    re.DOTALL,
+)
+# `-->`, `---`, `==>`, `-.->`, `~~~`, `<-->`, `--o`, `--x`, optionally followed by `|text|`
+LINK_RE = re.compile(r"\s*(<?(?:-{2,}|={2,}|-\.+-|~{3,})[>ox]?)(?:\s*\|([^|]*)\|)?")
+# `A e1@--> B`: an edge id in front of the link
+EDGE_ID_RE = re.compile(r"\s*\w+@(?=[-=.~<])")
+
+FLOWCHART_KEYWORDS = {"subgraph", "end", "direction", "style", "classdef", "class", "click", "linkstyle"}
+
+SEQUENCE_MESSAGE_RE = re.compile(
+    r"^([^\s:>][^:>]*?)\s*(<<-->>|<<->>|-->>|->>|--x|-x|--\)|-\)|-->|->)\s*[+-]?\s*([^:]+?)\s*:(.*)$"
+)
+SEQUENCE_PARTICIPANT_RE = re.compile(r"^(?:participant|actor)\s+(\S+)(?:\s+as\s+(.+))?$", re.IGNORECASE)
+
+CLASS_RELATION_RE = re.compile(
+    r'^([\w.~<>,-]+)\s*(?:"[^"]*"\s*)?'
+    r"(<\|--|<\|\.\.|\*--|o--|<--|<\.\.|--\|>|\.\.\|>|--\*|--o|-->|\.\.>|--|\.\.)"
+    r'\s*(?:"[^"]*"\s*)?([\w.~<>,-]+)\s*(?::\s*(.*))?$'
+)
+CLASS_DECLARATION_RE = re.compile(r"^class\s+([\w.~<>,-]+)(?:\s*\[\"?(.*?)\"?\])?\s*(\{)?\s*$")
+
+STATE_TRANSITION_RE = re.compile(r"^(\[\*\]|[\w.-]+)\s*-->\s*(\[\*\]|[\w.-]+)\s*(?::\s*(.*))?$")
+STATE_DECLARATION_RE = re.compile(r'^state\s+(?:"([^"]*)"\s+as\s+)?([\w.-]+)(?:\s*<<\w+>>)?\s*(\{)?\s*$')
+STATE_DESCRIPTION_RE = re.compile(r"^([\w.-]+)\s*:\s*(.+)$")
+
+ER_RELATION_RE = re.compile(
+    r"^([\w-]+)\s+([|}o][|o]|[|o][|{])(--|\.\.)([|o][|{]|[|}o][|o])\s+([\w-]+)\s*:\s*(.+)$"
+)
+ER_ENTITY_RE = re.compile(r"^([\w-]+)(?:\s*\[\"?(.*?)\"?\])?\s*(\{)?\s*$")
+
+_cache = OrderedDict()
+
+
+class MermaidSyntaxError(Exception):
+    def __init__(self, message, column):
+        super().__init__(message)
+        self.column = column
+
+
+def parse(content):
+    """Parse mermaid source and return its (memoized) AST"""
+    key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+    result = _cache.get(key)
+    if result is not None:
+        _cache.move_to_end(key)
+        return copy_result(result)
+
+    result = parse_lines(content.splitlines())
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return copy_result(result)
+
+
+def copy_result(result):
+    """A copy of `result` that can be changed without touching the cached one"""
+    return {
+        **result,
+        "nodes": [list(node) for node in result["nodes"]],
+        "edges": [list(edge) for edge in result["edges"]],
+        "errors": [dict(error) for error in result["errors"]],
+    }
+
+
+def parse_lines(lines):
+    """Parse an iterable of source lines without caching
+
+    The AST is a dict with:
+
+    * `empty` - True when the source holds no statements
+    * `diagram_type` - a Diagram Type option, or None if the header is unknown
+    * `keyword` and `direction` from the header line
+    * `nodes` - list of `[id, label]`, in order of first appearance
+    * `edges` - list of `[source, target, label]`
+    * `statements` - number of statements after the header
+    * `errors` - list of `{"line", "column", "message"}`
+    """
+    result = {
+        "empty": True,
+        "diagram_type": None,
+        "keyword": None,
+        "direction": None,
+        "nodes": [],
+        "edges": [],
+        "statements": 0,
+        "errors": [],
+    }
+    builder = None
+
+    for line_no, column, text in tokenize(lines, result["errors"]):
+        if result["empty"]:
+            result["empty"] = False
+            builder = start_diagram(result, line_no, column, text)
+            continue
+
+        result["statements"] += 1
+        if builder:
+            builder.line_no = line_no
+            try:
+                builder.statement(text)
+            except MermaidSyntaxError as e:
+                add_error(result["errors"], line_no, column + e.column, str(e))
+
+    if builder:
+        builder.finish(result)
+
+    return result
+
+
+def tokenize(lines, errors):
+    """Yield `(line_no, column, text)` for each statement
+
+    Front-matter, directives, comments and blank lines are skipped; `column` is
+    the 1-based column the stripped `text` starts at. A statement whose quoted
+    label is still open at the end of the line is joined with the following
+    lines (by newlines) until the quote closes.
+    """
+    lines = lines if isinstance(lines, list) else list(lines)
+    in_front_matter = in_directive = False
+    start_line = 0
+    seen_statement = False
+    pending = None
+    index = 0
+
+    while index < len(lines) or pending:
+        if index >= len(lines) or (pending and len(pending["parts"]) >= MAX_LABEL_LINES):
+            # the quote never closes: take the line on its own, which reports
+            # it, and carry on from the line after it
+            yield pending["line_no"], pending["column"], pending["parts"][0]
+            index, pending = pending["line_no"], None
+            continue
+
+        line_no, line = index + 1, lines[index]
+        index += 1
+
+        if pending:
+            pending["parts"].append(line.strip())
+            text, open_quote = strip_comment("\n".join(pending["parts"]))
+            if open_quote == -1:
+                yield pending["line_no"], pending["column"], text
+                pending = None
+            continue
+
+        text = line.strip()
+
+        if in_front_matter:
+            if text == "---":
+                in_front_matter = False
+            continue
+
+        if in_directive:
+            if "}%%" in text:
+                in_directive = False
+            continue
+
+        if not text:
+            continue
+
+        if text == "---" and not seen_statement:
+            in_front_matter, start_line = True, line_no
+            continue
+
+        if text.startswith("%%{"):
+            if "}%%" not in text:
+                in_directive, start_line = True, line_no
+            continue
+
+        if text.startswith("%%"):
+            continue
+
+        seen_statement = True
+        column = len(line) - len(line.lstrip()) + 1
+        text, open_quote = strip_comment(text)
+        if open_quote != -1 and text[:open_quote].rstrip()[-1:] in LABEL_OPENERS:
+            pending = {"line_no": line_no, "column": column, "parts": [text]}
+            continue
+
+        yield line_no, column, text
+
+    if in_front_matter:
+        add_error(errors, start_line, 1, "Front-matter is not closed with ---")
+    if in_directive:
+        add_error(errors, start_line, 1, "Directive is not closed with }%%")
+
+
+def strip_comment(text):
+    """Cut a trailing `%%` comment off `text`
+
+    Returns the text and the index of the `"` left open at its end, or -1.
+    """
+    open_quote = -1
+    for match in COMMENT_OR_QUOTE_RE.finditer(text):
+        if match.group(0) == '"':
+            open_quote = match.start() if open_quote == -1 else -1
+        elif open_quote == -1:
+            return text[:match.start()].rstrip(), -1
+    return text, open_quote
+
+
+def add_error(errors, line, column, message):
+    errors.append({"line": line, "column": column, "message": message})
+
+
+def start_diagram(result, line_no, column, text):
+    """Read the header line and return the statement builder for its type"""
+    match = HEADER_RE.match(text)
+    keyword = match.group(0) if match else ""
+    result["keyword"] = keyword or None
+    result["diagram_type"] = DIAGRAM_TYPES.get(keyword.lower())
+
+    if not result["diagram_type"]:
+        add_error(result["errors"], line_no, column, "Diagram doesn't start with a recognized Mermaid keyword")
+        return None
+
+    rest = text[len(keyword):].strip()
+    lowered = keyword.lower()
+
+    if result["diagram_type"] == "Flowchart":
+        builder = FlowchartBuilder()
+        match = re.match(r"(\w+)?[\s;]*(.*)$", rest)
+        result["direction"] = match.group(1)
+        if match.group(2):
+            # `graph TD; A-->B` on a single line
+            builder.line_no = line_no
+            try:
+                builder.statement(match.group(2))
+            except MermaidSyntaxError as e:
+                add_error(result["errors"], line_no, column + len(text) - len(match.group(2)) + e.column, str(e))
+        return builder
+
+    builder_class = {
+        "sequencediagram": SequenceBuilder,
+        "classdiagram": ClassBuilder,
+        "classdiagram-v2": ClassBuilder,
+        "statediagram": StateBuilder,
+        "statediagram-v2": StateBuilder,
+        "erdiagram": ERBuilder,
+    }.get(lowered)
+    return builder_class() if builder_class else None
+
+
+class GraphBuilder:
+    """Collects nodes and edges; labels given later override bare references"""
+
+    def __init__(self):
+        self.nodes = OrderedDict()
+        self.edges = []
+        self.line_no = None
+        self.block_line = None
+
+    def add_node(self, node_id, label=None):
+        if label or node_id not in self.nodes:
+            self.nodes[node_id] = label or self.nodes.get(node_id) or None
+
+    def add_edge(self, source, target, label=None):
+        self.add_node(source)
+        self.add_node(target)
+        self.edges.append([source, target, label or None])
+
+    def finish(self, result):
+        result["nodes"] = [[node_id, label] for node_id, label in self.nodes.items()]
+        result["edges"] = self.edges
+
+
+class FlowchartBuilder(GraphBuilder):
+    def __init__(self):
+        super().__init__()
+        # `e1@-->` ids, so `e1@{ ... }` isn't taken for a node
+        self.edge_ids = set()
+
+    def statement(self, text):
+        pos = 0
+        while pos < len(text):
+            pos = self.parse_chain(text, pos)
+            pos = skip_whitespace(text, pos)
+            if pos < len(text) and text[pos] == ";":
+                pos = skip_whitespace(text, pos + 1)
+
+    def parse_chain(self, text, pos):
+        """Parse `A & B --> C -->|x| D` starting at `pos`; return where it ended"""
+        word = NODE_ID_RE.match(text, pos)
+        if word and word.group(0).lower() in FLOWCHART_KEYWORDS:
+            # subgraph/style/class/... lines carry no edges
+            if word.group(0).lower() == "subgraph":
+                self.add_subgraph(text[word.end():].strip())
+            return len(text)
+
+        group, pos = self.parse_group(text, pos)
+        while True:
+            pos = skip_whitespace(text, pos)
+            if pos >= len(text) or text[pos] == ";":
+                return pos
+
+            label, pos = self.parse_link(text, pos)
+            targets, pos = self.parse_group(text, pos)
+            for source in group:
+                for target in targets:
+                    self.add_edge(source, target, label)
+            group = targets
+
+    def add_subgraph(self, rest):
+        # `subgraph id [title]` / `subgraph title`
+        match = re.match(r"([\w.-]+)\s*\[(.*)\]$", rest)
+        if match:
+            self.add_node(match.group(1), match.group(2).strip('"'))
+
+    def parse_group(self, text, pos):
+        nodes = []
+        while True:
+            node_id, pos = self.parse_node(text, pos)
+            nodes.append(node_id)
+            ampersand = re.compile(r"\s*&\s*").match(text, pos)
+            if not ampersand:
+                return nodes, pos
+            pos = ampersand.end()
+
+    def parse_node(self, text, pos):
+        pos = skip_whitespace(text, pos)
+        match = NODE_ID_RE.match(text, pos)
+        if not match:
+            raise MermaidSyntaxError("Expected a node id", pos)
+
+        node_id, pos = match.group(0), match.end()
+        label = None
+
+        # `A@{ shape: rect, label: "..." }` / `e1@{ animate: true }`
+        if text.startswith("@{", pos):
+            end = text.find("}", pos)
+            if end == -1:
+                raise MermaidSyntaxError("Shape data is not closed with }", pos)
+            pos = end + 1
+            if node_id in self.edge_ids:
+                return node_id, pos
+
+        for opening, closings in NODE_SHAPES:
+            if text.startswith(opening, pos):
+                label, pos = read_label(text, pos + len(opening), closings, pos)
+                break
+
+        # `A:::className`
+        style_class = re.compile(r":::[\w-]+").match(text, pos)
+        if style_class:
+            pos = style_class.end()
+
+        self.add_node(node_id, label)
+        return node_id, pos
+
+    def parse_link(self, text, pos):
+        edge_id = EDGE_ID_RE.match(text, pos)
+        if edge_id:
+            self.edge_ids.add(edge_id.group(0).strip()[:-1])
+            pos = edge_id.end()
+
+        match = TEXT_LINK_RE.match(text, pos)
+        if match:
+            return match.group(1).strip('"'), match.end()
+
+        match = LINK_RE.match(text, pos)
+        if match:
+            return (match.group(2) or "").strip().strip('"') or None, match.end()
+
+        raise MermaidSyntaxError("Expected a link such as --> between nodes", pos)
+
+
+def read_label(text, pos, closings, shape_start):
+    """Read a node label up to one of `closings`; quoted labels may contain them"""
+    if pos < len(text) and text[pos] == '"':
+        end_quote = text.find('"', pos + 1)
+        if end_quote == -1:
+            raise MermaidSyntaxError("Unterminated quoted label", pos)
+        label = text[pos + 1:end_quote]
+        pos = end_quote + 1
+        for closing in closings:
+            if text.startswith(closing, pos):
+                return label, pos + len(closing)
+        raise MermaidSyntaxError(f"Expected {closings[0]} after quoted label", pos)
+
+    best = -1
+    best_closing = None
+    for closing in closings:
+        index = text.find(closing, pos)
+        if index != -1 and (best == -1 or index < best):
+            best, best_closing = index, closing
+
+    if best == -1:
+        raise MermaidSyntaxError(f"Node shape is not closed with {closings[0]}", shape_start)
+
+    return text[pos:best].strip(), best + len(best_closing)
+
+
+def skip_whitespace(text, pos):
+    return WHITESPACE_RE.match(text, pos).end()
+
+
+class SequenceBuilder(GraphBuilder):
+    def statement(self, text):
+        match = SEQUENCE_PARTICIPANT_RE.match(text)
+        if match:
+            self.add_node(match.group(1), match.group(2))
+            return
+
+        match = SEQUENCE_MESSAGE_RE.match(text)
+        if match:
+            self.add_edge(match.group(1).strip(), match.group(3).strip(), match.group(4).strip())
+
+
+class BlockBuilder(GraphBuilder):
+    """Builder for diagram types whose declarations may open a `{ ... }` member block"""
+
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+
+    def statement(self, text):
+        if self.depth:
+            # members/attributes inside a block are not part of the graph
+            self.depth += text.count("{") - text.count("}")
+            return
+        self.graph_statement(text)
+
+    def open_block(self, opened):
+        if opened:
+            self.depth = 1
+            self.block_line = self.line_no
+
+    def finish(self, result):
+        super().finish(result)
+        if self.depth > 0:
+            add_error(result["errors"], self.block_line, 1, "Block is not closed with }")
+
+
+class ClassBuilder(BlockBuilder):
+    def graph_statement(self, text):
+        match = CLASS_DECLARATION_RE.match(text)
+        if match:
+            self.add_node(match.group(1), match.group(2))
+            self.open_block(match.group(3))
+            return
+
+        match = CLASS_RELATION_RE.match(text)
+        if match:
+            self.add_edge(match.group(1), match.group(3), match.group(4))
+
+
+class StateBuilder(GraphBuilder):
+    def __init__(self):
+        super().__init__()
+        self.depth = 0
+
+    def statement(self, text):
+        # composite states nest real states, so (unlike class bodies) keep parsing inside them
+        if text == "}":
+            self.depth -= 1
+            if self.depth < 0:
+                raise MermaidSyntaxError("Unexpected }", 0)
+            return
+
+        match = STATE_DECLARATION_RE.match(text)
+        if match:
+            self.add_node(match.group(2), match.group(1))
+            if match.group(3):
+                self.depth += 1
+                self.block_line = self.line_no
+            return
+
+        match = STATE_TRANSITION_RE.match(text)
+        if match:
+            self.add_edge(match.group(1), match.group(2), match.group(3))
+            return
+
+        match = STATE_DESCRIPTION_RE.match(text)
+        if match:
+            self.add_node(match.group(1), match.group(2).strip())
+
+    def finish(self, result):
+        super().finish(result)
+        if self.depth > 0:
+            add_error(result["errors"], self.block_line, 1, "State block is not closed with }")
+
+
+class ERBuilder(BlockBuilder):
+    def graph_statement(self, text):
+        match = ER_RELATION_RE.match(text)
+        if match:
+            self.add_edge(match.group(1), match.group(5), match.group(6).strip().strip('"'))
+            return
+
+        match = ER_ENTITY_RE.match(text)
+        if match:
+            self.add_node(match.group(1), match.group(2))
+            self.open_block(match.group(3))
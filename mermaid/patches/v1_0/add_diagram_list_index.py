@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+    """Composite index backing keyset pagination in get_diagram_list"""
+    frappe.db.add_index("Mermaid Diagram", ["modified", "name"], index_name="modified_name_index")
@@ -0,0 +1,8 @@
+import frappe
+
+
+def execute():
+    """Composite indexes backing the visibility predicate in mermaid.permissions"""
+    frappe.db.add_index("Mermaid Diagram", ["owner", "modified"], index_name="owner_modified_index")
+    frappe.db.add_index("Mermaid Diagram", ["is_public", "modified"], index_name="is_public_modified_index")
+    frappe.db.add_index("Mermaid Diagram", ["diagram_type", "modified"], index_name="diagram_type_modified_index")
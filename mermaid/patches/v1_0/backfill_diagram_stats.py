@@ -0,0 +1,19 @@
+import frappe
+
+from mermaid.stats import increment, reconcile
+
+
+def execute():
+    """Seed the stats rollup; past activity is approximated from each diagram's last edit"""
+    reconcile()
+
+    for row in frappe.db.sql(
+        """
+        SELECT DATE(modified) AS date, COUNT(*) AS count
+        FROM `tabMermaid Diagram`
+        WHERE modified >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+        GROUP BY DATE(modified)
+        """,
+        as_dict=True,
+    ):
+        increment("Activity", str(row.date), row.count)
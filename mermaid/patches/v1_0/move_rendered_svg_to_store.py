@@ -0,0 +1,34 @@
+import frappe
+
+from mermaid.svg_store import save_svg
+
+BATCH_SIZE = 500
+
+
+def execute():
+    """Move rendered_svg out of tabMermaid Diagram into the SVG blob store"""
+    if not frappe.db.has_column("Mermaid Diagram", "rendered_svg"):
+        return
+
+    while True:
+        rows = frappe.db.sql(
+            """
+            SELECT name, rendered_svg
+            FROM `tabMermaid Diagram`
+            WHERE rendered_svg IS NOT NULL AND rendered_svg != ''
+            LIMIT %s
+            """,
+            BATCH_SIZE,
+            as_dict=True,
+        )
+        if not rows:
+            break
+
+        for row in rows:
+            frappe.db.sql(
+                """UPDATE `tabMermaid Diagram` SET svg_hash = %s, rendered_svg = NULL WHERE name = %s""",
+                (save_svg(row.rendered_svg), row.name),
+            )
+        frappe.db.commit()
+
+    frappe.db.sql_ddl("ALTER TABLE `tabMermaid Diagram` DROP COLUMN rendered_svg")
@@ -0,0 +1,6 @@
+from mermaid.graph import rebuild_graph_index
+
+
+def execute():
+    """Build the node/edge index of every existing diagram from its content"""
+    rebuild_graph_index()
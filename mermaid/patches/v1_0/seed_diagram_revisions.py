@@ -0,0 +1,11 @@
+import frappe
+
+from mermaid.revisions import record_revision
+
+
+def execute():
+    """Store the current content of existing diagrams as their first revision snapshot"""
+    for diagram in frappe.get_all("Mermaid Diagram", fields=["name", "content_version", "mermaid_content"]):
+        record_revision(diagram.name, diagram.content_version or 0, diagram.mermaid_content or "")
+
+    frappe.db.commit()
@@ -0,0 +1,59 @@
+"""Who can see and edit a Mermaid Diagram.
+
+A diagram is visible to its owner, to everyone when `is_public` is set, and
+to the users it is shared with (DocShare). System Managers see everything.
+Public diagrams are read-only for everyone but the owner; shared ones allow
+what the share allows.
+
+Lists get this as one predicate from `get_permission_query_conditions`,
+backed by the (owner, modified) and (is_public, modified) indexes and the
+DocShare user index, so `frappe.get_list` needs no per-row checks.
+`has_permission` applies the same rules to single documents.
+"""
+import frappe
+
+SHARE_RIGHTS = ("read", "write", "share")
+READ_PTYPES = ("read", "select", "print", "email", "export", "report")
+
+
+def is_unrestricted(user):
+    return user == "Administrator" or "System Manager" in frappe.get_roles(user)
+
+
+def get_permission_query_conditions(user=None):
+    user = user or frappe.session.user
+    if is_unrestricted(user):
+        return ""
+
+    user = frappe.db.escape(user)
+    return f"""(`tabMermaid Diagram`.`owner` = {user}
+        or `tabMermaid Diagram`.`is_public` = 1
+        or `tabMermaid Diagram`.`name` in (
+            select `share_name` from `tabDocShare`
+            where `share_doctype` = 'Mermaid Diagram' and `read` = 1
+                and (`user` = {user} or `everyone` = 1)
+        ))"""
+
+
+def has_permission(doc, ptype="read", user=None, debug=False):
+    user = user or frappe.session.user
+    if is_unrestricted(user) or doc.is_new() or doc.owner == user:
+        return True
+
+    if doc.is_public and ptype in READ_PTYPES:
+        return True
+
+    right = "read" if ptype in READ_PTYPES else ptype
+    if right not in SHARE_RIGHTS:
+        # delete, cancel and the like are the owner's alone
+        return False
+
+    return bool(frappe.db.sql(
+        f"""
+        select 1 from `tabDocShare`
+        where `share_doctype` = 'Mermaid Diagram' and `share_name` = %(name)s and `{right}` = 1
+            and (`user` = %(user)s or `everyone` = 1)
+        limit 1
+        """,
+        {"name": doc.name, "user": user},
+    ))
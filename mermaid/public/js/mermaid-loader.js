@@ -0,0 +1,70 @@
+// Loads Mermaid on demand.
+//
+// Pages that show diagrams include this script (the Mermaid Diagram form
+// pulls it in with frappe.require); no other page loads anything from this
+// app. Mermaid itself is only fetched when `mermaid_loader.load()` is called
+// or the page contains diagram elements (`.mermaid` or `[data-mermaid]`).
+// It is served from the app's own assets, pinned to the installed version
+// (see vendor-mermaid.js), and the ESM build imports just the chunks for the
+// diagram types it renders. Pages that already load Mermaid globally get it configured the
+// same way.
+(function() {
+    if (window.mermaid_loader) return;
+
+    const SELECTOR = '.mermaid:not([data-processed]), [data-mermaid]:not([data-processed])';
+    const CONFIG = {
+        startOnLoad: false,
+        theme: 'default',
+        securityLevel: 'loose',
+        fontFamily: 'system-ui, -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif',
+        flowchart: {
+            useMaxWidth: true,
+            htmlLabels: true,
+            curve: 'basis'
+        }
+    };
+
+    let loading = null;
+
+    function load() {
+        if (!loading) {
+            const source = window.mermaid
+                ? Promise.resolve(window.mermaid)
+                : import(window.mermaid_loader.url).then(module => module.default);
+
+            loading = source.then(mermaid => {
+                mermaid.initialize(CONFIG);
+                window.mermaid = mermaid;
+                return mermaid;
+            }, error => {
+                // let a later call try again
+                loading = null;
+                throw error;
+            });
+        }
+        return loading;
+    }
+
+    function render_all(root) {
+        const nodes = Array.from((root || document).querySelectorAll(SELECTOR));
+        if (!nodes.length) return Promise.resolve([]);
+
+        return load().then(mermaid => mermaid.run({ nodes: nodes }).then(() => nodes));
+    }
+
+    window.mermaid_loader = {
+        // copied from node_modules by vendor-mermaid.js (`npm install`)
+        url: '/assets/mermaid/js/vendor/mermaid/mermaid.esm.min.mjs',
+        load: load,
+        render_all: render_all
+    };
+
+    // already on the page: nothing to fetch, just apply the configuration
+    if (window.mermaid) load();
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', () => render_all());
+    } else {
+        render_all();
+    }
+})();
@@ -0,0 +1,125 @@
+"""Single broadcast layer for Mermaid Diagram realtime events.
+
+Every publish for a diagram goes through `publish_diagram_event`, which
+
+* dedupes: within one transaction only the last message per (diagram, event)
+  is kept, and it is sent after commit (nothing is sent on rollback);
+* coalesces: the first event in a window is sent immediately, later ones in the
+  same window are folded into one trailing message, sent from a short job
+  that opens the next window;
+* skips rooms nobody is subscribed to (see `subscribe_diagram`).
+"""
+import json
+import time
+
+import frappe
+from frappe.utils import cint
+
+from mermaid.metrics import count_publish
+
+DEFAULT_COALESCE_WINDOW_MS = 500
+SUBSCRIPTION_TTL = 120
+
+
+def publish_diagram_event(name, event, message):
+    """Queue `message` for everyone viewing diagram `name`"""
+    if frappe.flags.in_import or frappe.flags.in_install or frappe.flags.in_migrate:
+        return
+
+    pending = getattr(frappe.local, "mermaid_realtime_pending", None)
+    if pending is None:
+        pending = frappe.local.mermaid_realtime_pending = {}
+        frappe.db.after_commit.add(flush_pending)
+        frappe.db.after_rollback.add(discard_pending)
+
+    pending[(name, event)] = message
+
+
+def flush_pending():
+    pending = getattr(frappe.local, "mermaid_realtime_pending", None) or {}
+    frappe.local.mermaid_realtime_pending = None
+
+    for (name, event), message in pending.items():
+        publish_coalesced(name, event, message)
+
+
+def discard_pending():
+    frappe.local.mermaid_realtime_pending = None
+
+
+def publish_coalesced(name, event, message):
+    if not has_subscribers(name):
+        return
+
+    window = cint(frappe.conf.get("mermaid_realtime_coalesce_ms", DEFAULT_COALESCE_WINDOW_MS))
+    if window <= 0:
+        publish(name, event, message)
+        return
+
+    cache = frappe.cache()
+    key = f"mermaid_realtime:{name}:{event}"
+
+    if cache.set(cache.make_key(f"{key}:window"), 1, nx=True, px=window):
+        publish(name, event, message)
+        return
+
+    # A message went out less than `window` ms ago: hold this one back. Only the
+    # latest held message is sent, by a job that is enqueued unless one is
+    # already scheduled; the job clears the flag before it takes the message,
+    # so a message held after that is either taken or enqueues a new job.
+    cache.set(cache.make_key(f"{key}:pending"), frappe.as_json(message), ex=60)
+    if cache.set(cache.make_key(f"{key}:scheduled"), 1, nx=True, ex=60):
+        frappe.enqueue(flush_coalesced, queue="short", at_front=True, name=name, event=event)
+
+
+def flush_coalesced(name, event):
+    cache = frappe.cache()
+    key = f"mermaid_realtime:{name}:{event}"
+    window = cint(frappe.conf.get("mermaid_realtime_coalesce_ms", DEFAULT_COALESCE_WINDOW_MS))
+
+    cache.delete(cache.make_key(f"{key}:scheduled"))
+    # GETDEL, so a message held in between is not deleted unsent
+    raw = cache.getdel(cache.make_key(f"{key}:pending"))
+    if not raw:
+        return
+
+    message = json.loads(raw)
+    # Messages were dropped in between, so a delta would not apply on the
+    # receiving side; clients fetch the current content instead.
+    if "delta" in message:
+        message["delta"] = message["base_version"] = None
+
+    # start a new window, so messages held from now on are coalesced again
+    cache.set(cache.make_key(f"{key}:window"), 1, px=max(window, 1))
+    publish(name, event, message)
+
+
+def publish(name, event, message):
+    count_publish(event)
+    frappe.publish_realtime(event=event, message=message, doctype="Mermaid Diagram", docname=name)
+
+
+def get_subscribers_key(name):
+    return frappe.cache().make_key(f"mermaid_realtime_subscribers:{name}")
+
+
+def has_subscribers(name):
+    cache = frappe.cache()
+    key = get_subscribers_key(name)
+    cache.zremrangebyscore(key, "-inf", time.time())
+    return cache.zcard(key) > 0
+
+
+@frappe.whitelist()
+def subscribe_diagram(name):
+    """Register the session as viewing `name`; clients renew this while the diagram is open"""
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+    key = get_subscribers_key(name)
+    frappe.cache().zadd(key, {frappe.session.sid: time.time() + SUBSCRIPTION_TTL})
+    frappe.cache().expire(key, SUBSCRIPTION_TTL)
+    return {"ttl": SUBSCRIPTION_TTL}
+
+
+@frappe.whitelist()
+def unsubscribe_diagram(name):
+    frappe.cache().zrem(get_subscribers_key(name), frappe.session.sid)
@@ -0,0 +1,162 @@
+"""Content-addressed cache of rendered SVGs.
+
+Entries are keyed by a hash of (source, theme, mermaid version), so identical
+diagrams render once no matter how many documents contain them. A bounded
+in-process LRU sits in front of an on-disk tier under the site's private files.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import frappe
+
+DEFAULT_MEMORY_LIMIT = 32 * 1024 * 1024
+DEFAULT_DISK_LIMIT = 512 * 1024 * 1024
+PRUNE_EVERY = 100
+
+
+def get_cache_key(content, theme="default", version=None):
+    """Hash identifying the SVG that `content` renders to"""
+    from mermaid.renderer import get_mermaid_version
+
+    version = version or get_mermaid_version()
+    digest = hashlib.sha256()
+    for part in (version, theme or "default", content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RenderCache:
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT, disk_limit=DEFAULT_DISK_LIMIT):
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._entries = OrderedDict()
+        self._memory_size = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        memory_key = (frappe.local.site, key)
+        with self._lock:
+            svg = self._entries.get(memory_key)
+            if svg is not None:
+                self._entries.move_to_end(memory_key)
+                return svg
+
+        svg = self._read_disk(key)
+        if svg is not None:
+            self._remember(memory_key, svg)
+        return svg
+
+    def set(self, key, svg):
+        self._remember((frappe.local.site, key), svg)
+        self._write_disk(key, svg)
+
+    def _remember(self, memory_key, svg):
+        size = len(svg)
+        if size > self.memory_limit:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(memory_key, None)
+            if previous is not None:
+                self._memory_size -= len(previous)
+
+            self._entries[memory_key] = svg
+            self._memory_size += size
+
+            while self._memory_size > self.memory_limit:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def get_cache_dir(self):
+        return frappe.get_site_path("private", "mermaid_render_cache")
+
+    def _get_path(self, key):
+        return os.path.join(self.get_cache_dir(), key[:2], f"{key}.svg")
+
+    def _read_disk(self, key):
+        path = self._get_path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                svg = f.read()
+        except FileNotFoundError:
+            return None
+
+        # bump mtime so the disk tier evicts least recently used entries first
+        os.utime(path)
+        return svg
+
+    def _write_disk(self, key, svg):
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(svg)
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Delete least recently used files until the disk tier fits its limit"""
+        entries = []
+        total = 0
+        for root, _dirs, files in os.walk(self.get_cache_dir()):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.disk_limit:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_cache = None
+
+
+def get_render_cache():
+    global _cache
+
+    if _cache is None:
+        _cache = RenderCache(
+            memory_limit=frappe.conf.get("mermaid_render_cache_memory_limit") or DEFAULT_MEMORY_LIMIT,
+            disk_limit=frappe.conf.get("mermaid_render_cache_disk_limit") or DEFAULT_DISK_LIMIT,
+        )
+    return _cache
+
+
+def get_cached_svg(content, theme="default"):
+    """Return the cached SVG for `content`, or None if it has not been rendered yet"""
+    if not content:
+        return None
+    return get_render_cache().get(get_cache_key(content, theme))
+
+
+def render_cached(content, theme="default"):
+    """Return the SVG for `content`, rendering it only on a cache miss"""
+    from mermaid.renderer import render_svg
+
+    cache = get_render_cache()
+    key = get_cache_key(content, theme)
+
+    svg = cache.get(key)
+    if svg is None:
+        svg = render_svg(content, theme=theme)
+        cache.set(key, svg)
+    return svg
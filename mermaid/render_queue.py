@@ -0,0 +1,106 @@
+"""Render-on-save: SVGs are produced by background jobs, not by the saving client.
+
+Each diagram has at most one render job queued or running (the job id is per
+diagram). A job always renders the diagram's *current* content, and it only
+writes the result if that content hasn't changed while it was rendering, so
+renders for superseded content are dropped rather than written. The SVG is
+written once, with `db.set_value`, so no second save (and no version,
+broadcast or hook run) follows a render.
+"""
+import frappe
+
+from mermaid.render_cache import get_cache_key, render_cached
+from mermaid.renderer import RenderError
+
+MAX_ATTEMPTS = 5
+
+
+def enqueue_render(doc):
+    """Queue a render if the stored SVG doesn't match the diagram's content"""
+    if not doc.mermaid_content or frappe.flags.in_migrate:
+        return
+
+    if doc.svg_hash and doc.rendered_source_hash == get_cache_key(doc.mermaid_content):
+        return
+
+    frappe.enqueue(
+        render_diagram,
+        queue="short",
+        job_id=f"mermaid_render::{frappe.local.site}::{doc.name}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        name=doc.name,
+    )
+
+
+def render_diagram(name):
+    from mermaid.realtime import publish_diagram_event
+    from mermaid.svg_store import save_svg
+
+    # A save that lands while this job runs is deduplicated against it, so
+    # the content is read again after every write and rendered once more if
+    # it changed, rather than leaving a stale SVG until the next edit.
+    for _attempt in range(MAX_ATTEMPTS):
+        content, rendered_source_hash = frappe.db.get_value(
+            "Mermaid Diagram", name, ["mermaid_content", "rendered_source_hash"]
+        ) or (None, None)
+        if not content:
+            return
+
+        source_hash = get_cache_key(content)
+        if source_hash == rendered_source_hash:
+            return
+
+        try:
+            svg = render_cached(content)
+        except RenderError:
+            frappe.log_error(title=f"Mermaid render failed for {name}")
+            return
+
+        # a locking read sees the latest committed content (not this
+        # transaction's snapshot) and holds off saves until the commit below
+        if frappe.db.get_value("Mermaid Diagram", name, "mermaid_content", for_update=True) != content:
+            frappe.db.rollback()
+            continue
+
+        svg_hash = save_svg(svg)
+        frappe.db.set_value(
+            "Mermaid Diagram",
+            name,
+            {"svg_hash": svg_hash, "rendered_source_hash": source_hash},
+            update_modified=False,
+        )
+        publish_diagram_event(
+            name,
+            "mermaid_diagram_updated",
+            {
+                "name": name,
+                "version": frappe.db.get_value("Mermaid Diagram", name, "content_version"),
+                "delta": None,
+                "base_version": None,
+                "svg_hash": svg_hash,
+            },
+        )
+        frappe.db.commit()
+        frappe.enqueue(
+            warm_thumbnail,
+            queue="short",
+            job_id=f"mermaid_thumbnail::{frappe.local.site}::{svg_hash}",
+            deduplicate=True,
+            name=name,
+            svg_hash=svg_hash,
+        )
+
+    # the content kept changing; leave the rest to a fresh job rather than spin
+    frappe.enqueue(render_diagram, queue="short", name=name)
+
+
+def warm_thumbnail(name, svg_hash):
+    """Rasterize the list thumbnail now so the first list view doesn't have to"""
+    from mermaid.thumbnails import generate_thumbnail
+
+    try:
+        generate_thumbnail(svg_hash)
+    except RenderError:
+        # the thumbnail endpoint retries on demand
+        frappe.log_error(title=f"Mermaid thumbnail failed for {name}")
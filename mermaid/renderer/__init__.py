@@ -0,0 +1,66 @@
+"""Server-side Mermaid rendering backed by a pool of warm Node.js workers"""
+import json
+import os
+import threading
+import time
+
+import frappe
+
+from mermaid.metrics import observe_render
+from mermaid.renderer.pool import RenderError, RenderPool
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_TIMEOUT = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+_mermaid_version = None
+
+
+def get_pool():
+    """Return the per-process render pool, creating it on first use"""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool(
+                    size=frappe.conf.get("mermaid_render_pool_size") or DEFAULT_POOL_SIZE,
+                    timeout=frappe.conf.get("mermaid_render_timeout") or DEFAULT_TIMEOUT,
+                    node_binary=frappe.conf.get("mermaid_node_binary") or "node",
+                )
+    return _pool
+
+
+def get_mermaid_version():
+    """Version of the mermaid package the workers render with"""
+    global _mermaid_version
+
+    if _mermaid_version is None:
+        package_json = os.path.join(
+            frappe.get_app_path("mermaid"), "..", "node_modules", "mermaid", "package.json"
+        )
+        try:
+            with open(package_json) as f:
+                _mermaid_version = json.load(f).get("version") or "unknown"
+        except (OSError, ValueError):
+            _mermaid_version = "unknown"
+    return _mermaid_version
+
+
+def render_svg(content, theme="default"):
+    """Render mermaid source to an SVG string"""
+    start = time.perf_counter()
+    try:
+        return get_pool().render(content, theme=theme)
+    finally:
+        observe_render("render", time.perf_counter() - start)
+
+
+def rasterize_svg(svg, width, height, format="png"):
+    """Render an SVG to PNG or WebP bytes of the given size"""
+    start = time.perf_counter()
+    try:
+        return get_pool().rasterize(svg, width, height, format=format)
+    finally:
+        observe_render("rasterize", time.perf_counter() - start)
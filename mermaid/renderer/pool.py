@@ -0,0 +1,179 @@
+import atexit
+import base64
+import itertools
+import json
+import os
+import queue
+import subprocess
+import threading
+
+import frappe
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(__file__), "worker.js")
+
+
+class RenderError(frappe.ValidationError):
+    pass
+
+
+class RenderWorker:
+    """A long-lived `node worker.js` process that renders one job at a time"""
+
+    def __init__(self, node_binary, timeout):
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._lines = queue.Queue()
+        self.process = subprocess.Popen(
+            [node_binary, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            cwd=os.path.dirname(WORKER_SCRIPT),
+        )
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+
+        ready = self._next_message(self.timeout)
+        if not ready.get("ready"):
+            self.close()
+            raise RenderError(f"Mermaid render worker failed to start: {ready.get('error')}")
+        self.mermaid_version = ready.get("mermaid_version")
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _next_message(self, timeout):
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            self.close()
+            raise RenderError(f"Mermaid render timed out after {timeout}s")
+
+        if line is None:
+            self.close()
+            raise RenderError("Mermaid render worker exited unexpectedly")
+
+        try:
+            message = json.loads(line)
+        except ValueError:
+            message = None
+        if not isinstance(message, dict):
+            # the worker wrote something else to stdout, so it is out of step
+            self.close()
+            raise RenderError("Mermaid render worker returned an invalid response")
+
+        return message
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def render(self, content, theme="default"):
+        return self.run({"op": "render", "content": content, "theme": theme})["svg"]
+
+    def rasterize(self, svg, width, height, format="png"):
+        """Screenshot `svg` fitted into a width x height image"""
+        message = self.run({"op": "rasterize", "svg": svg, "width": width, "height": height, "format": format})
+        return base64.b64decode(message["image"])
+
+    def run(self, job):
+        job_id = job["id"] = next(self._ids)
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.close()
+            raise RenderError("Mermaid render worker is not accepting jobs")
+
+        message = self._next_message(self.timeout)
+        if message.get("id") != job_id:
+            self.close()
+            raise RenderError("Mermaid render worker returned an unexpected response")
+        if message.get("error"):
+            raise RenderError(message["error"])
+
+        return message
+
+    def close(self):
+        if self.alive:
+            self.process.kill()
+            self.process.wait()
+
+
+class RenderPool:
+    """Bounded pool of warm render workers; workers are started lazily and reused"""
+
+    def __init__(self, size=2, timeout=30, node_binary="node"):
+        self.size = int(size)
+        self.timeout = float(timeout)
+        self.node_binary = node_binary
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._workers = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RenderError(f"No render worker became available within {self.timeout}s")
+
+        try:
+            worker = self._idle.get_nowait()
+            if worker.alive:
+                return worker
+            self._discard(worker)
+        except queue.Empty:
+            pass
+
+        try:
+            worker = RenderWorker(self.node_binary, self.timeout)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _release(self, worker):
+        if worker.alive:
+            self._idle.put(worker)
+        else:
+            self._discard(worker)
+        self._slots.release()
+
+    def _discard(self, worker):
+        worker.close()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def render(self, content, theme="default"):
+        worker = self._acquire()
+        try:
+            return worker.render(content, theme=theme)
+        finally:
+            self._release(worker)
+
+    def rasterize(self, svg, width, height, format="png"):
+        worker = self._acquire()
+        try:
+            return worker.rasterize(svg, width, height, format=format)
+        finally:
+            self._release(worker)
+
+    @property
+    def mermaid_version(self):
+        with self._lock:
+            for worker in self._workers:
+                if worker.mermaid_version:
+                    return worker.mermaid_version
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.close()
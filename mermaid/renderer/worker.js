@@ -0,0 +1,93 @@
+// Long-lived render worker driven by mermaid/renderer/pool.py.
+// Reads one JSON job per line on stdin and writes one JSON result per line on stdout.
+const readline = require('readline');
+const puppeteer = require('puppeteer');
+
+const MERMAID_SCRIPT = require.resolve('mermaid/dist/mermaid.min.js');
+const MERMAID_VERSION = require('mermaid/package.json').version;
+
+function reply(message) {
+    process.stdout.write(JSON.stringify(message) + '\n');
+}
+
+async function render(page, job) {
+    return page.evaluate(async ({ id, content, theme }) => {
+        window.mermaid.initialize({ startOnLoad: false, securityLevel: 'strict', theme });
+        const { svg } = await window.mermaid.render(`mermaid-${id}`, content);
+        return svg;
+    }, { id: job.id, content: job.content, theme: job.theme || 'default' });
+}
+
+async function rasterize(page, job) {
+    await page.setViewport({ width: job.width, height: job.height });
+    await page.setContent(`<!DOCTYPE html>
+        <html><body style="margin: 0; background: #fff; width: ${job.width}px; height: ${job.height}px;
+            display: flex; align-items: center; justify-content: center; overflow: hidden;">
+        ${job.svg}
+        </body></html>`);
+    await page.evaluate(() => {
+        // scale the diagram to fit the thumbnail, keeping its aspect ratio
+        const svg = document.querySelector('svg');
+        if (!svg) return;
+        svg.removeAttribute('style');
+        svg.setAttribute('width', '100%');
+        svg.setAttribute('height', '100%');
+        svg.setAttribute('preserveAspectRatio', 'xMidYMid meet');
+    });
+    return page.screenshot({ type: job.format || 'png', encoding: 'base64' });
+}
+
+async function main() {
+    const browser = await puppeteer.launch({
+        headless: 'new',
+        args: ['--no-sandbox', '--disable-dev-shm-usage']
+    });
+    const page = await browser.newPage();
+    await page.setContent('<!DOCTYPE html><html><body></body></html>');
+    await page.addScriptTag({ path: MERMAID_SCRIPT });
+    // Stored SVGs are untrusted input: the thumbnail page runs no scripts they
+    // carry and loads nothing from the network (page.evaluate still works).
+    const thumbnail_page = await browser.newPage();
+    await thumbnail_page.setJavaScriptEnabled(false);
+    await thumbnail_page.setRequestInterception(true);
+    thumbnail_page.on('request', (request) => request.abort());
+
+    // Jobs are processed strictly in order; the pool never sends a second job
+    // before the first one has been answered.
+    let queue = Promise.resolve();
+    const lines = readline.createInterface({ input: process.stdin });
+
+    lines.on('line', (line) => {
+        queue = queue.then(async () => {
+            let job;
+            try {
+                job = JSON.parse(line);
+            } catch (error) {
+                return reply({ id: null, error: 'Invalid job' });
+            }
+
+            try {
+                if (job.op === 'rasterize') {
+                    reply({ id: job.id, image: await rasterize(thumbnail_page, job) });
+                } else {
+                    reply({ id: job.id, svg: await render(page, job) });
+                }
+            } catch (error) {
+                reply({ id: job.id, error: String((error && error.message) || error) });
+            }
+        });
+    });
+
+    lines.on('close', async () => {
+        await queue;
+        await browser.close();
+        process.exit(0);
+    });
+
+    reply({ ready: true, mermaid_version: MERMAID_VERSION });
+}
+
+main().catch((error) => {
+    reply({ ready: false, error: String((error && error.message) || error) });
+    process.exit(1);
+});
@@ -0,0 +1,205 @@
+"""Delta-compressed content history for Mermaid Diagrams.
+
+Every content change stores a `Mermaid Diagram Revision` row named
+`<diagram>-<content_version>`. Most rows hold only a line delta against the
+previous stored row; every `SNAPSHOT_INTERVAL` revisions (or when a delta
+would be bigger than half the content) a full snapshot is stored instead, so
+reconstructing any revision reads one snapshot plus at most
+`SNAPSHOT_INTERVAL - 1` deltas.
+
+Invariant: a delta row always applies to the content of the diagram's
+previous stored row. Compaction preserves it by re-encoding the rows it keeps.
+
+Retention: revisions younger than `mermaid_revision_keep_days` (default 30)
+are all kept; older ones are thinned to the last revision of each day by the
+daily `compact_revisions` job.
+"""
+import json
+
+import frappe
+from frappe.utils import add_days, cint, getdate, nowdate
+
+from mermaid.delta import apply_line_delta, make_line_delta
+
+REVISION_DOCTYPE = "Mermaid Diagram Revision"
+SNAPSHOT_INTERVAL = 20
+DEFAULT_KEEP_DAYS = 30
+
+
+def on_diagram_update(doc, method=None):
+    before = doc.get_doc_before_save()
+    if before and before.mermaid_content == doc.mermaid_content:
+        return
+
+    record_revision(
+        doc.name,
+        cint(doc.content_version),
+        doc.mermaid_content or "",
+        previous_content=before.mermaid_content if before else None,
+    )
+
+
+def on_diagram_trash(doc, method=None):
+    frappe.db.delete(REVISION_DOCTYPE, {"diagram": doc.name})
+
+
+def record_revision(diagram, revision, content, previous_content=None):
+    """Store `content` as `revision`; `previous_content` is the content of `revision - 1`"""
+    latest = frappe.db.get_value(
+        REVISION_DOCTYPE,
+        {"diagram": diagram},
+        ["revision", "base_revision"],
+        order_by="revision desc",
+        as_dict=True,
+    )
+
+    base_revision = None
+    if previous_content is not None and latest and latest.revision == revision - 1:
+        base_revision = latest.base_revision
+
+    frappe.get_doc({
+        "doctype": REVISION_DOCTYPE,
+        "diagram": diagram,
+        "revision": revision,
+        **encode_revision(revision, content, previous_content, base_revision),
+    }).insert(ignore_permissions=True, ignore_if_duplicate=True)
+
+
+def encode_revision(revision, content, previous_content=None, base_revision=None):
+    """Field values storing `content` as a delta on `previous_content` or as a snapshot
+
+    `base_revision` is the snapshot the previous row's chain starts from;
+    None forces a snapshot.
+    """
+    values = {"content_size": len(content), "content": None, "delta": None}
+
+    if base_revision is not None and revision - base_revision < SNAPSHOT_INTERVAL:
+        delta = json.dumps(make_line_delta(previous_content, content), separators=(",", ":"))
+        if len(delta) <= len(content) // 2:
+            return {**values, "is_snapshot": 0, "base_revision": base_revision, "delta": delta}
+
+    return {**values, "is_snapshot": 1, "base_revision": revision, "content": content}
+
+
+def reconstruct(rows):
+    """Content of each row of one diagram's chain, given in revision order"""
+    contents = []
+    content = None
+    for row in rows:
+        if row.is_snapshot:
+            content = row.content or ""
+        elif content is None:
+            frappe.throw("Revision history is missing its snapshot")
+        else:
+            content = apply_line_delta(content, json.loads(row.delta))
+        contents.append(content)
+    return contents
+
+
+def load_revision(diagram, revision):
+    base_revision = frappe.db.get_value(
+        REVISION_DOCTYPE, {"diagram": diagram, "revision": cint(revision)}, "base_revision"
+    )
+    if base_revision is None:
+        frappe.throw(f"Revision {revision} of {diagram} is not stored", frappe.DoesNotExistError)
+
+    rows = frappe.get_all(
+        REVISION_DOCTYPE,
+        filters={"diagram": diagram, "revision": ["between", [base_revision, cint(revision)]]},
+        fields=["revision", "is_snapshot", "content", "delta"],
+        order_by="revision asc",
+    )
+    return reconstruct(rows)[-1]
+
+
+@frappe.whitelist()
+def get_revisions(name, limit=20, start=0):
+    """Stored revisions of a diagram, newest first"""
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    return frappe.get_all(
+        REVISION_DOCTYPE,
+        filters={"diagram": name},
+        fields=["revision", "content_size", "owner", "creation"],
+        order_by="revision desc",
+        limit=cint(limit) or 20,
+        start=cint(start),
+    )
+
+
+@frappe.whitelist()
+def get_revision_content(name, revision):
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    return {"name": name, "revision": cint(revision), "content": load_revision(name, revision)}
+
+
+@frappe.whitelist(methods=["POST"])
+def restore_revision(name, revision):
+    """Make an old revision's content the current content (as a new revision)"""
+    doc = frappe.get_doc("Mermaid Diagram", name)
+    doc.check_permission("write")
+
+    doc.mermaid_content = load_revision(name, revision)
+    doc.save()
+
+    return {"status": "success", "version": doc.content_version, "modified": doc.modified}
+
+
+def compact_revisions():
+    """Thin out revisions past the retention window (scheduled daily)"""
+    keep_days = cint(frappe.conf.get("mermaid_revision_keep_days")) or DEFAULT_KEEP_DAYS
+    cutoff = getdate(add_days(nowdate(), -keep_days))
+
+    # only diagrams that still have more than one old revision on some day
+    diagrams = frappe.db.sql(
+        """
+        SELECT DISTINCT diagram FROM (
+            SELECT diagram FROM `tabMermaid Diagram Revision`
+            WHERE creation < %s
+            GROUP BY diagram, DATE(creation)
+            HAVING COUNT(*) > 1
+        ) AS crowded
+        """,
+        cutoff,
+        pluck=True,
+    )
+
+    for diagram in diagrams:
+        compact_diagram(diagram, cutoff)
+        frappe.db.commit()
+
+
+def compact_diagram(diagram, cutoff):
+    rows = frappe.get_all(
+        REVISION_DOCTYPE,
+        filters={"diagram": diagram},
+        fields=["name", "revision", "base_revision", "is_snapshot", "content", "delta", "creation"],
+        order_by="revision asc",
+    )
+    contents = reconstruct(rows)
+
+    kept = [
+        i
+        for i, row in enumerate(rows)
+        if getdate(row.creation) >= cutoff
+        or i == len(rows) - 1
+        or getdate(rows[i + 1].creation) != getdate(row.creation)
+    ]
+    kept_set = set(kept)
+    dropped = [row.name for i, row in enumerate(rows) if i not in kept_set]
+    if not dropped:
+        return
+
+    # re-encode the surviving rows so every delta applies to the row before it
+    previous = base_revision = None
+    for i in kept:
+        row = rows[i]
+        values = encode_revision(
+            row.revision, contents[i], contents[previous] if previous is not None else None, base_revision
+        )
+        if any(row.get(field) != value for field, value in values.items() if field != "content_size"):
+            frappe.db.set_value(REVISION_DOCTYPE, row.name, values, update_modified=False)
+        previous, base_revision = i, values["base_revision"]
+
+    frappe.db.delete(REVISION_DOCTYPE, {"name": ["in", dropped]})
@@ -0,0 +1,164 @@
+"""Full-text search index for Mermaid Diagrams.
+
+Titles, descriptions and the node/edge labels found in `mermaid_content` are
+kept in a whoosh index (the same machinery Frappe uses for website search), so
+lookups stay flat as the number of diagrams grows instead of scanning
+`tabMermaid Diagram` with LIKE.
+"""
+import re
+
+import frappe
+from frappe.search.full_text_search import FullTextSearch
+from frappe.utils import strip_html_tags
+from whoosh.fields import ID, TEXT, Schema
+from whoosh.writing import AsyncWriter
+from whoosh.query import And, Or, Prefix, Term
+
+from mermaid.parser import parse as parse_mermaid
+
+INDEX_NAME = "mermaid_diagrams"
+
+FIELD_BOOSTS = {"title": 3.0, "labels": 1.5, "description": 1.0}
+
+# Styling directives carry no meaning for search
+IGNORED_TOKENS = {"style", "classdef", "linkstyle", "fill", "stroke", "stroke-width", "color"}
+
+TOKEN_PATTERN = re.compile(r"[^\W_][\w.-]*", re.UNICODE)
+
+
+def extract_labels(content):
+    """Return the header, node ids and node/edge labels of a diagram as a space separated string"""
+    result = parse_mermaid(content or "")
+
+    if result["nodes"]:
+        parts = [result["keyword"], result["direction"]]
+        parts.extend(part for node in result["nodes"] for part in node)
+        parts.extend(edge[2] for edge in result["edges"])
+        return " ".join(dict.fromkeys(part for part in parts if part))
+
+    # diagram types without a graph AST: index their words
+    labels = []
+    seen = set()
+
+    for line in (content or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("%%"):
+            continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            key = token.lower()
+            if key in IGNORED_TOKENS or key in seen:
+                continue
+            seen.add(key)
+            labels.append(token)
+
+    return " ".join(labels)
+
+
+class DiagramSearch(FullTextSearch):
+    def __init__(self):
+        super().__init__(INDEX_NAME)
+
+    def get_schema(self):
+        return Schema(
+            name=ID(stored=True, unique=True),
+            title=TEXT(stored=True),
+            description=TEXT,
+            labels=TEXT,
+        )
+
+    def get_fields_to_search(self):
+        return list(FIELD_BOOSTS)
+
+    def get_id(self):
+        return "name"
+
+    def get_items_to_index(self):
+        diagrams = frappe.get_all(
+            "Mermaid Diagram", fields=["name", "title", "description", "mermaid_content"]
+        )
+        return [self.get_document(d) for d in diagrams]
+
+    def get_document_to_index(self, name):
+        diagram = frappe.db.get_value(
+            "Mermaid Diagram", name, ["name", "title", "description", "mermaid_content"], as_dict=True
+        )
+        return self.get_document(diagram) if diagram else None
+
+    def get_document(self, diagram):
+        return frappe._dict(
+            name=diagram.name,
+            title=diagram.title or "",
+            description=strip_html_tags(diagram.description or ""),
+            labels=extract_labels(diagram.mermaid_content),
+        )
+
+    def update_index(self, document):
+        """Replace one document; unlike the base class, without merging every segment
+
+        Optimizing rewrites the whole index, which on each save costs more the
+        more diagrams there are. `build` still optimizes.
+        """
+        writer = AsyncWriter(self.get_index())
+        writer.delete_by_term(self.get_id(), document[self.get_id()])
+        writer.add_document(**document)
+        writer.commit()
+
+    def remove_document_from_index(self, doc_name):
+        if not doc_name:
+            return
+        writer = AsyncWriter(self.get_index())
+        writer.delete_by_term(self.get_id(), doc_name)
+        writer.commit()
+
+    def parse_result(self, result):
+        return result["name"]
+
+    def search(self, text, scope=None, limit=20):
+        """Ranked search where every word must match a field exactly or as a prefix"""
+        ix = self.get_index()
+        analyzer = ix.schema["title"].analyzer
+        words = [token.text for token in analyzer(text)]
+        if not words:
+            return []
+
+        query = And([
+            Or([
+                clause
+                for field, boost in FIELD_BOOSTS.items()
+                for clause in (Term(field, word, boost=boost), Prefix(field, word, boost=boost / 2))
+            ])
+            for word in words
+        ])
+
+        with ix.searcher() as searcher:
+            return [self.parse_result(r) for r in searcher.search(query, limit=limit)]
+
+
+def search(text, limit=20):
+    return DiagramSearch().search(text, limit=limit)
+
+
+def index_diagram(name):
+    DiagramSearch().update_index_by_name(name)
+
+
+def unindex_diagram(name):
+    DiagramSearch().remove_document_from_index(name)
+
+
+def on_diagram_update(doc, method=None):
+    frappe.enqueue(
+        index_diagram, queue="short", name=doc.name, enqueue_after_commit=True, now=frappe.flags.in_test
+    )
+
+
+def on_diagram_trash(doc, method=None):
+    frappe.enqueue(
+        unindex_diagram, queue="short", name=doc.name, enqueue_after_commit=True, now=frappe.flags.in_test
+    )
+
+
+def rebuild_index():
+    """Rebuild the whole index, e.g. `bench --site <site> execute mermaid.search.rebuild_index`"""
+    DiagramSearch().build()
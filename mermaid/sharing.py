@@ -0,0 +1,122 @@
+"""Set-based sharing of Mermaid Diagrams.
+
+`frappe.share.add` saves one DocShare (with its own permission checks,
+comment and notification) per user, which times out for teams of thousands.
+`share_diagram` instead resolves the target users once (role members through
+`Has Role`), diffs them against the diagram's existing DocShare rows and
+inserts, updates or deletes the difference in batches of `BATCH_SIZE`, all in
+the request's transaction. One comment is added for the whole change and the
+diagram's cached document is cleared once at the end.
+"""
+import frappe
+from frappe.utils import cint, now
+
+SHARE_DOCTYPE = "Mermaid Diagram"
+BATCH_SIZE = 1000
+RIGHTS = ("read", "write", "share")
+
+
+def batches(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_role_users(roles):
+    """Enabled users holding any of `roles`"""
+    if not roles:
+        return set()
+
+    return set(frappe.db.sql(
+        """
+        SELECT DISTINCT has_role.parent
+        FROM `tabHas Role` has_role
+        INNER JOIN `tabUser` user ON user.name = has_role.parent
+        WHERE has_role.parenttype = 'User'
+            AND has_role.role IN %(roles)s
+            AND user.enabled = 1
+            AND user.name NOT IN ('Guest', 'Administrator')
+        """,
+        {"roles": tuple(roles)},
+        pluck=True,
+    ))
+
+
+def get_valid_users(users):
+    if not users:
+        return set()
+
+    valid = set()
+    for batch in batches(set(users)):
+        valid.update(frappe.get_all("User", filters={"name": ["in", batch], "enabled": 1}, pluck="name"))
+
+    unknown = set(users) - valid
+    if unknown:
+        frappe.throw(f"Cannot share with unknown or disabled users: {', '.join(sorted(unknown)[:10])}")
+    return valid
+
+
+def share_diagram(name, users=None, roles=None, rights=None, replace=False):
+    """Share diagram `name` with `users` and the members of `roles`
+
+    `rights` maps read/write/share to 0 or 1 (default read and write). New
+    shares get `rights`, with the rights not given set to 0; existing shares
+    of those users only have the given rights changed. With `replace`, shares
+    of everyone else are removed. Returns the number of added, updated and
+    removed shares.
+    """
+    rights = {right: cint(value) for right, value in (rights or {"read": 1, "write": 1}).items() if right in RIGHTS}
+    target = get_valid_users(users) | get_role_users(roles)
+    target.discard(frappe.db.get_value(SHARE_DOCTYPE, name, "owner"))
+
+    existing = {
+        row.user: row
+        for row in frappe.get_all(
+            "DocShare",
+            filters={"share_doctype": SHARE_DOCTYPE, "share_name": name, "everyone": 0},
+            fields=["name", "user", *RIGHTS],
+        )
+    }
+
+    added = sorted(target - set(existing))
+    updated = [
+        row.name
+        for user, row in existing.items()
+        if user in target and any(cint(row.get(right)) != value for right, value in rights.items())
+    ]
+    removed = [row.name for user, row in existing.items() if replace and user not in target]
+
+    timestamp = now()
+    session_user = frappe.session.user
+    for batch in batches(added):
+        frappe.db.bulk_insert(
+            "DocShare",
+            [
+                "name", "creation", "modified", "owner", "modified_by", "docstatus",
+                "share_doctype", "share_name", "user", *RIGHTS, "submit", "everyone", "notify_by_email",
+            ],
+            [
+                (
+                    frappe.generate_hash(length=10), timestamp, timestamp, session_user, session_user, 0,
+                    SHARE_DOCTYPE, name, user, *(rights.get(right, 0) for right in RIGHTS), 0, 0, 0,
+                )
+                for user in batch
+            ],
+        )
+
+    for batch in batches(updated):
+        frappe.db.set_value(
+            "DocShare", {"name": ["in", batch]}, {**rights, "modified": timestamp, "modified_by": session_user},
+            update_modified=False,
+        )
+
+    for batch in batches(removed):
+        frappe.db.delete("DocShare", {"name": ["in", batch]})
+
+    if added or removed:
+        frappe.get_doc(SHARE_DOCTYPE, name).add_comment(
+            "Shared", f"{session_user} updated sharing: {len(added)} users added, {len(removed)} removed"
+        )
+    frappe.clear_document_cache(SHARE_DOCTYPE, name)
+
+    return {"added": len(added), "updated": len(updated), "removed": len(removed)}
@@ -0,0 +1,89 @@
+"""Incrementally maintained statistics for Mermaid Diagrams.
+
+Counters live in `Mermaid Diagram Stat` rows named `<stat_type>:<stat_key>`:
+
+* `Total:all` - number of diagrams
+* `Type:<diagram type>` - number of diagrams per type
+* `Activity:<YYYY-MM-DD>` - diagrams created or edited that day, each counted
+  once per day however often it is autosaved
+
+They are updated in the same transaction as the diagram itself and reconciled
+against `tabMermaid Diagram` once a day, so reading them is O(1).
+"""
+import frappe
+from frappe.utils import add_days, getdate, now, nowdate
+
+STAT_DOCTYPE = "Mermaid Diagram Stat"
+ACTIVITY_RETENTION_DAYS = 90
+
+
+def increment(stat_type, stat_key, by=1):
+    timestamp = now()
+    frappe.db.sql(
+        """
+        INSERT INTO `tabMermaid Diagram Stat`
+            (name, stat_type, stat_key, count, creation, modified, owner, modified_by)
+        VALUES (%(name)s, %(stat_type)s, %(stat_key)s, %(by)s, %(now)s, %(now)s, 'Administrator', 'Administrator')
+        ON DUPLICATE KEY UPDATE count = count + %(by)s, modified = %(now)s
+        """,
+        {"name": f"{stat_type}:{stat_key}", "stat_type": stat_type, "stat_key": stat_key, "by": by, "now": timestamp},
+    )
+
+
+def on_diagram_update(doc, method=None):
+    before = doc.get_doc_before_save()
+
+    if not before:
+        increment("Total", "all")
+        increment("Type", doc.diagram_type)
+    elif before.diagram_type != doc.diagram_type:
+        increment("Type", before.diagram_type, -1)
+        increment("Type", doc.diagram_type)
+
+    # activity, not edits: a diagram counts once for the day it is first touched
+    if not before or getdate(before.modified) != getdate(doc.modified):
+        increment("Activity", str(getdate(doc.modified)))
+
+
+def on_diagram_trash(doc, method=None):
+    increment("Total", "all", -1)
+    increment("Type", doc.diagram_type, -1)
+
+
+def get_stats(days=30):
+    total = frappe.db.get_value(STAT_DOCTYPE, "Total:all", "count") or 0
+
+    by_type = frappe.get_all(
+        STAT_DOCTYPE,
+        filters={"stat_type": "Type", "count": [">", 0]},
+        fields=["stat_key as diagram_type", "count"],
+        order_by="count desc",
+    )
+
+    recent = frappe.get_all(
+        STAT_DOCTYPE,
+        filters={"stat_type": "Activity", "stat_key": [">=", str(add_days(nowdate(), -days))]},
+        fields=["stat_key as date", "count"],
+        order_by="stat_key desc",
+        limit=days,
+    )
+
+    return {"total": total, "by_type": by_type, "recent": recent}
+
+
+def reconcile():
+    """Recompute totals from the diagram table and drop old activity rows (runs daily)"""
+    frappe.db.delete(STAT_DOCTYPE, {"stat_type": ["in", ["Total", "Type"]]})
+
+    increment("Total", "all", frappe.db.count("Mermaid Diagram"))
+    for row in frappe.db.sql(
+        """SELECT diagram_type, COUNT(*) AS count FROM `tabMermaid Diagram` GROUP BY diagram_type""",
+        as_dict=True,
+    ):
+        increment("Type", row.diagram_type, row.count)
+
+    frappe.db.delete(
+        STAT_DOCTYPE,
+        {"stat_type": "Activity", "stat_key": ["<", str(add_days(nowdate(), -ACTIVITY_RETENTION_DAYS))]},
+    )
+    frappe.db.commit()
@@ -0,0 +1,58 @@
+"""Hashed asset names of the Vite-built Mermaid Studio frontend.
+
+The names only change when the frontend is rebuilt, so they are read from the
+Vite manifest once and then served from memory; the parsed result is also kept
+in redis so new workers don't have to read the manifest either. Deploys
+rebuild, migrate and restart: `after_migrate` clears the redis copy and the
+restart clears the in-process one. In developer mode the manifest is read on
+every request so `vite build --watch` output is picked up.
+"""
+import json
+import os
+
+import frappe
+
+ASSETS_CACHE_KEY = "mermaid_studio_assets"
+DIST_URL = "/assets/mermaid/frontend/dist/"
+
+_assets = None
+
+
+def get_studio_assets():
+    """`{"js_file": ..., "css_file": ...}` for the studio page"""
+    global _assets
+
+    if frappe.conf.developer_mode:
+        return load_studio_assets()
+
+    if _assets is None:
+        _assets = frappe.cache().get_value(ASSETS_CACHE_KEY, generator=load_studio_assets)
+
+    return _assets
+
+
+def load_studio_assets():
+    manifest_path = frappe.get_app_path("mermaid", "public", "frontend", "dist", ".vite", "manifest.json")
+    if not os.path.exists(manifest_path):
+        # not built yet; fall back to the last names known to be shipped
+        return {
+            "js_file": DIST_URL + "assets/index-CnysP75u.js",
+            "css_file": DIST_URL + "assets/index-Degvk0vN.css",
+        }
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    index_entry = manifest.get("index.html", {})
+    css_files = index_entry.get("css", [])
+    return {
+        "js_file": DIST_URL + index_entry.get("file", ""),
+        "css_file": DIST_URL + css_files[0] if css_files else None,
+    }
+
+
+def clear_studio_assets():
+    global _assets
+
+    _assets = None
+    frappe.cache().delete_value(ASSETS_CACHE_KEY)
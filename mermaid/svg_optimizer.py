@@ -0,0 +1,209 @@
+"""Size optimization for rendered SVGs.
+
+mermaid.js output is verbose: pretty-printing whitespace, long generated ids
+(`mermaid-1697040129517-flowchart-pointEnd`) referenced from markers, CSS and
+aria attributes, coordinates with a dozen decimals and repeated style rules.
+`optimize_svg` rewrites that text in place (no XML round-trip, which would
+mangle the XHTML inside `foreignObject` labels) and returns a report of what
+it saved and how long it took.
+
+Every step is conservative: whitespace is only removed where it is
+pretty-printing, ids are only renamed where every reference can be
+rewritten, and the new ids carry a per-document prefix so several SVGs
+inlined in the same page still can't clash.
+"""
+import hashlib
+import re
+import time
+
+DEFAULT_PRECISION = 2
+
+# bodies whose text must not be touched by the markup passes
+PROTECTED = re.compile(r"<(style|script|text|foreignObject)\b[^>]*>.*?</\1\s*>", re.S)
+COMMENT = re.compile(r"<!--.*?-->", re.S)
+PRETTY_WHITESPACE = re.compile(r">\s*\n\s*<")
+EDGE_WHITESPACE = re.compile(r"^\s*\n\s*|\s*\n\s*$")
+
+GEOMETRY_ATTRIBUTE = re.compile(
+    r'(\s(?:d|points|transform|viewBox|x|y|x1|y1|x2|y2|cx|cy|r|rx|ry|width|height|dx|dy)=")([^"]*)"'
+)
+NUMBER = re.compile(r"-?(?:\d+\.\d+|\.\d+)(?:[eE][-+]?\d+)?")
+
+STYLE_BLOCK = re.compile(r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.S)
+CSS_SPACE = re.compile(r"\s+")
+CSS_PUNCTUATION = re.compile(r"\s*([{};,])\s*")
+
+ID_ATTRIBUTE = re.compile(r'\sid="([^"]+)"')
+SIMPLE_ID = re.compile(r"^[A-Za-z_][\w-]*$")
+
+
+def optimize_svg(svg, precision=DEFAULT_PRECISION):
+    """Return `(optimized_svg, report)` for a rendered SVG"""
+    start = time.perf_counter()
+    original_size = len(svg.encode("utf-8"))
+
+    svg = strip_whitespace(svg)
+    svg = round_coordinates(svg, precision)
+    svg = dedupe_styles(svg)
+    svg, ids_shortened = shorten_ids(svg)
+
+    optimized_size = len(svg.encode("utf-8"))
+    report = {
+        "original_size": original_size,
+        "optimized_size": optimized_size,
+        "saved_percent": round(100 * (original_size - optimized_size) / original_size, 1) if original_size else 0,
+        "ids_shortened": ids_shortened,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    return svg, report
+
+
+def _outside_protected(svg, transform):
+    """Apply `transform` to the markup between protected elements"""
+    parts = []
+    last = 0
+    for match in PROTECTED.finditer(svg):
+        parts.append(transform(svg[last : match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(transform(svg[last:]))
+    return "".join(parts)
+
+
+def strip_whitespace(svg):
+    """Drop comments and the indentation between tags"""
+
+    def strip(markup):
+        markup = PRETTY_WHITESPACE.sub("><", COMMENT.sub("", markup))
+        # segments start right after and end right before a tag
+        return EDGE_WHITESPACE.sub("", markup)
+
+    return _outside_protected(svg.strip(), strip)
+
+
+def format_number(value, precision):
+    text = f"{round(float(value), precision):.{precision}f}".rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        return "0"
+    if text.startswith("0."):
+        return text[1:]
+    if text.startswith("-0."):
+        return "-" + text[2:]
+    return text
+
+
+def round_coordinates(svg, precision=DEFAULT_PRECISION):
+    """Round the decimals in geometry attributes to `precision` places"""
+
+    def round_attribute(match):
+        value = NUMBER.sub(lambda number: format_number(number.group(0), precision), match.group(2))
+        return f'{match.group(1)}{value}"'
+
+    return _outside_protected(svg, lambda markup: GEOMETRY_ATTRIBUTE.sub(round_attribute, markup))
+
+
+def minify_css(css):
+    css = CSS_PUNCTUATION.sub(r"\1", CSS_SPACE.sub(" ", css)).strip()
+    css = css.replace(": ", ":")
+    return css.replace(";}", "}")
+
+
+def dedupe_css_rules(css):
+    """Drop rules repeated verbatim later in the sheet
+
+    The last copy is the one that wins the cascade, so it is the one kept.
+    Sheets with at-rules are left alone since their rules nest.
+    """
+    if "@" in css:
+        return css
+
+    rules = [rule + "}" for rule in css.split("}") if rule.strip()]
+    seen = set()
+    kept = []
+    for rule in reversed(rules):
+        if rule not in seen:
+            seen.add(rule)
+            kept.append(rule)
+    return "".join(reversed(kept))
+
+
+def dedupe_styles(svg):
+    """Minify style blocks, drop repeated rules and blocks identical to an earlier one"""
+    seen = set()
+
+    def replace(match):
+        css = dedupe_css_rules(minify_css(match.group(2)))
+        if css in seen:
+            return ""
+        seen.add(css)
+        return f"{match.group(1)}{css}{match.group(3)}"
+
+    return STYLE_BLOCK.sub(replace, svg)
+
+
+def _short_id_names(prefix, taken):
+    n = 0
+    while True:
+        name = f"{prefix}{_base36(n)}"
+        n += 1
+        if name not in taken:
+            yield name
+
+
+def _base36(n):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+    while True:
+        n, remainder = divmod(n, 36)
+        text = digits[remainder] + text
+        if not n:
+            return text
+
+
+def shorten_ids(svg):
+    """Rename long ids and rewrite their references; returns `(svg, count)`
+
+    References are `url(#id)`, `href`/`xlink:href="#id"`, aria id lists and
+    `#id` selectors in style blocks. SVGs with scripts could reference ids in
+    ways that can't be found, so they are left alone.
+    """
+    if "<script" in svg:
+        return svg, 0
+
+    ids = ID_ATTRIBUTE.findall(svg)
+    if len(ids) != len(set(ids)):
+        # duplicate ids already resolve ambiguously; don't make it worse
+        return svg, 0
+
+    prefix = "m" + hashlib.sha1(svg.encode("utf-8")).hexdigest()[:5] + "-"
+    names = _short_id_names(prefix, set(ids))
+    mapping = {}
+    for old in ids:
+        if not SIMPLE_ID.match(old):
+            continue
+        new = next(names)
+        if len(new) < len(old):
+            mapping[old] = new
+
+    if not mapping:
+        return svg, 0
+
+    def rename(match):
+        return mapping.get(match.group(1), match.group(1))
+
+    svg = re.sub(r'(?<=\sid=")([^"]+)(?=")', rename, svg)
+    svg = re.sub(r"(?<=url\(#)([\w-]+)(?=\))", rename, svg)
+    svg = re.sub(r'(?<=href="#)([\w-]+)(?=")', rename, svg)
+    svg = re.sub(
+        r'(\saria-(?:labelledby|describedby)=")([^"]*)"',
+        lambda match: match.group(1) + " ".join(mapping.get(i, i) for i in match.group(2).split()) + '"',
+        svg,
+    )
+
+    def rename_selectors(match):
+        # only selectors (text before a `{`), so colours like `#fff` are never touched
+        css = re.sub(r"[^{}]+(?=\{)", lambda s: re.sub(r"(?<=#)([A-Za-z_][\w-]*)", rename, s.group(0)), match.group(2))
+        return match.group(1) + css + match.group(3)
+
+    svg = STYLE_BLOCK.sub(rename_selectors, svg)
+    return svg, len(mapping)
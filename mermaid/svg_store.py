@@ -0,0 +1,86 @@
+"""Compressed, content-addressed storage for rendered SVGs.
+
+SVGs live under the site's private files as gzip blobs named after the
+sha256 of their content; diagrams only keep that hash in `svg_hash`. Identical
+SVGs are stored once, and loading a diagram no longer drags its SVG along.
+SVGs are run through `mermaid.svg_optimizer` before they are hashed.
+"""
+import gzip
+import hashlib
+import os
+import time
+
+import frappe
+
+from mermaid.svg_optimizer import optimize_svg as _optimize_svg
+
+
+def get_svg_hash(svg):
+    return hashlib.sha256(svg.encode("utf-8")).hexdigest()
+
+
+def get_store_dir():
+    return frappe.get_site_path("private", "mermaid_svg")
+
+
+def get_blob_path(svg_hash):
+    return os.path.join(get_store_dir(), svg_hash[:2], f"{svg_hash}.svg.gz")
+
+
+def save_svg(svg, optimize=True):
+    """Store `svg`, optimized unless told otherwise, and return its hash"""
+    if optimize:
+        svg = optimize_svg(svg)
+
+    svg_hash = get_svg_hash(svg)
+    path = get_blob_path(svg_hash)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(gzip.compress(svg.encode("utf-8"), mtime=0))
+        os.replace(tmp_path, path)
+
+    return svg_hash
+
+
+def optimize_svg(svg):
+    """Optimized `svg`; the size/latency report goes to the mermaid log"""
+    svg, report = _optimize_svg(svg)
+    frappe.logger("mermaid").debug({"event": "svg_optimized", **report})
+    return svg
+
+
+def load_svg_bytes(svg_hash):
+    """Compressed blob for `svg_hash`, or None if it is not stored"""
+    if not svg_hash:
+        return None
+
+    try:
+        with open(get_blob_path(svg_hash), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def load_svg(svg_hash):
+    blob = load_svg_bytes(svg_hash)
+    return gzip.decompress(blob).decode("utf-8") if blob else None
+
+
+def prune_unreferenced():
+    """Delete blobs no diagram points to any more (scheduled weekly)"""
+    referenced = set(frappe.get_all("Mermaid Diagram", filters={"svg_hash": ["is", "set"]}, pluck="svg_hash"))
+    # blobs written in the last day may belong to a save that hasn't committed yet
+    cutoff = time.time() - 24 * 60 * 60
+
+    for root, _dirs, files in os.walk(get_store_dir()):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if (
+                filename.endswith(".svg.gz")
+                and filename[: -len(".svg.gz")] not in referenced
+                and os.path.getmtime(path) < cutoff
+            ):
+                os.remove(path)
@@ -0,0 +1,119 @@
+"""Small raster previews for list and gallery views.
+
+Thumbnails are rasterized from the stored SVG and named after its
+`svg_hash`, so a thumbnail never goes stale: changed content gets a new SVG, a
+new hash and therefore a new thumbnail, and the old one is simply no longer
+asked for. They are generated by the render job right after a new SVG is
+stored, and lazily on first request for anything rendered before that.
+
+Because the URL carries the hash, responses can be cached for a year.
+"""
+import os
+import time
+from urllib.parse import quote
+
+import frappe
+from werkzeug.exceptions import NotFound
+from werkzeug.wrappers import Response
+
+from mermaid.renderer import RenderError, rasterize_svg
+
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_HEIGHT = 200
+FORMATS = {"png": "image/png", "webp": "image/webp"}
+
+
+def get_thumbnail_format():
+    fmt = frappe.conf.get("mermaid_thumbnail_format") or "webp"
+    return fmt if fmt in FORMATS else "png"
+
+
+def get_thumbnail_path(svg_hash, fmt=None):
+    fmt = fmt or get_thumbnail_format()
+    return frappe.get_site_path(
+        "private",
+        "mermaid_thumbnails",
+        svg_hash[:2],
+        f"{svg_hash}-{THUMBNAIL_WIDTH}x{THUMBNAIL_HEIGHT}.{fmt}",
+    )
+
+
+def get_thumbnail_url(name, svg_hash):
+    """URL of the diagram's thumbnail; changes whenever the SVG does"""
+    if not svg_hash:
+        return None
+    return f"/api/method/mermaid.thumbnails.get_thumbnail?name={quote(name)}&v={svg_hash}"
+
+
+def generate_thumbnail(svg_hash, svg=None):
+    """Rasterize the SVG stored under `svg_hash` unless its thumbnail exists; returns the path"""
+    from mermaid.svg_store import load_svg
+
+    fmt = get_thumbnail_format()
+    path = get_thumbnail_path(svg_hash, fmt)
+    if os.path.exists(path):
+        return path
+
+    svg = svg or load_svg(svg_hash)
+    if not svg:
+        return None
+
+    image = rasterize_svg(svg, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT, format=fmt)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image)
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def add_thumbnail_urls(diagrams):
+    """Set `thumbnail_url` on list rows that carry `name` and `svg_hash`"""
+    for diagram in diagrams:
+        diagram["thumbnail_url"] = get_thumbnail_url(diagram["name"], diagram.get("svg_hash"))
+    return diagrams
+
+
+@frappe.whitelist(methods=["GET"])
+def get_thumbnail(name, v=None):
+    """Serve the diagram's thumbnail; `v` is the svg_hash the URL was built for"""
+    frappe.has_permission("Mermaid Diagram", "read", name, throw=True)
+
+    svg_hash = frappe.db.get_value("Mermaid Diagram", name, "svg_hash")
+    if not svg_hash:
+        raise NotFound
+
+    try:
+        path = generate_thumbnail(svg_hash)
+    except RenderError:
+        frappe.log_error(title=f"Mermaid thumbnail failed for {name}")
+        path = None
+
+    if not path:
+        raise NotFound
+
+    with open(path, "rb") as f:
+        image = f.read()
+
+    response = Response(image, mimetype=FORMATS[get_thumbnail_format()])
+    response.headers["ETag"] = f'"{svg_hash}"'
+    # only URLs that name the current hash are immutable; anything else may change
+    if v == svg_hash:
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def prune_unreferenced():
+    """Delete thumbnails of SVGs no diagram points to any more (scheduled weekly)"""
+    referenced = set(frappe.get_all("Mermaid Diagram", filters={"svg_hash": ["is", "set"]}, pluck="svg_hash"))
+    cutoff = time.time() - 24 * 60 * 60
+
+    for root, _dirs, files in os.walk(frappe.get_site_path("private", "mermaid_thumbnails")):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if filename.split("-", 1)[0] not in referenced and os.path.getmtime(path) < cutoff:
+                os.remove(path)
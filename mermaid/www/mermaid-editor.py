@@ -1,6 +1,8 @@
 import frappe
 from frappe import _
 
+from mermaid.collab import read_state
+
 no_cache = 1
 
 def get_context(context):
@@ -26,10 +28,13 @@ def get_context(context):
         # Check permissions
         doc.check_permission("read")
         
+        # serve the draft, which may have edits not saved to the diagram yet
+        draft = read_state(doc.name) or {}
+        
         context.title = doc.title
         context.diagram_data = {
             "name": doc.name,
-            "content": doc.mermaid_content,
+            "content": draft.get("content", doc.mermaid_content),
             "title": doc.title
         }
         
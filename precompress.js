@@ -0,0 +1,152 @@
+// Precompress the built Mermaid assets.
+//
+// Runs after `npm run build` (the `postbuild` script). For every compressible
+// build output with a content-hashed name in mermaid/public (the top-level
+// chunks and the Vite output in frontend/dist/assets) it writes `.br` and
+// `.gz` siblings at maximum compression, so nginx can serve them with
+// brotli_static / gzip_static instead of compressing on every request (see
+// nginx/mermaid-assets.conf).
+//
+// Files that keep their name across releases (mermaid-loader.js and the other
+// sources under public/js, the studio's index.html) are left to nginx's
+// on-the-fly gzip: they change with a `git pull` that isn't followed by a
+// build, and a sibling written by an earlier build would then be served in
+// their place.
+//
+// It also writes mermaid/public/precompressed.json with, per file, the
+// original and compressed sizes and a subresource integrity hash.
+//
+// Siblings newer than their source are kept, so rebuilding only compresses
+// what changed. Siblings whose source is gone or no longer precompressed are
+// deleted on every run.
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const PUBLIC_DIR = path.join(__dirname, 'mermaid', 'public');
+const MANIFEST_PATH = path.join(PUBLIC_DIR, 'precompressed.json');
+const SKIP_DIRS = new Set(['node_modules', 'src']);
+const COMPRESSIBLE = new Set(['.js', '.mjs', '.css', '.html', '.json', '.svg', '.ttf', '.map']);
+// compressing tiny files saves less than the extra request headers cost
+const MIN_SIZE = 1024;
+
+function* walk(dir) {
+    for (const entry of fs.readdirSync(dir, { withFileTypes: true })) {
+        const file_path = path.join(dir, entry.name);
+        if (entry.isDirectory()) {
+            if (!SKIP_DIRS.has(entry.name)) yield* walk(file_path);
+        } else if (entry.isFile()) {
+            yield file_path;
+        }
+    }
+}
+
+function is_hashed(relative_path) {
+    // Parcel-style chunks at the top level (name.0123abcd.js) and everything
+    // Vite writes to frontend/dist/assets (name-AbCd12_-.js)
+    return /^[^/]+\.[0-9a-f]{8}\.\w+$/.test(relative_path)
+        || relative_path.startsWith('frontend/dist/assets/');
+}
+
+function is_fresh(sibling, source_stat) {
+    try {
+        return fs.statSync(sibling).mtimeMs >= source_stat.mtimeMs;
+    } catch (error) {
+        return false;
+    }
+}
+
+function compress(file_path, source_stat, content) {
+    const variants = {
+        br: () => zlib.brotliCompressSync(content, {
+            params: {
+                [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+                [zlib.constants.BROTLI_PARAM_SIZE_HINT]: content.length
+            }
+        }),
+        gz: () => zlib.gzipSync(content, { level: zlib.constants.Z_BEST_COMPRESSION })
+    };
+
+    const sizes = {};
+    for (const [extension, encode] of Object.entries(variants)) {
+        const sibling = `${file_path}.${extension}`;
+        if (!is_fresh(sibling, source_stat)) {
+            const encoded = encode();
+            if (encoded.length >= content.length) {
+                // incompressible: let the server send the original
+                fs.rmSync(sibling, { force: true });
+                continue;
+            }
+            fs.writeFileSync(sibling, encoded);
+        }
+        sizes[extension] = fs.statSync(sibling).size;
+    }
+    return sizes;
+}
+
+function should_compress(file_path) {
+    const relative_path = path.relative(PUBLIC_DIR, file_path).split(path.sep).join('/');
+    if (file_path === MANIFEST_PATH || !COMPRESSIBLE.has(path.extname(file_path))) return false;
+    if (!is_hashed(relative_path)) return false;
+
+    try {
+        return fs.statSync(file_path).size >= MIN_SIZE;
+    } catch (error) {
+        return false;
+    }
+}
+
+function remove_orphans(file_paths) {
+    // siblings of deleted chunks, or of files that are no longer precompressed
+    let removed = 0;
+    for (const file_path of file_paths) {
+        const extension = path.extname(file_path);
+        if (extension !== '.br' && extension !== '.gz') continue;
+
+        const source = file_path.slice(0, -extension.length);
+        if (!should_compress(source)) {
+            fs.rmSync(file_path, { force: true });
+            removed += 1;
+        }
+    }
+    return removed;
+}
+
+function main() {
+    const files = {};
+    let original_total = 0;
+    let compressed_total = 0;
+
+    const file_paths = Array.from(walk(PUBLIC_DIR));
+    const removed = remove_orphans(file_paths);
+
+    for (const file_path of file_paths) {
+        if (!should_compress(file_path)) continue;
+
+        const relative_path = path.relative(PUBLIC_DIR, file_path).split(path.sep).join('/');
+        const source_stat = fs.statSync(file_path);
+
+        const content = fs.readFileSync(file_path);
+        const sizes = compress(file_path, source_stat, content);
+        files[relative_path] = {
+            size: content.length,
+            br: sizes.br || null,
+            gz: sizes.gz || null,
+            integrity: 'sha384-' + crypto.createHash('sha384').update(content).digest('base64')
+        };
+
+        original_total += content.length;
+        compressed_total += sizes.br || sizes.gz || content.length;
+    }
+
+    const sorted = Object.fromEntries(Object.keys(files).sort().map(name => [name, files[name]]));
+    fs.writeFileSync(MANIFEST_PATH, JSON.stringify({ files: sorted }, null, 2) + '\n');
+
+    const count = Object.keys(files).length;
+    const saved = original_total ? Math.round((1 - compressed_total / original_total) * 100) : 0;
+    console.log(`Precompressed ${count} assets: ${original_total} -> ${compressed_total} bytes compressed (${saved}% smaller)`);
+    if (removed) console.log(`Removed ${removed} stale precompressed files`);
+}
+
+main();
@@ -0,0 +1,66 @@
+// Copy Mermaid's ESM build into the app's public assets.
+//
+// Runs after `npm install` (the `postinstall` script, which `bench setup
+// requirements` and `bench get-app` trigger as well). mermaid-loader.js
+// imports Mermaid from /assets/mermaid/js/vendor/mermaid/, so pages work
+// behind a strict Content-Security-Policy and without internet access, and
+// the version is the one pinned in the lockfiles rather than whatever a CDN
+// serves for `mermaid@10`.
+//
+// The minified ESM entry point is copied with every file it imports,
+// statically or on demand (each diagram type is a chunk loaded when a diagram
+// of that type is rendered). Imports are followed rather than a directory
+// copied, because the dist layout differs between Mermaid versions: 10.x keeps
+// the chunks next to the entry point, 11.x under chunks/.
+const fs = require('fs');
+const path = require('path');
+
+const TARGET_DIR = path.join(__dirname, 'mermaid', 'public', 'js', 'vendor', 'mermaid');
+const ENTRY = 'mermaid.esm.min.mjs';
+// `from"./x.mjs"`, `import"./x.mjs"` and `import("./x.mjs")`
+const RELATIVE_IMPORT_RE = /(?:\bfrom|\bimport)\s*\(?\s*["'](\.\.?\/[^"']+)["']/g;
+
+function collect(dist_dir, entry) {
+    // every file reachable from `entry`, as paths relative to `dist_dir`
+    const seen = new Set();
+    const queue = [entry];
+    while (queue.length) {
+        const relative_path = queue.pop();
+        if (seen.has(relative_path)) continue;
+        if (!fs.existsSync(path.join(dist_dir, relative_path))) {
+            // the pattern matched inside a string rather than an import
+            console.warn(`Skipping ${relative_path}: not in mermaid/dist`);
+            continue;
+        }
+        seen.add(relative_path);
+
+        const source = fs.readFileSync(path.join(dist_dir, relative_path), 'utf8');
+        for (const match of source.matchAll(RELATIVE_IMPORT_RE)) {
+            const imported = path.normalize(path.join(path.dirname(relative_path), match[1]));
+            if (imported.startsWith('..')) {
+                throw new Error(`${relative_path} imports ${match[1]} from outside mermaid/dist`);
+            }
+            queue.push(imported);
+        }
+    }
+    return seen;
+}
+
+function main() {
+    const package_path = require.resolve('mermaid/package.json');
+    const { version } = JSON.parse(fs.readFileSync(package_path, 'utf8'));
+    const dist_dir = path.join(path.dirname(package_path), 'dist');
+    const files = collect(dist_dir, ENTRY);
+
+    fs.rmSync(TARGET_DIR, { recursive: true, force: true });
+    for (const relative_path of files) {
+        const target = path.join(TARGET_DIR, relative_path);
+        fs.mkdirSync(path.dirname(target), { recursive: true });
+        fs.copyFileSync(path.join(dist_dir, relative_path), target);
+    }
+    fs.writeFileSync(path.join(TARGET_DIR, 'VERSION'), version + '\n');
+
+    console.log(`Copied Mermaid ${version} (${files.size} files) to ${path.relative(__dirname, TARGET_DIR)}`);
+}
+
+main();